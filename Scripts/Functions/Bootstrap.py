@@ -0,0 +1,544 @@
+import os
+import json
+from datetime import timedelta
+from multiprocessing import Pool
+import numpy as np
+
+from CT_Store import read_CT_store
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Bootstrap.py contains the functions to bootstrap scores computed from totals of daily values (e.g. the
+# daily probabilistic contingency tables) over a verification period. A bootstrapped replicate draws, with
+# replacement, as many days as the ones in the period. Instead of drawing the days one replicate at a time,
+# all replicates are drawn at once as a multinomial count matrix with dimensions (NumRep, NumDays), which
+# contains how many times each day is drawn in each replicate. The bootstrapped totals are then computed
+# for all replicates with one matrix product between the count matrix and the daily values, and the score
+# is computed for all replicates in one array operation. The replicates are processed in chunks, so that
+# the count matrix and the bootstrapped totals do not exceed a given memory budget.
+# The count matrix over the days of a verification period can be generated once from a seeded
+# numpy.random.SeedSequence and saved on disk as a resampling plan, i.e. a memory-mapped uint16 array with
+# dimensions (RepetitionsBS, NumDays) and a small .json metadata sidecar. The stages that use the same plan
+# draw the same days in each replicate, so their bootstrapped values are reproducible and paired (e.g. the
+# bootstrapped differences between two forecasting systems come from the difference of their replicates).
+# The bootstrap can run over a pool of local processes (see run_bootstrap_tasks), split by partitions of the
+# stores of daily scores or by blocks of replicates. Each block of replicates is drawn from its own child of
+# the seed sequence, and the inputs are memory-mapped read-only, so the results are bit-identical to those
+# of a serial run with the same seed.
+##########################################################################################################
+
+
+# Number of replicates in the plan drawn from each child of the seed sequence
+NumRep_Block_Plan = 1000
+
+
+# Multinomial counts of the days drawn in the bootstrapped replicates
+# Note: each row contains how many times each of the NumDays days is drawn in a replicate. It is equivalent to drawing, with
+# replacement, NumDays days from the verification period (e.g. with random.choices).
+def bootstrap_day_counts(NumDays, NumRep, rng):
+
+      if NumDays == 0:
+            return np.zeros((NumRep, 0), dtype=np.int64)
+
+      return rng.multinomial(NumDays, np.full(NumDays, 1 / NumDays), size=NumRep)
+
+
+# Number of replicates in each chunk, so that the count matrix and the bootstrapped totals do not exceed MemoryBS_MB megabytes
+def bootstrap_chunk_size(NumDays, NumValues, MemoryBS_MB):
+
+      return max(1, int(MemoryBS_MB * 2**20 // (8 * (NumDays + NumValues))))
+
+
+# Blocks of replicates, each drawn from its own child of the seed sequence SeedSeq
+# Note: the function returns a list of (ind_Rep, NumRep, SeedSeq_Block) for each block of NumRep_Block_Plan replicates. The 
+# children of a seed sequence are statistically independent streams, so the blocks can be drawn in any order and process.
+def bootstrap_blocks(SeedSeq, RepetitionsBS):
+
+      SeedSeq_list = SeedSeq.spawn(-(-RepetitionsBS // NumRep_Block_Plan))
+
+      return [(ind_Block * NumRep_Block_Plan, min(NumRep_Block_Plan, RepetitionsBS - ind_Block * NumRep_Block_Plan), SeedSeq_list[ind_Block]) for ind_Block in range(len(SeedSeq_list))]
+
+
+# Name of the files containing a resampling plan and its metadata
+def bootstrap_plan_filename(DirPlan, DateS, DateF, RepetitionsBS, SeedBS):
+
+      FileName = "Plan_BS_" + DateS.strftime("%Y%m%d%H") + "_" + DateF.strftime("%Y%m%d%H") + "_Rep" + str(RepetitionsBS) + "_Seed" + str(SeedBS)
+
+      return DirPlan + "/" + FileName + ".npy", DirPlan + "/" + FileName + ".json"
+
+
+# Creation of the resampling plan for the days between DateS and DateF
+# Note: each block of NumRep_Block_Plan replicates is drawn from its own child of the seed sequence, so the plan depends only
+# on the seed (and not on the process creating it). If different processes create the same plan at the same time, they write
+# the same values, and the files are moved to their final names atomically.
+def create_bootstrap_plan(DirPlan, DateS, DateF, RepetitionsBS, SeedBS):
+
+      FilePlan, FileMeta = bootstrap_plan_filename(DirPlan, DateS, DateF, RepetitionsBS, SeedBS)
+      if not os.path.exists(DirPlan):
+            os.makedirs(DirPlan, exist_ok=True)
+
+      # Drawing the replicates, block by block
+      NumDays = (DateF - DateS).days + 1
+      pid = "." + str(os.getpid()) + ".tmp"
+      plan = np.lib.format.open_memmap(FilePlan + pid, mode="w+", dtype=np.uint16, shape=(RepetitionsBS, NumDays))
+      for ind_Rep, NumRep, SeedSeq_Block in bootstrap_blocks(np.random.SeedSequence(SeedBS), RepetitionsBS):
+            plan[ind_Rep:ind_Rep+NumRep] = bootstrap_day_counts(NumDays, NumRep, np.random.default_rng(SeedSeq_Block))
+      plan.flush()
+      del plan
+
+      # Saving the metadata
+      # Note: the metadata is moved last, so a plan whose metadata exists is always complete.
+      meta = {
+            "BaseDateTime": [(DateS + timedelta(days=ind)).strftime("%Y%m%d%H") for ind in range(NumDays)],
+            "RepetitionsBS": int(RepetitionsBS),
+            "SeedBS": int(SeedBS),
+            "NumRep_Block_Plan": NumRep_Block_Plan
+            }
+      with open(FileMeta + pid, "w") as f:
+            json.dump(meta, f)
+      os.replace(FilePlan + pid, FilePlan)
+      os.replace(FileMeta + pid, FileMeta)
+
+
+# Reading the resampling plan for the days between DateS and DateF (as a read-only memory-mapped array), creating it if it does not exist
+def open_bootstrap_plan(DirPlan, DateS, DateF, RepetitionsBS, SeedBS):
+
+      FilePlan, FileMeta = bootstrap_plan_filename(DirPlan, DateS, DateF, RepetitionsBS, SeedBS)
+      if not os.path.isfile(FileMeta):
+            create_bootstrap_plan(DirPlan, DateS, DateF, RepetitionsBS, SeedBS)
+
+      with open(FileMeta) as f:
+            meta = json.load(f)
+      plan = np.load(FilePlan, mmap_mode="r")
+
+      return plan, meta
+
+
+# Score computed for the original and the bootstrapped totals of daily values, one chunk of replicates at a time
+# Note: values_days contains the daily values, with dimensions (NumDays, ...), and stat_func the function that computes the score
+# from the totals, with dimensions (NumRep, ...), for all replicates at once. The function yields the scores, with dimensions 
+# (NumRep, ...), first for the original totals (i.e. all days drawn once, NumRep=1) and then for each chunk of replicates. If a 
+# resampling plan is provided, the replicates are read from it (the daily values must then cover all the days in the plan, with 
+# the missing days set to zero). Otherwise, they are drawn with rng. If NumRep_Batch is not None, the chunks contain at most 
+# NumRep_Batch replicates.
+def bootstrap_chunks(values_days, RepetitionsBS, stat_func, rng=None, MemoryBS_MB=256, plan=None, NumRep_Batch=None):
+
+      if rng is None:
+            rng = np.random.default_rng()
+
+      values_days = np.asarray(values_days, dtype=float)
+      NumDays = values_days.shape[0]
+      values_days_flat = values_days.reshape(NumDays, -1)
+      if plan is not None and (plan.shape[0] < RepetitionsBS or plan.shape[1] != NumDays):
+            raise ValueError("The resampling plan, with " + str(plan.shape[0]) + " replicates over " + str(plan.shape[1]) + " days, does not match the " + str(RepetitionsBS) + " replicates over " + str(NumDays) + " days requested.")
+
+      # Computing the score for the original totals
+      yield stat_func(np.sum(values_days, axis=0)[np.newaxis])
+
+      # Computing the score for the bootstrapped totals, in chunks of replicates
+      NumRep_chunk = bootstrap_chunk_size(NumDays, values_days_flat.shape[1], MemoryBS_MB)
+      if NumRep_Batch is not None:
+            NumRep_chunk = min(NumRep_chunk, NumRep_Batch)
+      for ind_Rep in range(0, RepetitionsBS, NumRep_chunk):
+            NumRep = min(NumRep_chunk, RepetitionsBS - ind_Rep)
+            if plan is None:
+                  counts = bootstrap_day_counts(NumDays, NumRep, rng)
+            else:
+                  counts = np.asarray(plan[ind_Rep:ind_Rep+NumRep], dtype=float)
+            totals = (counts @ values_days_flat).reshape((counts.shape[0],) + values_days.shape[1:])
+            yield stat_func(totals)
+
+
+# Score computed for the original and the bootstrapped totals of daily values
+# Note: the function returns the scores, with dimensions (RepetitionsBS+1, ...), where the first element corresponds to the 
+# original totals (see bootstrap_chunks).
+def bootstrap_apply(values_days, RepetitionsBS, stat_func, rng=None, MemoryBS_MB=256, plan=None):
+
+      return np.concatenate(list(bootstrap_chunks(values_days, RepetitionsBS, stat_func, rng, MemoryBS_MB, plan)), axis=0)
+
+
+# Percentiles defining the lower and upper bounds of the confidence intervals for the confidence levels in CL_list (in percent)
+def bootstrap_CI_percentiles(CL_list):
+
+      Perc_CI = []
+      for CL in CL_list:
+            alpha = 100 - CL # significance level (in %)
+            Perc_CI = Perc_CI + [alpha/2, 100 - (alpha/2)]
+
+      return Perc_CI
+
+
+# Sketch of the bootstrapped scores needed to compute the percentiles in Perc_CI
+# Note: the percentiles of RepetitionsBS replicates only depend on the few smallest values (for the lower bounds of the confidence 
+# intervals) and on the few largest values (for the upper bounds). The sketch keeps, for each element of the score, the count of 
+# the non-NaN replicates, and the Num_Tail smallest and largest values seen so far (the largest ones are stored with opposite 
+# sign, so that both tails are kept in the same way). The tails also contain the values around the percentiles needed to estimate
+# their Monte-Carlo error (see CI_sketch_MC_error). The sketch is updated one chunk of replicates at a time (see update_CI_sketch),
+# and its percentiles are exactly the ones computed by np.nanpercentile over all the replicates (see CI_sketch_percentiles).
+def CI_sketch(Perc_CI, RepetitionsBS):
+
+      q = np.asarray(Perc_CI, dtype=float) / 100
+      Num_Tail = [2, 2]
+      for q_temp in q:
+            Upper = int(q_temp > 0.5)
+            q_tail = (1 - q_temp) if Upper else q_temp
+            Num_Tail[Upper] = max(Num_Tail[Upper], int(np.floor((RepetitionsBS - 1) * q_tail) + np.ceil(np.sqrt(RepetitionsBS * q_temp * (1 - q_temp)))) + 3)
+
+      return {"Perc": q, "Num_Tail": [max(1, min(RepetitionsBS, Num)) for Num in Num_Tail], "NumValid": None, "Tail": [None, None]}
+
+
+# Updating the sketch with a chunk of bootstrapped scores, with dimensions (NumRep, ...)
+def update_CI_sketch(sketch, stat_chunk):
+
+      stat_chunk = np.asarray(stat_chunk, dtype=float)
+      Valid = ~np.isnan(stat_chunk)
+      if sketch["NumValid"] is None:
+            sketch["NumValid"] = np.zeros(stat_chunk.shape[1:], dtype=np.int64)
+            sketch["Tail"] = [np.empty((0,) + stat_chunk.shape[1:]), np.empty((0,) + stat_chunk.shape[1:])]
+      sketch["NumValid"] += np.sum(Valid, axis=0)
+
+      # Keeping the smallest values of the lower tail and of the (sign-inverted) upper tail
+      # Note: the NaN values are replaced by +inf, so that they are never kept before the valid values.
+      for ind_Tail, sign in enumerate([1, -1]):
+            tail = np.concatenate((sketch["Tail"][ind_Tail], np.where(Valid, sign * stat_chunk, np.inf)), axis=0)
+            Num_Tail = sketch["Num_Tail"][ind_Tail]
+            if tail.shape[0] > Num_Tail:
+                  tail = np.partition(tail, Num_Tail - 1, axis=0)[:Num_Tail]
+            sketch["Tail"][ind_Tail] = tail
+
+
+# Values in the positions ind_sorted (with dimensions (...)) of the sorted non-NaN replicates, read from the lower (Upper=False) or the upper (Upper=True) tail of the sketch
+def CI_sketch_order_statistics(sketch, ind_sorted, Upper):
+
+      if not Upper:
+            tail = np.sort(sketch["Tail"][0], axis=0)
+            ind_tail = ind_sorted
+      else:
+            tail = -np.sort(sketch["Tail"][1], axis=0)
+            ind_tail = sketch["NumValid"] - 1 - ind_sorted
+
+      return np.take_along_axis(tail, np.clip(ind_tail, 0, tail.shape[0] - 1)[np.newaxis], axis=0)[0]
+
+
+# Percentiles of the bootstrapped scores from the sketch, with dimensions (NumPerc, ...)
+# Note: the percentiles are computed with the same linear interpolation as np.nanpercentile, from the positions of the values in 
+# the sorted replicates. The positions in the lower half are read from the lower tail, and the ones in the upper half from the 
+# upper tail. The percentiles are NaN if all the replicates are NaN.
+def CI_sketch_percentiles(sketch):
+
+      NumValid = sketch["NumValid"]
+      perc = np.empty((len(sketch["Perc"]),) + NumValid.shape)
+      for ind_Perc, q in enumerate(sketch["Perc"]):
+
+            # Computing the positions, in the sorted replicates, of the values needed by the percentile
+            ind_virtual = (NumValid - 1) * q
+            ind_prev = np.clip(np.floor(ind_virtual), 0, np.maximum(NumValid - 1, 0)).astype(np.int64)
+            ind_next = np.clip(ind_prev + 1, 0, np.maximum(NumValid - 1, 0))
+            gamma = ind_virtual - np.floor(ind_virtual)
+
+            # Interpolating linearly between the values in those positions
+            values_prev = CI_sketch_order_statistics(sketch, ind_prev, q > 0.5)
+            values_next = CI_sketch_order_statistics(sketch, ind_next, q > 0.5)
+            with np.errstate(invalid="ignore"):
+                  diff = values_next - values_prev
+                  perc[ind_Perc] = np.where(gamma >= 0.5, values_next - diff * (1 - gamma), values_prev + diff * gamma)
+            perc[ind_Perc][NumValid == 0] = np.nan
+
+      return perc
+
+
+# Monte-Carlo error of the percentiles of the bootstrapped scores from the sketch, with dimensions (NumPerc, ...)
+# Note: the number of replicates below the q-th percentile is binomial, with mean NumValid*q and standard deviation
+# sqrt(NumValid*q*(1-q)). The Monte-Carlo error (i.e. the standard error of the percentile due to the finite number of replicates)
+# is estimated as half the distance between the values in the positions one standard deviation below and above NumValid*q.
+def CI_sketch_MC_error(sketch):
+
+      NumValid = sketch["NumValid"]
+      MC_error = np.empty((len(sketch["Perc"]),) + NumValid.shape)
+      for ind_Perc, q in enumerate(sketch["Perc"]):
+            std = np.sqrt(NumValid * q * (1 - q))
+            ind_low = np.clip(np.floor(NumValid * q - std), 0, np.maximum(NumValid - 1, 0)).astype(np.int64)
+            ind_high = np.clip(np.ceil(NumValid * q + std), 0, np.maximum(NumValid - 1, 0)).astype(np.int64)
+            with np.errstate(invalid="ignore"):
+                  MC_error[ind_Perc] = (CI_sketch_order_statistics(sketch, ind_high, q > 0.5) - CI_sketch_order_statistics(sketch, ind_low, q > 0.5)) / 2
+            MC_error[ind_Perc][NumValid == 0] = np.nan
+
+      return MC_error
+
+
+# Largest change between two estimates of the percentiles of the bootstrapped scores (e.g. between two batches of replicates)
+# Note: the elements that are NaN (or infinite) in both estimates do not change, while the elements that become NaN or finite change infinitely.
+def CI_change(perc_CI, perc_CI_prev):
+
+      with np.errstate(invalid="ignore"):
+            change = np.abs(perc_CI - perc_CI_prev)
+      change[(perc_CI == perc_CI_prev) | (np.isnan(perc_CI) & np.isnan(perc_CI_prev))] = 0
+      change[np.isnan(change)] = np.inf
+
+      return np.max(change, initial=0)
+
+
+# Percentiles, and their Monte-Carlo errors, of bootstrapped scores already computed, with dimensions (NumRep, ...)
+# Note: the function returns the percentiles and the Monte-Carlo errors, both with dimensions (NumPerc, ...).
+def bootstrap_CI_replicates(stat_BS, Perc_CI):
+
+      if stat_BS.shape[0] == 0: # no bootstrapped replicates
+            return np.full((len(Perc_CI),) + stat_BS.shape[1:], np.nan), np.full((len(Perc_CI),) + stat_BS.shape[1:], np.nan)
+
+      sketch = CI_sketch(Perc_CI, stat_BS.shape[0])
+      update_CI_sketch(sketch, stat_BS)
+
+      return CI_sketch_percentiles(sketch), CI_sketch_MC_error(sketch)
+
+
+# Saving the CI summaries for the confidence levels in CL_list (one .npy file and one .json metadata sidecar per confidence level)
+# Note: x_values contains the values of the dimension along which the score is computed (e.g. the steps), stat_original the 
+# original score, and perc_CI and MC_error the percentiles in bootstrap_CI_percentiles(CL_list) and their Monte-Carlo errors, with
+# dimensions (NumX, NumPerc). Each summary has dimensions (NumX, 6), and its columns are x_values, the original score, the lower and
+# upper bounds of the confidence intervals, and their Monte-Carlo errors. The metadata contains the number of replicates drawn.
+def save_CI_summary(FileNameOUT, x_values, stat_original, perc_CI, MC_error, CL_list, NumRep_BS, RepetitionsBS, ToleranceBS):
+
+      for indCL in range(len(CL_list)):
+            CL = CL_list[indCL]
+            CI_array = np.empty([len(x_values),6])
+            CI_array[:,0] = x_values
+            CI_array[:,1] = stat_original
+            CI_array[:,2:4] = perc_CI[:,(2*indCL):(2+2*indCL)]
+            CI_array[:,4:6] = MC_error[:,(2*indCL):(2+2*indCL)]
+            np.save(FileNameOUT + "_CI" + f"{CL:02d}", CI_array)
+            meta = {
+                  "CL": CL,
+                  "RepetitionsBS": int(NumRep_BS),
+                  "RepetitionsBS_Max": int(RepetitionsBS),
+                  "ToleranceBS": ToleranceBS,
+                  "MC_Error_Max": float(np.nanmax(CI_array[:,4:6], initial=0))
+                  }
+            with open(FileNameOUT + "_CI" + f"{CL:02d}" + ".json", "w") as f:
+                  json.dump(meta, f)
+
+
+# Score computed for the original totals, and percentiles of the scores computed for the bootstrapped totals
+# Note: the bootstrapped scores are not kept, but only summarised in a sketch (see CI_sketch), so the memory does not grow with 
+# RepetitionsBS. If ToleranceBS is not None, the replicates are drawn in batches of NumRep_Block_Plan replicates, and the 
+# bootstrap stops early (i.e. before RepetitionsBS replicates) once the percentiles change by no more than ToleranceBS between two
+# batches (see CI_change). If a resampling plan is provided, the replicates are always its first ones, so the scores that stop 
+# early are still paired with the others. The function returns the original score and the percentiles in Perc_CI, with dimensions
+# (1+NumPerc, ...), the number of replicates drawn, and the Monte-Carlo errors of the percentiles, with dimensions (NumPerc, ...).
+def bootstrap_apply_CI(values_days, RepetitionsBS, stat_func, Perc_CI, rng=None, MemoryBS_MB=256, plan=None, ToleranceBS=None):
+
+      chunks = bootstrap_chunks(values_days, RepetitionsBS, stat_func, rng, MemoryBS_MB, plan, (None if ToleranceBS is None else NumRep_Block_Plan))
+      stat_original = next(chunks)
+      sketch = CI_sketch(Perc_CI, RepetitionsBS)
+      perc_CI = np.full((len(Perc_CI),) + stat_original.shape[1:], np.nan)
+      MC_error = np.full((len(Perc_CI),) + stat_original.shape[1:], np.nan)
+
+      # Summarising the bootstrapped scores in the sketch, one batch of replicates at a time
+      NumRep_BS = 0
+      for stat_chunk in chunks:
+            update_CI_sketch(sketch, stat_chunk)
+            NumRep_BS = NumRep_BS + stat_chunk.shape[0]
+            if ToleranceBS is not None:
+                  perc_CI_prev = perc_CI
+                  perc_CI = CI_sketch_percentiles(sketch)
+                  if NumRep_BS > stat_chunk.shape[0] and CI_change(perc_CI, perc_CI_prev) <= ToleranceBS:
+                        break
+      
+      if NumRep_BS > 0:
+            perc_CI = CI_sketch_percentiles(sketch)
+            MC_error = CI_sketch_MC_error(sketch)
+
+      return np.concatenate((stat_original, perc_CI), axis=0), NumRep_BS, MC_error
+
+
+# Daily values of a score, as they are added over the verification period
+# Note: for the counts of forecasts and observations exceeding the VRT ("Count_FC_OBS"), the counts of forecasts are converted into 
+# counts of grid-points (i.e. divided by the number of ensemble members and rounded), as in the computation of the frequency bias.
+def bootstrap_daily_transform(Score, values_days, NumEM):
+
+      values_days = np.array(values_days, dtype=float)
+      if Score == "Count_FC_OBS":
+            values_days[..., 0] = np.round(values_days[..., 0] / NumEM)
+
+      return values_days
+
+
+# Daily values of a score for all the lead times in StepF_list, read from the stores of daily scores
+# Note: the function returns an array with dimensions (NumDays, NumStepF, ...), with the missing values set to zero (see also 
+# bootstrap_daily_transform), and the validity mask, with dimensions (NumDays, NumStepF).
+def bootstrap_daily_values(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, NumEM):
+
+      values_store, Valid_store, meta_store = read_CT_store(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF)
+      ind_StepF_store = [meta_store["ind_StepF"][StepF] for StepF in StepF_list]
+      values_days = bootstrap_daily_transform(Score, values_store[:, ind_StepF_store], NumEM)
+      Valid_days = np.asarray(Valid_store[:, ind_StepF_store])
+      
+      return values_days * Valid_days.reshape(Valid_days.shape + (1,) * (values_days.ndim - 2)), Valid_days
+
+
+# Resampling plan over the valid days of the verification period only
+# Note: Valid_days indicates which days of the plan (see open_bootstrap_plan) are valid. If all the days are valid, the plan is 
+# returned unchanged. Otherwise, each replicate draws, with replacement, as many days as the valid ones, and the multinomial counts 
+# over the valid days are drawn from the same seed and blocks of replicates as the plan (see create_bootstrap_plan). The plans of 
+# the partitions and lead times with the same valid days are therefore the same, and their replicates are paired. The function 
+# returns the counts, with dimensions (RepetitionsBS, NumValidDays).
+def bootstrap_plan_valid(plan, meta_plan, Valid_days):
+
+      Valid_days = np.asarray(Valid_days, dtype=bool)
+      if np.all(Valid_days):
+            return plan
+
+      NumValidDays = int(np.sum(Valid_days))
+      plan_valid = np.empty((meta_plan["RepetitionsBS"], NumValidDays), dtype=np.uint16)
+      for ind_Rep, NumRep, SeedSeq_Block in bootstrap_blocks(np.random.SeedSequence(meta_plan["SeedBS"]), meta_plan["RepetitionsBS"]):
+            plan_valid[ind_Rep:ind_Rep+NumRep] = bootstrap_day_counts(NumValidDays, NumRep, np.random.default_rng(SeedSeq_Block))
+
+      return plan_valid
+
+
+# Original and bootstrapped scores for a partition (forecasting system, EFFCI index, VRT and region) of the stores of daily scores
+# Note: args contains the store to read, the function that computes the score from the totals (stat_func, defined at module level
+# so that it can be sent to other processes), the resampling plan, the percentiles of the confidence intervals (Perc_CI) and the
+# tolerance for stopping the bootstrap early (ToleranceBS). The store and the plan are memory-mapped read-only, so the processes 
+# share them through the page cache instead of copying them. If Perc_CI is None, the function returns all the scores, with 
+# dimensions (NumStepF, RepetitionsBS+1). Otherwise, it returns only the original score and the percentiles of the bootstrapped 
+# scores, with dimensions (NumStepF, 1+NumPerc), the number of replicates drawn, and the Monte-Carlo errors of the percentiles, 
+# with dimensions (NumStepF, NumPerc) (see bootstrap_apply_CI).
+# Note: each lead time resamples only the days for which it has a daily value, as many times as those days (see bootstrap_plan_valid), 
+# and the lead times with the same valid days are bootstrapped together. If the bootstrap stops early, the number of replicates 
+# returned is the largest among the lead times.
+def bootstrap_store(args):
+
+      DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, NumEM, stat_func, DirPlan, RepetitionsBS, SeedBS, MemoryBS_MB, Perc_CI, ToleranceBS = args
+      values_days, Valid_days = bootstrap_daily_values(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, NumEM)
+      plan, meta_plan = open_bootstrap_plan(DirPlan, DateS, DateF, RepetitionsBS, SeedBS)
+
+      # Grouping the lead times with the same valid days
+      Valid_group, ind_group = np.unique(Valid_days.T, axis=0, return_inverse=True)
+      ind_group = np.asarray(ind_group).ravel()
+
+      # Bootstrapping the lead times of each group over their valid days
+      stat_list = [None] * Valid_group.shape[0]
+      NumRep_BS = 0
+      for indGroup in range(Valid_group.shape[0]):
+            ind_StepF = np.where(ind_group == indGroup)[0]
+            values_group = values_days[Valid_group[indGroup]][:, ind_StepF]
+            plan_group = bootstrap_plan_valid(plan, meta_plan, Valid_group[indGroup])
+            if Perc_CI is None:
+                  stat_list[indGroup] = bootstrap_apply(values_group, RepetitionsBS, stat_func, MemoryBS_MB=MemoryBS_MB, plan=plan_group).T
+            else:
+                  stat_CI, NumRep_BS_group, MC_error = bootstrap_apply_CI(values_group, RepetitionsBS, stat_func, Perc_CI, MemoryBS_MB=MemoryBS_MB, plan=plan_group, ToleranceBS=ToleranceBS)
+                  stat_list[indGroup] = (stat_CI.T, MC_error.T)
+                  NumRep_BS = max(NumRep_BS, NumRep_BS_group)
+
+      # Putting the lead times back in their order
+      if Perc_CI is None:
+            stat = np.empty((len(StepF_list), RepetitionsBS + 1))
+            for indGroup in range(Valid_group.shape[0]):
+                  stat[ind_group == indGroup] = stat_list[indGroup]
+            return stat
+
+      stat_CI = np.empty((len(StepF_list), 1 + len(Perc_CI)))
+      MC_error = np.empty((len(StepF_list), len(Perc_CI)))
+      for indGroup in range(Valid_group.shape[0]):
+            stat_CI[ind_group == indGroup], MC_error[ind_group == indGroup] = stat_list[indGroup]
+
+      return stat_CI, NumRep_BS, MC_error
+
+
+# Daily values of a score for many EFFCI indexes, VRTs and regions of a forecasting system, read from the stores of daily scores
+# Note: each store is read only once, and the daily values are stacked in one array with dimensions (NumDays, NumEFFCI, NumVRT,
+# NumReg, NumStepF, ...), with the missing values set to zero (see bootstrap_daily_values).
+def bootstrap_daily_values_block(DirStore, Score, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, SystemFC, RegionName_list, DateS, DateF, StepF_list, NumEM):
+
+      values_block = None
+      for indEFFCI in range(len(EFFCI_list)):
+            for indVRT in range(len(MagnitudeInPerc_Rain_Event_FR_list)):
+                  for indReg in range(len(RegionName_list)):
+                        values_days, Valid_days = bootstrap_daily_values(DirStore, Score, Acc, EFFCI_list[indEFFCI], MagnitudeInPerc_Rain_Event_FR_list[indVRT], SystemFC, RegionName_list[indReg], DateS, DateF, StepF_list, NumEM)
+                        if values_block is None:
+                              values_block = np.empty((values_days.shape[0], len(EFFCI_list), len(MagnitudeInPerc_Rain_Event_FR_list), len(RegionName_list)) + values_days.shape[1:])
+                        values_block[:, indEFFCI, indVRT, indReg] = values_days
+
+      return values_block
+
+
+# Original and bootstrapped scores for many EFFCI indexes, VRTs and regions of a forecasting system
+# Note: args is as in bootstrap_store, with lists of EFFCI indexes, VRTs and regions. All the partitions share the same replicates,
+# so each chunk of the resampling plan is read and converted only once, and the bootstrapped totals of all the partitions and lead
+# times are computed with one matrix product. The function returns the scores, with dimensions (NumEFFCI, NumVRT, NumReg, NumStepF,
+# RepetitionsBS+1), or the scores with dimensions (NumEFFCI, NumVRT, NumReg, NumStepF, 1+NumPerc), the number of replicates drawn 
+# (shared by all the partitions) and the Monte-Carlo errors with dimensions (NumEFFCI, NumVRT, NumReg, NumStepF, NumPerc) if Perc_CI
+# is not None.
+def bootstrap_store_block(args):
+
+      DirStore, Score, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, SystemFC, RegionName_list, DateS, DateF, StepF_list, NumEM, stat_func, DirPlan, RepetitionsBS, SeedBS, MemoryBS_MB, Perc_CI, ToleranceBS = args
+      values_block = bootstrap_daily_values_block(DirStore, Score, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, SystemFC, RegionName_list, DateS, DateF, StepF_list, NumEM)
+      plan, meta_plan = open_bootstrap_plan(DirPlan, DateS, DateF, RepetitionsBS, SeedBS)
+      if Perc_CI is None:
+            return np.moveaxis(bootstrap_apply(values_block, RepetitionsBS, stat_func, MemoryBS_MB=MemoryBS_MB, plan=plan), 0, -1)
+
+      stat_CI, NumRep_BS, MC_error = bootstrap_apply_CI(values_block, RepetitionsBS, stat_func, Perc_CI, MemoryBS_MB=MemoryBS_MB, plan=plan, ToleranceBS=ToleranceBS)
+
+      return np.moveaxis(stat_CI, 0, -1), NumRep_BS, np.moveaxis(MC_error, 0, -1)
+
+
+# Percentiles of bootstrapped samples of values, from the multinomial weights of the sorted unique values
+# Note: values_unique contains the sorted unique values of the sample, and counts_BS, with dimensions (NumRep, NumUnique), how many
+# times each unique value is drawn in each replicate. Each replicate is therefore never built nor sorted: the values in the positions
+# needed by the percentiles of the sorted replicate are found with a search in the cumulative weights, for all replicates at once.
+# The percentiles are computed with the same linear interpolation as np.percentile. The function returns the percentiles, with 
+# dimensions (NumPerc, NumRep).
+def bootstrap_percentiles_weighted(values_unique, counts_BS, Perc_list):
+
+      NumRep, NumUnique = counts_BS.shape
+      NumValues = int(np.sum(counts_BS[0]))
+
+      # Computing the positions, in the sorted replicates, of the values needed by the percentiles
+      q = np.asarray(Perc_list, dtype=float) / 100
+      ind_virtual = (NumValues - 1) * q
+      ind_prev = np.clip(np.floor(ind_virtual), 0, NumValues - 1).astype(np.int64)
+      ind_next = np.clip(ind_prev + 1, 0, NumValues - 1)
+      gamma = ind_virtual - np.floor(ind_virtual)
+
+      # Finding the unique values in those positions from the cumulative weights
+      # Note: the cumulative weights of each replicate are shifted by NumValues, so that one search covers all the replicates.
+      shift = (np.arange(NumRep, dtype=np.int64) * NumValues)[:, np.newaxis]
+      cum_counts = (np.cumsum(counts_BS, axis=1) + shift).ravel()
+      shift_unique = (np.arange(NumRep, dtype=np.int64) * NumUnique)[:, np.newaxis]
+      values_prev = values_unique[np.searchsorted(cum_counts, (ind_prev + shift).ravel(), side="right").reshape(NumRep, -1) - shift_unique]
+      values_next = values_unique[np.searchsorted(cum_counts, (ind_next + shift).ravel(), side="right").reshape(NumRep, -1) - shift_unique]
+
+      # Interpolating linearly between the values
+      # Note: as with np.percentile, the percentiles of the replicates that draw a NaN value are NaN.
+      diff = values_next - values_prev
+      perc_BS = np.where(gamma >= 0.5, values_next - diff * (1 - gamma), values_prev + diff * gamma)
+      perc_BS[np.any(counts_BS[:, np.isnan(values_unique)] > 0, axis=1)] = np.nan
+
+      return perc_BS.T
+
+
+# Percentiles of a block of bootstrapped samples of values
+# Note: args contains the sorted unique values of the sample and their counts (see np.unique), the percentiles to compute, and the 
+# block of replicates (see bootstrap_blocks). Drawing, with replacement, as many values as the ones in the sample is equivalent to 
+# drawing multinomial counts for the unique values, with probabilities proportional to their counts. The function returns the 
+# percentiles, with dimensions (NumPerc, NumRep).
+def bootstrap_percentiles_block(args):
+
+      values_unique, counts_unique, Perc_list, (ind_Rep, NumRep, SeedSeq_Block) = args
+      rng = np.random.default_rng(SeedSeq_Block)
+      NumValues = int(np.sum(counts_unique))
+      counts_BS = rng.multinomial(NumValues, counts_unique / NumValues, size=NumRep)
+
+      return bootstrap_percentiles_weighted(values_unique, counts_BS, Perc_list)
+
+
+# Running a bootstrap function over a list of tasks, in serial (NumProcesses=1) or across NumProcesses local processes
+# Note: the results are returned in the order of the tasks. Since each task reads its replicates from a resampling plan or draws 
+# them from its own child of the seed sequence, the results do not depend on the number of processes.
+def run_bootstrap_tasks(func, args_list, NumProcesses):
+
+      if NumProcesses <= 1:
+            return [func(args) for args in args_list]
+
+      with Pool(processes=NumProcesses) as pool:
+            return pool.map(func, args_list, chunksize=1)
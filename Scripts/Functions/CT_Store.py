@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import fcntl
+from datetime import datetime, timedelta
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# CT_Store.py contains the functions to write and read the stores of daily scores. A store contains all the
+# daily values of one score for one partition (forecasting system, EFFCI index, VRT and region) for a whole
+# year in a single memory-mapped int32 array with dimensions (NumDays, NumStepF, ...). The trailing
+# dimensions depend on the score (see CT_store_shape):
+#     - "CT": daily probabilistic contingency tables, with trailing dimensions (NumEM+1, 4), i.e. the 
+#        probability thresholds (number of members, from NumEM to 0, exceeding the VRT) and the elements of 
+#        the contingency tables (hits, false alarms, misses, correct negatives).
+#     - "Count_FC_OBS": counts of forecasts (all members and grid-points) and observations exceeding the VRT,
+#        with trailing dimension (2).
+# A second memory-mapped boolean array with dimensions (NumDays, NumStepF) indicates which daily values are
+# valid (i.e. were computed because the forecasts existed). Each store is saved as two .npy files, together
+# with a small .json metadata sidecar.
+# Different processes can write different days of the same store at the same time, since the store is
+# created atomically by only one of them (see create_store_files) and the metadata does not change after creation.
+##########################################################################################################
+
+
+# Names of the elements of the contingency tables stored in the last dimension of the "CT" stores
+CT_Elements = ["HITS", "FALSE ALARMS", "MISSES", "CORRECT NEGATIVES"]
+
+
+# Trailing dimensions (after the days and the steps) of the store of a specific score
+def CT_store_shape(Score, NumEM):
+
+      if Score == "CT":
+            return (NumEM+1, len(CT_Elements))
+      elif Score == "Count_FC_OBS":
+            return (2,)
+      else:
+            raise ValueError("The score " + Score + " is not supported by the stores of daily scores.")
+
+
+# Name of the files containing a store, its validity mask and its metadata
+def CT_store_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year):
+
+      FileName = Score + "_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName + "_" + str(Year)
+      DirStore_temp = DirStore + "/" + f"{Acc:02d}" + "h"
+
+      return DirStore_temp + "/" + FileName + ".npy", DirStore_temp + "/" + FileName + "_Valid.npy", DirStore_temp + "/" + FileName + ".json"
+
+
+# Creation of the memory-mapped arrays (filled with zeros) and of the metadata of a store, if they do not exist
+# Note: File_list, dtype_list and shape_list define the arrays of the store, and FileMeta and meta its metadata. The store is created
+# by only one process, under an exclusive lock on FileMeta + ".lock" (released by the operating system also if the process dies). The
+# arrays are written in temporary files and moved to their final names, and the metadata is moved last, so a store whose metadata
+# exists is always complete, and the arrays left by a process that died before moving the metadata are overwritten. If the lock is
+# held by another process for more than TimeoutS seconds, an error is raised.
+def create_store_files(File_list, dtype_list, shape_list, FileMeta, meta, TimeoutS=600):
+
+      if os.path.isfile(FileMeta):
+            return
+      if not os.path.exists(os.path.dirname(FileMeta)):
+            os.makedirs(os.path.dirname(FileMeta), exist_ok=True)
+
+      with open(FileMeta + ".lock", "a") as f:
+
+            # Waiting for the lock
+            TimeS = time.time()
+            while True:
+                  try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                  except BlockingIOError:
+                        if time.time() - TimeS > TimeoutS:
+                              raise TimeoutError("The store " + os.path.basename(FileMeta)[:-5] + " was not created because its lock (" + FileMeta + ".lock) was held by another process for more than " + str(TimeoutS) + " seconds.")
+                        time.sleep(1)
+
+            # Creating the store, if another process did not create it while waiting for the lock
+            pid = "." + str(os.getpid()) + ".tmp"
+            try:
+                  if not os.path.isfile(FileMeta):
+                        for File, dtype, shape in zip(File_list, dtype_list, shape_list):
+                              values = np.lib.format.open_memmap(File + pid, mode="w+", dtype=dtype, shape=shape)
+                              values.flush()
+                              del values
+                              os.replace(File + pid, File)
+                        with open(FileMeta + pid, "w") as f_meta:
+                              json.dump(meta, f_meta)
+                        os.replace(FileMeta + pid, FileMeta)
+            finally:
+                  for File in File_list + [FileMeta]:
+                        if os.path.exists(File + pid):
+                              os.remove(File + pid)
+                  fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Opening a store for writing (the store is created, filled with zeros and with no valid values, if it does not exist)
+def open_CT_store(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, BaseTime, StepF_list, NumEM):
+
+      FileCT, FileValid, FileMeta = CT_store_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year)
+
+      if not os.path.isfile(FileMeta):
+
+            # Creating the list of days in the considered year
+            BaseDateTime_list = []
+            BaseDateTime = datetime(Year,1,1) + timedelta(hours=BaseTime)
+            while BaseDateTime.year == Year:
+                  BaseDateTime_list.append(BaseDateTime)
+                  BaseDateTime += timedelta(days=1)
+
+            # Creating the memory-mapped arrays and the metadata
+            meta = {
+                  "Score": Score,
+                  "Acc": int(Acc),
+                  "EFFCI": int(EFFCI),
+                  "VRT": int(MagnitudeInPerc_Rain_Event_FR),
+                  "SystemFC": SystemFC,
+                  "RegionName": RegionName,
+                  "BaseDateTime": [BaseDateTime.strftime("%Y%m%d%H") for BaseDateTime in BaseDateTime_list],
+                  "StepF": [int(StepF) for StepF in StepF_list],
+                  "NumEM": int(NumEM),
+                  }
+            if Score == "CT":
+                  meta["ProbThr"] = list(range(NumEM, -1, -1))
+                  meta["Elements"] = CT_Elements
+            shape_CT = (len(BaseDateTime_list), len(StepF_list)) + CT_store_shape(Score, NumEM)
+            shape_Valid = (len(BaseDateTime_list), len(StepF_list))
+            create_store_files([FileCT, FileValid], [np.int32, bool], [shape_CT, shape_Valid], FileMeta, meta)
+
+      return read_CT_store_year(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, mode="r+")
+
+
+# Reading a store for a specific year (as memory-mapped arrays) and its metadata
+def read_CT_store_year(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, mode="r"):
+
+      FileCT, FileValid, FileMeta = CT_store_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year)
+      with open(FileMeta) as f:
+            meta = json.load(f)
+      ct = np.load(FileCT, mmap_mode=mode)
+      Valid = np.load(FileValid, mmap_mode=mode)
+
+      # Adding the look-up tables to find days and steps in the store
+      meta["ind_BaseDateTime"] = {BaseDateTimeSTR: ind for ind, BaseDateTimeSTR in enumerate(meta["BaseDateTime"])}
+      meta["ind_StepF"] = {StepF: ind for ind, StepF in enumerate(meta["StepF"])}
+
+      return ct, Valid, meta
+
+
+# Reading the daily values of a score for all the days between DateS and DateF
+# Note: the function returns the daily values, with dimensions (NumDays, NumStepF, ...), the validity mask, with dimensions
+# (NumDays, NumStepF), and the metadata with the considered days. If the period is within a single year, the daily values 
+# and the validity mask are memory-mapped views of the store.
+def read_CT_store(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF):
+
+      ct_list = []
+      Valid_list = []
+      BaseDateTime_list = []
+      for Year in range(DateS.year, DateF.year + 1):
+            ct, Valid, meta = read_CT_store_year(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year)
+            ind_Days = [ind for ind, BaseDateTimeSTR in enumerate(meta["BaseDateTime"]) if DateS.strftime("%Y%m%d%H") <= BaseDateTimeSTR <= DateF.strftime("%Y%m%d%H")]
+            ct_list.append(ct[ind_Days[0]:ind_Days[-1]+1])
+            Valid_list.append(Valid[ind_Days[0]:ind_Days[-1]+1])
+            BaseDateTime_list = BaseDateTime_list + meta["BaseDateTime"][ind_Days[0]:ind_Days[-1]+1]
+
+      if len(ct_list) == 1:
+            ct, Valid = ct_list[0], Valid_list[0]
+      else:
+            ct, Valid = np.concatenate(ct_list, axis=0), np.concatenate(Valid_list, axis=0)
+      meta["BaseDateTime"] = BaseDateTime_list
+      meta["ind_BaseDateTime"] = {BaseDateTimeSTR: ind for ind, BaseDateTimeSTR in enumerate(BaseDateTime_list)}
+
+      return ct, Valid, meta
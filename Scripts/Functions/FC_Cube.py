@@ -0,0 +1,220 @@
+import os
+import json
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# FC_Cube.py contains the functions to write and read the forecast cubes. A forecast cube stores all the
+# rainfall forecasts of a forecasting system for a whole period of runs in a single memory-mapped float32
+# array with dimensions (NumRuns, NumSteps, NumEM, NumGP). The array is stored in C-order, so each run
+# is a contiguous chunk on disk. Each cube is saved as a .npy file, together with a small .json metadata
+# sidecar that contains the runs, the steps, the units and the availability of each (run, step) field.
+# Cubes for cumulative rainfall (e.g. raw ENS) are identified by Acc=0. Cubes for rainfall accumulated
+# over a period (e.g. ecPoint) are identified by the accumulation period Acc, and their steps indicate
+# the end of the accumulation periods.
+# A cube can also store only a subset of the grid-points of the global fields (e.g. the grid-points in the
+# regions of the domain's mask). In that case, the metadata contains the global indexes of the stored
+# grid-points ("Ind_GP"), and the functions FC_cube_region_index and FC_cube_global map the grid-points
+# of the cube to those of the global fields.
+##########################################################################################################
+
+
+# Factors converting the units of the forecasts stored in the cubes into mm
+FC_Units_mm = {"m": 1000, "mm": 1}
+
+
+# Name of the files containing a forecast cube and its metadata
+def FC_cube_filename(DirCube, SystemFC, Acc):
+
+      if Acc == 0:
+            FileName = "FC_Cube_" + SystemFC + "_Cum"
+      else:
+            FileName = "FC_Cube_" + SystemFC + "_" + f"{Acc:03d}" + "h"
+
+      return DirCube + "/" + FileName + ".npy", DirCube + "/" + FileName + ".json"
+
+
+# Creation of an empty forecast cube, filled with NaNs, on disk
+# Note: if Ind_GP is None, the cube stores all the NumGP_Global grid-points of the global fields.
+def create_FC_cube(DirCube, SystemFC, Acc, BaseDateTime_list, Step_list, NumEM, NumGP_Global, Units, Ind_GP=None):
+
+      FileCube, FileMeta = FC_cube_filename(DirCube, SystemFC, Acc)
+      if not os.path.exists(DirCube):
+            os.makedirs(DirCube)
+
+      # Defining the number of grid-points stored in the cube
+      if Ind_GP is None:
+            NumGP = NumGP_Global
+      else:
+            Ind_GP = [int(ind) for ind in Ind_GP]
+            NumGP = len(Ind_GP)
+
+      # Creating the memory-mapped array
+      cube = np.lib.format.open_memmap(FileCube, mode="w+", dtype=np.float32, shape=(len(BaseDateTime_list), len(Step_list), NumEM, NumGP))
+      cube[:] = np.nan
+
+      # Creating the metadata
+      meta = {
+            "SystemFC": SystemFC,
+            "Acc": int(Acc),
+            "Units": Units,
+            "BaseDateTime": [BaseDateTime.strftime("%Y%m%d%H") for BaseDateTime in BaseDateTime_list],
+            "Step": [int(Step) for Step in Step_list],
+            "NumEM": int(NumEM),
+            "NumGP": int(NumGP),
+            "NumGP_Global": int(NumGP_Global),
+            "Ind_GP": Ind_GP,
+            "Available": np.zeros((len(BaseDateTime_list), len(Step_list)), dtype=bool).tolist()
+            }
+
+      return cube, meta
+
+
+# Saving the metadata of a forecast cube
+def save_FC_cube_meta(DirCube, meta):
+
+      FileCube, FileMeta = FC_cube_filename(DirCube, meta["SystemFC"], meta["Acc"])
+      with open(FileMeta + ".tmp", "w") as f:
+            json.dump(meta, f)
+      os.replace(FileMeta + ".tmp", FileMeta)
+
+
+# Factor converting the forecasts stored in a cube, in the units Units, into mm
+def FC_units_factor(Units):
+
+      if Units not in FC_Units_mm:
+            raise ValueError("The units " + str(Units) + " of the forecast cube are not supported. Supported units are: " + ", ".join(FC_Units_mm) + ".")
+
+      return FC_Units_mm[Units]
+
+
+# Reading a forecast cube (as a read-only memory-mapped array) and its metadata
+def read_FC_cube(DirCube, SystemFC, Acc):
+
+      FileCube, FileMeta = FC_cube_filename(DirCube, SystemFC, Acc)
+      with open(FileMeta) as f:
+            meta = json.load(f)
+      cube = np.load(FileCube, mmap_mode="r")
+
+      # Adding the look-up tables to find runs and steps in the cube
+      meta["ind_BaseDateTime"] = {BaseDateTimeSTR: ind for ind, BaseDateTimeSTR in enumerate(meta["BaseDateTime"])}
+      meta["ind_Step"] = {Step: ind for ind, Step in enumerate(meta["Step"])}
+      meta["Available"] = np.array(meta["Available"], dtype=bool)
+      if meta["Ind_GP"] is not None:
+            meta["Ind_GP"] = np.array(meta["Ind_GP"], dtype=int)
+
+      return cube, meta
+
+
+# Extraction from a forecast cube of the field for a specific run and step
+# Note: an empty list is returned if the field is not available, to mirror the checks done in the compute stages.
+def FC_cube_field(cube, meta, BaseDateTime, Step):
+
+      ind_BaseDateTime = meta["ind_BaseDateTime"].get(BaseDateTime.strftime("%Y%m%d%H"))
+      ind_Step = meta["ind_Step"].get(int(Step))
+      if ind_BaseDateTime is None or ind_Step is None or not meta["Available"][ind_BaseDateTime, ind_Step]:
+            return []
+
+      return cube[ind_BaseDateTime, ind_Step]
+
+
+# Extraction from a forecast cube of the rainfall accumulated, in mm, over the period ending at StepF
+# Note: cumulative cubes (Acc=0) are de-accumulated and converted in mm from the units recorded in their metadata.
+def FC_cube_acc(cube, meta, BaseDateTime, StepF, Acc):
+
+      if meta["Acc"] == 0:
+            tp1 = FC_cube_field(cube, meta, BaseDateTime, StepF - Acc)
+            tp2 = FC_cube_field(cube, meta, BaseDateTime, StepF)
+            if len(tp1) == 0 or len(tp2) == 0:
+                  return []
+            return (tp2 - tp1) * FC_units_factor(meta["Units"])
+      elif meta["Acc"] == Acc:
+            return FC_cube_field(cube, meta, BaseDateTime, StepF)
+      else:
+            raise ValueError("The cube for " + meta["SystemFC"] + " contains rainfall accumulated over " + str(meta["Acc"]) + " hours, not over " + str(Acc) + " hours.")
+
+
+# Opening the forecast cube that provides the rainfall accumulated over Acc hours for a specific forecasting system
+# Note: the cube with the forecasts already accumulated over Acc hours is preferred. If it does not exist, the cumulative cube is used.
+def open_FC_cube(DirCube, SystemFC, Acc):
+
+      FileCube, FileMeta = FC_cube_filename(DirCube, SystemFC, Acc)
+      if os.path.isfile(FileMeta):
+            return read_FC_cube(DirCube, SystemFC, Acc)
+      else:
+            return read_FC_cube(DirCube, SystemFC, 0)
+
+
+# De-accumulation of the cumulative forecasts of a run into rainfall accumulated over Acc hours, in mm
+# Note: tp_cum_run contains all the steps of the run, with dimensions (NumSteps, NumEM, NumGP), so each 
+# cumulative field is read only once and reused for all the accumulation periods that start or end with it.
+# Units are the units of the cumulative forecasts (see FC_Units_mm).
+def deaccumulate_FC_run(tp_cum_run, Step_list, StepF_list, Acc, Units):
+
+      ind_Step = {Step: ind for ind, Step in enumerate(Step_list)}
+      Factor = FC_units_factor(Units)
+      tp_acc_run = np.full((len(StepF_list),) + tp_cum_run.shape[1:], np.nan, dtype=np.float32)
+      for ind_StepF in range(len(StepF_list)):
+            StepF = StepF_list[ind_StepF]
+            StepS = StepF - Acc
+            if StepS in ind_Step and StepF in ind_Step:
+                  tp_acc_run[ind_StepF] = (tp_cum_run[ind_Step[StepF]] - tp_cum_run[ind_Step[StepS]]) * Factor
+
+      return tp_acc_run
+
+
+# Extraction from a forecast cube of the rainfall accumulated, in mm, over all the periods of a run ending at the steps in StepF_list
+# Note: the whole run is read from the cube only once. The function returns the fields, with dimensions (NumStepF, NumEM, NumGP),
+# and a boolean array indicating which accumulation periods are available.
+def FC_cube_run_acc(cube, meta, BaseDateTime, StepF_list, Acc):
+
+      tp_run = np.full((len(StepF_list), meta["NumEM"], meta["NumGP"]), np.nan, dtype=np.float32)
+      Avail = np.zeros(len(StepF_list), dtype=bool)
+      ind_BaseDateTime = meta["ind_BaseDateTime"].get(BaseDateTime.strftime("%Y%m%d%H"))
+      if ind_BaseDateTime is None:
+            return tp_run, Avail
+
+      # Reading the whole run
+      Avail_run = meta["Available"][ind_BaseDateTime]
+      cube_run = np.asarray(cube[ind_BaseDateTime])
+
+      # Extracting the accumulation periods to consider
+      if meta["Acc"] == 0:
+            Step_Avail_list = [meta["Step"][ind] for ind in np.where(Avail_run)[0]]
+            tp_run = deaccumulate_FC_run(cube_run[Avail_run], Step_Avail_list, StepF_list, Acc, meta["Units"])
+            Avail = np.array([(StepF in Step_Avail_list) and ((StepF - Acc) in Step_Avail_list) for StepF in StepF_list], dtype=bool)
+      elif meta["Acc"] == Acc:
+            for ind_StepF in range(len(StepF_list)):
+                  ind_Step = meta["ind_Step"].get(int(StepF_list[ind_StepF]))
+                  if ind_Step is not None and Avail_run[ind_Step]:
+                        tp_run[ind_StepF] = cube_run[ind_Step]
+                        Avail[ind_StepF] = True
+      else:
+            raise ValueError("The cube for " + meta["SystemFC"] + " contains rainfall accumulated over " + str(meta["Acc"]) + " hours, not over " + str(Acc) + " hours.")
+
+      return tp_run, Avail
+
+
+# Indexes, in the grid-points stored in a forecast cube, of the grid-points belonging to a region of the domain's mask
+# Note: mask_geo contains the geometry of the domain's mask (see "Scripts/Functions/Mask_Geometry.py"). The region's global 
+# indexes are looked up in the (sorted) global indexes of the grid-points stored in the cube, without scanning the global fields.
+def FC_cube_region_index(meta, mask_geo, RegionCode):
+
+      Ind_GP_Region = np.asarray(mask_geo["Ind_GP"][RegionCode])
+      if meta["Ind_GP"] is None:
+            return Ind_GP_Region
+      else:
+            ind = np.minimum(np.searchsorted(meta["Ind_GP"], Ind_GP_Region), len(meta["Ind_GP"]) - 1)
+            return ind[meta["Ind_GP"][ind] == Ind_GP_Region]
+
+
+# Conversion of the values stored in a forecast cube into values for the global fields
+# Note: the grid-points not stored in the cube are set to NaN (i.e. missing values).
+def FC_cube_global(meta, tp):
+
+      if meta["Ind_GP"] is None:
+            return np.asarray(tp)
+      else:
+            tp_global = np.full(np.shape(tp)[:-1] + (meta["NumGP_Global"],), np.nan, dtype=np.float32)
+            tp_global[..., meta["Ind_GP"]] = tp
+            return tp_global
@@ -0,0 +1,175 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from PointFR_Index import PointFR_windows
+
+##########################################################################################################
+# CODE DESCRIPTION
+# GridFR_Events.py contains the functions to write and read the gridded flood reports as a sparse event
+# table, instead of one global field per accumulation period and EFFCI index that is almost always full of
+# zeros. Each row of the table is an event, i.e. a grid-box with at least one flood report in an accumulation
+# period, with columns (ValidTimeF, AccPerS, EFFCI, Ind_GP, Count): the end of the accumulation period (as
+# an integer in the format YYYYMMDDHH), the start hour of the accumulation period, the EFFCI index, the index
+# of the grid-box in the global fields, and the number of flood reports in the grid-box. The table is saved
+# as a single .npy file per accumulation, sorted by end of the accumulation period, EFFCI index and
+# grid-box, together with a small .json metadata sidecar that contains the accumulation periods and EFFCI
+# indexes covered by the table (i.e. the periods with no events are stored as zero rows, not as missing).
+# The gridded flood reports are then materialised as dense arrays (or, with metview, as .grib fields) only
+# when needed. The consumers that look up many accumulation periods (e.g. the fused verification pass, see
+# "Scripts/Functions/Verif_Pass.py") can load all the accumulation periods of the verification period, only
+# for the grid-points of the considered regions, in an in-memory cache at startup.
+##########################################################################################################
+
+
+# Name of the files containing the event table and its metadata
+def GridFR_events_filename(DirGridFR, Acc):
+
+      FileName = DirGridFR + "/" + f"{Acc:02d}" + "h/GridFR_Events_" + f"{Acc:02d}" + "h"
+
+      return FileName + ".npy", FileName + ".json"
+
+
+# Creation of the event table from the index of the point flood reports (see "Scripts/Functions/PointFR_Index.py")
+# Note: the index must contain, in "Ind_GP", the index of the nearest grid-point of each point flood report (see 
+# "Scripts/Functions/Grid_Index.py"). A point flood report counts for the EFFCI indexes in EFFCI_list that are not larger than 
+# its own EFFCI index. The accumulation periods start at the hours in AccPerS_list of each day between DateS and DateF, and last 
+# Acc hours. All the (accumulation period, point flood report) pairs are enumerated in one pass over the index.
+def create_GridFR_events(PointFR_index, DateS, DateF, Acc, AccPerS_list, EFFCI_list):
+
+      # Defining all the accumulation periods
+      NumDays = (DateF - DateS).days + 1
+      AccPerS_array = np.tile(np.asarray(AccPerS_list, dtype=np.int64), NumDays)
+      WindowS_array = np.datetime64(DateS, "h") + np.repeat(np.arange(NumDays, dtype=np.int64) * 24, len(AccPerS_list)) + AccPerS_array
+      WindowF_array = WindowS_array + np.int64(Acc)
+      ValidTimeF_array = pd.DatetimeIndex(WindowF_array).strftime("%Y%m%d%H").astype(np.int64).to_numpy()
+
+      # Assigning the point flood reports to all the accumulation periods that contain them
+      ind_Window, ind_PointFR = PointFR_windows(PointFR_index, WindowS_array, WindowF_array)
+      events_list = []
+      for EFFCI in EFFCI_list:
+            In_EFFCI = PointFR_index["EFFCI"][ind_PointFR] >= EFFCI
+            events_EFFCI = np.empty((np.sum(In_EFFCI), 4), dtype=np.int64)
+            events_EFFCI[:, 0] = ValidTimeF_array[ind_Window[In_EFFCI]]
+            events_EFFCI[:, 1] = AccPerS_array[ind_Window[In_EFFCI]]
+            events_EFFCI[:, 2] = EFFCI
+            events_EFFCI[:, 3] = PointFR_index["Ind_GP"][ind_PointFR[In_EFFCI]]
+            events_list.append(events_EFFCI)
+
+      # Counting the point flood reports in each grid-box for each accumulation period and EFFCI index
+      # Note: the events are sorted by end of the accumulation period, EFFCI index and grid-box.
+      events, Count = np.unique(np.concatenate(events_list + [np.empty((0, 4), dtype=np.int64)]), axis=0, return_counts=True)
+      events = np.concatenate((events, Count[:, np.newaxis]), axis=1)
+      events = events[np.lexsort((events[:, 3], events[:, 2], events[:, 0]))]
+
+      return events, sorted(set(ValidTimeF_array.tolist()))
+
+
+# Saving the event table
+# Note: the metadata is saved last, so an event table whose metadata exists is always complete.
+def save_GridFR_events(DirGridFR, Acc, events, ValidTimeF_list, EFFCI_list, NumGP):
+
+      FileEvents, FileMeta = GridFR_events_filename(DirGridFR, Acc)
+      if not os.path.exists(os.path.dirname(FileEvents)):
+            os.makedirs(os.path.dirname(FileEvents))
+
+      meta = {
+            "Acc": int(Acc),
+            "Columns": ["ValidTimeF", "AccPerS", "EFFCI", "Ind_GP", "Count"],
+            "ValidTimeF": [int(ValidTimeF) for ValidTimeF in ValidTimeF_list],
+            "EFFCI": [int(EFFCI) for EFFCI in EFFCI_list],
+            "NumGP": int(NumGP)
+            }
+      with open(FileEvents + ".tmp", "wb") as f:
+            np.save(f, np.asarray(events, dtype=np.int64))
+      os.replace(FileEvents + ".tmp", FileEvents)
+      with open(FileMeta + ".tmp", "w") as f:
+            json.dump(meta, f)
+      os.replace(FileMeta + ".tmp", FileMeta)
+
+
+# Reading the event table
+# Note: the function returns the events and the metadata, with a look-up table ("ind_Events") that gives, for each end of the
+# accumulation period and EFFCI index with at least one event, the first and last+1 rows of its events in the table.
+def read_GridFR_events(DirGridFR, Acc):
+
+      FileEvents, FileMeta = GridFR_events_filename(DirGridFR, Acc)
+      with open(FileMeta) as f:
+            meta = json.load(f)
+      events = np.load(FileEvents)
+
+      Key, Start = np.unique(events[:, [0, 2]], axis=0, return_index=True)
+      End = np.append(Start[1:], events.shape[0])
+      meta["ind_Events"] = {(int(Key[i, 0]), int(Key[i, 1])): (int(Start[i]), int(End[i])) for i in range(Key.shape[0])}
+      meta["ValidTimeF_set"] = set(meta["ValidTimeF"])
+
+      return events, meta
+
+
+# Events (grid-boxes and number of flood reports) for a specific accumulation period, ending at ValidTimeF, and EFFCI index
+def GridFR_events_window(events_store, ValidTimeF, EFFCI):
+
+      events, meta = events_store
+      ValidTimeF = int(ValidTimeF.strftime("%Y%m%d%H"))
+      if ValidTimeF not in meta["ValidTimeF_set"] or EFFCI not in meta["EFFCI"]:
+            raise ValueError("The gridded flood reports for EFFCI>=" + str(EFFCI) + " and the accumulation period ending at " + str(ValidTimeF) + " are not in the event table.")
+      Start, End = meta["ind_Events"].get((ValidTimeF, EFFCI), (0, 0))
+
+      return events[Start:End, 3], events[Start:End, 4]
+
+
+# Dense gridded flood reports for a specific accumulation period, ending at ValidTimeF, and many EFFCI indexes
+# Note: the function returns the number of flood reports in each grid-box of the global fields, with dimensions (NumEFFCI, NumGP).
+# If template is provided (e.g. the values of the domain's mask multiplied by zero), the counts are added to it, so that its
+# missing values are kept.
+def GridFR_dense(events_store, ValidTimeF, EFFCI_list, template=None):
+
+      events, meta = events_store
+      GridFR_EFFCI = np.zeros((len(EFFCI_list), meta["NumGP"]))
+      if template is not None:
+            GridFR_EFFCI += template
+      for indEFFCI in range(len(EFFCI_list)):
+            Ind_GP, Count = GridFR_events_window(events_store, ValidTimeF, EFFCI_list[indEFFCI])
+            np.add.at(GridFR_EFFCI[indEFFCI], Ind_GP, Count)
+
+      return GridFR_EFFCI
+
+
+# In-memory cache of the gridded flood reports for all the accumulation periods ending between ValidTimeF_S and ValidTimeF_F
+# Note: the cache contains the number of flood reports (capped at 255) only for the grid-points in Ind_GP (e.g. the grid-points
+# of the considered regions, see mask_geometry_index in "Scripts/Functions/Mask_Geometry.py"), in an array with dimensions
+# (NumValidTimeF, NumEFFCI, NumGP_Cache), together with a look-up table from the end of the accumulation periods to their 
+# positions in the array, so that each look-up (see GridFR_cache_lookup) takes constant time.
+def GridFR_cache(events_store, ValidTimeF_S, ValidTimeF_F, EFFCI_list, Ind_GP):
+
+      events, meta = events_store
+      for EFFCI in EFFCI_list:
+            if EFFCI not in meta["EFFCI"]:
+                  raise ValueError("The gridded flood reports for EFFCI>=" + str(EFFCI) + " are not in the event table.")
+      Ind_GP = np.asarray(Ind_GP)
+      ValidTimeF_list = [ValidTimeF for ValidTimeF in meta["ValidTimeF"] if int(ValidTimeF_S.strftime("%Y%m%d%H")) <= ValidTimeF <= int(ValidTimeF_F.strftime("%Y%m%d%H"))]
+
+      # Selecting the events in the considered accumulation periods, EFFCI indexes and grid-points
+      ind_ValidTimeF = {ValidTimeF: ind for ind, ValidTimeF in enumerate(ValidTimeF_list)}
+      pos_GP = np.minimum(np.searchsorted(Ind_GP, events[:, 3]), len(Ind_GP) - 1)
+      In_Cache = np.isin(events[:, 0], ValidTimeF_list) & np.isin(events[:, 2], EFFCI_list) & (Ind_GP[pos_GP] == events[:, 3])
+      events_cache = events[In_Cache]
+
+      # Filling the cache
+      GridFR = np.zeros((len(ValidTimeF_list), len(EFFCI_list), len(Ind_GP)), dtype=np.uint8)
+      ind_Row = np.array([ind_ValidTimeF[ValidTimeF] for ValidTimeF in events_cache[:, 0]], dtype=np.int64)
+      ind_EFFCI = np.array([EFFCI_list.index(EFFCI) for EFFCI in events_cache[:, 2]], dtype=np.int64)
+      GridFR[ind_Row, ind_EFFCI, pos_GP[In_Cache]] = np.minimum(events_cache[:, 4], 255)
+
+      return {"GridFR": GridFR, "ind_ValidTimeF": ind_ValidTimeF, "Ind_GP": Ind_GP}
+
+
+# Gridded flood reports in the cache for a specific accumulation period, ending at ValidTimeF, with dimensions (NumEFFCI, NumGP_Cache)
+def GridFR_cache_lookup(cache, ValidTimeF):
+
+      ind = cache["ind_ValidTimeF"].get(int(ValidTimeF.strftime("%Y%m%d%H")))
+      if ind is None:
+            raise ValueError("The gridded flood reports for the accumulation period ending at " + ValidTimeF.strftime("%Y%m%d%H") + " are not in the cache.")
+
+      return cache["GridFR"][ind]
@@ -0,0 +1,76 @@
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Grid_Index.py contains the functions to assign point observations (e.g. the point flood reports) to the
+# nearest grid-points of a global grid, and to count them in each grid-box. The index of the grid is built
+# only once from the lat/lon coordinates of its grid-points (e.g. from the mask's geometry, see
+# "Scripts/Functions/Mask_Geometry.py"), and it is then used to find the nearest grid-points of any number
+# of points in one vectorized query, instead of one metview call per point.
+# The index works for the grids whose grid-points lie on latitude rows (i.e. regular lat/lon grids, and
+# regular or reduced Gaussian grids, such as the octahedral grid of ENS). The grid-points are sorted by
+# latitude row and longitude, so the grid-points around each point are found with one binary search. The
+# nearest grid-point is then chosen, by great-circle distance, among the two grid-points around the point's
+# longitude in the two rows around the point's latitude and in their neighbouring rows.
+##########################################################################################################
+
+
+# Creation of the index of a grid from the lat/lon coordinates of its grid-points
+# Note: the function returns a dictionary with the latitudes of the rows ("Lat_Row", in ascending order), the position of the
+# first grid-point of each row ("Start_Row") and the number of grid-points in each row ("NumGP_Row") in the sorted grid-points,
+# the sorting keys of the sorted grid-points ("Key", i.e. the row plus the longitude as a fraction of 360 degrees), their indexes
+# in the grid ("Ind_GP") and their lat/lon coordinates in radians ("Lat_Rad", "Lon_Rad").
+def create_grid_index(lats, lons):
+
+      lats = np.asarray(lats, dtype=float)
+      lons = np.mod(np.asarray(lons, dtype=float), 360)
+      Lat_Row, ind_Row = np.unique(lats, return_inverse=True)
+      Key = ind_Row + lons / 360
+      Ind_GP = np.argsort(Key, kind="stable")
+      NumGP_Row = np.bincount(ind_Row, minlength=len(Lat_Row))
+
+      grid_index = {
+            "Lat_Row": Lat_Row,
+            "Start_Row": np.concatenate(([0], np.cumsum(NumGP_Row)[:-1])),
+            "NumGP_Row": NumGP_Row,
+            "Key": Key[Ind_GP],
+            "Ind_GP": Ind_GP,
+            "Lat_Rad": np.radians(lats[Ind_GP]),
+            "Lon_Rad": np.radians(lons[Ind_GP])
+            }
+
+      return grid_index
+
+
+# Indexes, in the grid, of the grid-points nearest to the considered points
+def grid_index_nearest(grid_index, lats, lons):
+
+      lats = np.asarray(lats, dtype=float)
+      lons = np.mod(np.asarray(lons, dtype=float), 360)
+      NumRow = len(grid_index["Lat_Row"])
+      Lat_Rad = np.radians(lats)[:, np.newaxis]
+      Lon_Rad = np.radians(lons)[:, np.newaxis]
+
+      # Selecting, as candidates, the two grid-points around the points' longitudes in the two rows around the points' latitudes and in their neighbouring rows
+      Row_Above = np.searchsorted(grid_index["Lat_Row"], lats)
+      Row_list = [np.clip(Row_Above + Shift, 0, NumRow - 1) for Shift in [-2, -1, 0, 1]]
+      ind_cand = []
+      for Row in Row_list:
+            Start_Row = grid_index["Start_Row"][Row]
+            NumGP_Row = grid_index["NumGP_Row"][Row]
+            pos_Row = np.searchsorted(grid_index["Key"], Row + lons / 360) - Start_Row
+            ind_cand.append(Start_Row + np.mod(pos_Row - 1, NumGP_Row))
+            ind_cand.append(Start_Row + np.mod(pos_Row, NumGP_Row))
+      ind_cand = np.stack(ind_cand, axis=1)
+
+      # Selecting the candidates with the smallest great-circle distance (i.e. the largest cosine of the angle between the points)
+      cos_angle = np.sin(Lat_Rad) * np.sin(grid_index["Lat_Rad"][ind_cand]) + np.cos(Lat_Rad) * np.cos(grid_index["Lat_Rad"][ind_cand]) * np.cos(Lon_Rad - grid_index["Lon_Rad"][ind_cand])
+      ind_nearest = ind_cand[np.arange(ind_cand.shape[0]), np.argmax(cos_angle, axis=1)]
+
+      return grid_index["Ind_GP"][ind_nearest]
+
+
+# Number of points in each grid-box of a grid with NumGP grid-points, from the indexes of their nearest grid-points
+def grid_index_counts(Ind_GP_points, NumGP):
+
+      return np.bincount(np.asarray(Ind_GP_points, dtype=np.int64), minlength=NumGP).astype(float)
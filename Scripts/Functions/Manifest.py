@@ -0,0 +1,96 @@
+import os
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Manifest.py contains the functions to make the long compute stages resumable. A work-unit manifest is a
+# text file that records, one per line, the keys of the work units completed by a stage (e.g. "ENS|072|
+# 2020010100" for a (system, step, date) unit). Each line is appended with a single write and synced to
+# disk, so a crash leaves at most one incomplete last line, which is ignored when the manifest is read.
+# Different processes can append to the same manifest at the same time. A restarted run skips the units
+# recorded in the manifest and redoes only the others.
+# The stages that accumulate results over many units (e.g. sums over the runs) also save checkpoints, i.e.
+# .npz files with their partial results, which are replaced atomically so that they are never partial.
+##########################################################################################################
+
+
+# Key of a work unit, built from the values that identify it
+def unit_key(*values):
+
+      return "|".join([str(value) for value in values])
+
+
+# Reading the keys of the work units already completed
+# Note: an empty set is returned if the manifest does not exist (i.e. no unit was completed).
+def read_manifest(FileManifest):
+
+      if not os.path.isfile(FileManifest):
+            return set()
+
+      with open(FileManifest) as f:
+            lines = f.read().split("\n")
+
+      return set(lines[:-1]) # the last element is empty, or an incomplete line if the run crashed while writing it
+
+
+# Recording in the manifest the keys of the completed work units
+def mark_units_done(FileManifest, UnitKey_list):
+
+      if len(UnitKey_list) == 0:
+            return
+
+      if not os.path.exists(os.path.dirname(FileManifest)):
+            os.makedirs(os.path.dirname(FileManifest), exist_ok=True)
+
+      # Closing the incomplete last line left by a crashed run, if any
+      lines = "".join([UnitKey + "\n" for UnitKey in UnitKey_list])
+      if os.path.isfile(FileManifest) and os.path.getsize(FileManifest) > 0:
+            with open(FileManifest, "rb") as f:
+                  f.seek(-1, os.SEEK_END)
+                  if f.read(1) != b"\n":
+                        lines = "\n" + lines
+
+      fd = os.open(FileManifest, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+      try:
+            os.write(fd, lines.encode())
+            os.fsync(fd)
+      finally:
+            os.close(fd)
+
+
+# Removing the manifest, to start a stage from scratch
+def reset_manifest(FileManifest):
+
+      if os.path.isfile(FileManifest):
+            os.remove(FileManifest)
+
+
+# Saving the checkpoint of a stage (i.e. its partial results) atomically
+def save_checkpoint(FileCheckpoint, **arrays):
+
+      if not os.path.exists(os.path.dirname(FileCheckpoint)):
+            os.makedirs(os.path.dirname(FileCheckpoint), exist_ok=True)
+
+      with open(FileCheckpoint + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+      os.replace(FileCheckpoint + ".tmp", FileCheckpoint)
+
+
+# Reading the checkpoint of a stage
+# Note: None is returned if the checkpoint does not exist.
+def read_checkpoint(FileCheckpoint):
+
+      if not os.path.isfile(FileCheckpoint):
+            return None
+
+      with np.load(FileCheckpoint, allow_pickle=False) as checkpoint:
+            return {name: checkpoint[name] for name in checkpoint.files}
+
+
+# Removing the checkpoint of a stage (once its final results are saved, or to start it from scratch)
+def remove_checkpoint(FileCheckpoint):
+
+      if os.path.isfile(FileCheckpoint):
+            os.remove(FileCheckpoint)
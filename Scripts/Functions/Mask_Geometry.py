@@ -0,0 +1,98 @@
+import os
+import json
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Mask_Geometry.py contains the functions to write and read the geometry of the domain's mask. The geometry
+# is built only once from the mask's .grib file (see "Scripts/Raw/Create_Mask_Geometry.py"), and contains,
+# for the global fields, the values of the mask and the lat/lon coordinates of the grid-points, and, for
+# each region, its grid-points' indexes, its boolean mask, the lat/lon coordinates of its grid-points and
+# its bounding box. Each array is saved as a .npy file, together with a small .json metadata sidecar, and
+# is read as a memory-mapped array, so the compute stages load the geometry without decoding the .grib
+# file and without scanning the global fields to find the grid-points of each region.
+##########################################################################################################
+
+
+# Name of the files containing an array of the mask's geometry and its metadata
+def mask_geometry_filename(DirGeo, Name):
+
+      return DirGeo + "/" + Name + ".npy"
+
+
+# Creation of the mask's geometry on disk
+# Note: mask, lats and lons contain the values of the domain's mask and the coordinates of the grid-points for the global fields.
+# The regions are identified by the positive values in the mask. The bounding boxes are defined as [N, W, S, E].
+def create_mask_geometry(DirGeo, mask, lats, lons):
+
+      if not os.path.exists(DirGeo):
+            os.makedirs(DirGeo)
+
+      mask = np.asarray(mask)
+      lats = np.asarray(lats)
+      lons = np.asarray(lons)
+      RegionCode_list = [int(RegionCode) for RegionCode in np.unique(mask[mask > 0])]
+
+      # Saving the arrays for the global fields
+      np.save(mask_geometry_filename(DirGeo, "Mask"), mask)
+      np.save(mask_geometry_filename(DirGeo, "Lat"), lats)
+      np.save(mask_geometry_filename(DirGeo, "Lon"), lons)
+
+      # Saving the arrays for a specific region
+      BBox = {}
+      for RegionCode in RegionCode_list:
+            Is_Region = (mask == RegionCode)
+            Ind_GP = np.where(Is_Region)[0]
+            np.save(mask_geometry_filename(DirGeo, "Is_Region" + f"{RegionCode:02d}"), Is_Region)
+            np.save(mask_geometry_filename(DirGeo, "Ind_GP_Region" + f"{RegionCode:02d}"), Ind_GP)
+            np.save(mask_geometry_filename(DirGeo, "Lat_Region" + f"{RegionCode:02d}"), lats[Ind_GP])
+            np.save(mask_geometry_filename(DirGeo, "Lon_Region" + f"{RegionCode:02d}"), lons[Ind_GP])
+            BBox[str(RegionCode)] = [float(np.max(lats[Ind_GP])), float(np.min(lons[Ind_GP])), float(np.min(lats[Ind_GP])), float(np.max(lons[Ind_GP]))]
+
+      # Saving the metadata
+      # Note: the metadata is saved last, so a geometry whose metadata exists is always complete.
+      meta = {
+            "NumGP": int(mask.shape[0]),
+            "RegionCode": RegionCode_list,
+            "BBox": BBox
+            }
+      with open(DirGeo + "/Mask_Geometry.json.tmp", "w") as f:
+            json.dump(meta, f)
+      os.replace(DirGeo + "/Mask_Geometry.json.tmp", DirGeo + "/Mask_Geometry.json")
+
+
+# Reading the mask's geometry
+# Note: the function returns a dictionary with the global arrays ("Mask", "Lat", "Lon"), the number of grid-points ("NumGP"),
+# the codes of the regions ("RegionCode"), and dictionaries indexed by the region codes for the regions' arrays ("Is_Region",
+# "Ind_GP", "Lat_Region", "Lon_Region") and bounding boxes ("BBox").
+def read_mask_geometry(DirGeo):
+
+      with open(DirGeo + "/Mask_Geometry.json") as f:
+            meta = json.load(f)
+
+      geo = {
+            "NumGP": meta["NumGP"],
+            "RegionCode": meta["RegionCode"],
+            "Mask": np.load(mask_geometry_filename(DirGeo, "Mask"), mmap_mode="r"),
+            "Lat": np.load(mask_geometry_filename(DirGeo, "Lat"), mmap_mode="r"),
+            "Lon": np.load(mask_geometry_filename(DirGeo, "Lon"), mmap_mode="r"),
+            "Is_Region": {},
+            "Ind_GP": {},
+            "Lat_Region": {},
+            "Lon_Region": {},
+            "BBox": {}
+            }
+      for RegionCode in meta["RegionCode"]:
+            geo["Is_Region"][RegionCode] = np.load(mask_geometry_filename(DirGeo, "Is_Region" + f"{RegionCode:02d}"), mmap_mode="r")
+            geo["Ind_GP"][RegionCode] = np.load(mask_geometry_filename(DirGeo, "Ind_GP_Region" + f"{RegionCode:02d}"), mmap_mode="r")
+            geo["Lat_Region"][RegionCode] = np.load(mask_geometry_filename(DirGeo, "Lat_Region" + f"{RegionCode:02d}"), mmap_mode="r")
+            geo["Lon_Region"][RegionCode] = np.load(mask_geometry_filename(DirGeo, "Lon_Region" + f"{RegionCode:02d}"), mmap_mode="r")
+            geo["BBox"][RegionCode] = meta["BBox"][str(RegionCode)]
+
+      return geo
+
+
+# Indexes, in the global fields, of the grid-points belonging to the considered regions
+def mask_geometry_index(geo, RegionCode_list):
+
+      return np.sort(np.concatenate([np.asarray(geo["Ind_GP"][RegionCode]) for RegionCode in RegionCode_list]))
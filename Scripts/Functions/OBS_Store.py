@@ -0,0 +1,114 @@
+import os
+import json
+from datetime import datetime, timedelta
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# OBS_Store.py contains the functions to write and read the observation store, i.e. the rainfall
+# observations from rain gauges in the regions of the domain's mask, ingested only once from the raw
+# geopoints files (see "06_Compute_Extract_RainObs_Region_AccPer.py"). The store is columnar: each column
+# is saved as a .npy file, i.e. the end of the accumulation period ("ValidTime", as an integer in the
+# format YYYYMMDDHH), the region code ("Region"), the station ("Station", i.e. the position of the station's
+# identifier in the metadata), the lat/lon coordinates ("Lat", "Lon") and the rainfall value ("Value"),
+# together with a small .json metadata sidecar that contains the accumulation, the accumulation periods
+# ingested and the stations' identifiers. The observations are sorted by end of the accumulation period,
+# so the observations for a period of time are a contiguous slice of the store, found with two binary
+# searches (np.searchsorted), and the consumers read only the columns they need as memory-mapped arrays.
+##########################################################################################################
+
+
+# Columns of the observation store and their types
+OBS_store_columns = {"ValidTime": np.int64, "Region": np.int8, "Station": np.int32, "Lat": np.float64, "Lon": np.float64, "Value": np.float64}
+
+
+# Name of the files containing a column of the observation store and its metadata
+def OBS_store_filename(DirStore, Acc, Column=None):
+
+      FileName = DirStore + "/" + f"{Acc:02d}" + "h/OBS_Store_" + f"{Acc:02d}" + "h"
+      if Column is None:
+            return FileName + ".json"
+
+      return FileName + "_" + Column + ".npy"
+
+
+# Creation of the observation store on disk
+# Note: obs contains the arrays of each column in OBS_store_columns, ValidTime_list the accumulation periods ingested (as
+# datetimes), and Station_list the stations' identifiers. The observations are sorted by end of the accumulation period (keeping
+# the order of the observations within each accumulation period). The metadata is saved last, so a store whose metadata exists
+# is always complete.
+def create_OBS_store(DirStore, Acc, obs, ValidTime_list, Station_list):
+
+      DirStore_Acc = os.path.dirname(OBS_store_filename(DirStore, Acc))
+      if not os.path.exists(DirStore_Acc):
+            os.makedirs(DirStore_Acc)
+
+      ind_sorted = np.argsort(np.asarray(obs["ValidTime"], dtype=np.int64), kind="stable")
+      for Column, dtype in OBS_store_columns.items():
+            np.save(OBS_store_filename(DirStore, Acc, Column), np.asarray(obs[Column], dtype=dtype)[ind_sorted])
+
+      meta = {
+            "Acc": int(Acc),
+            "Columns": list(OBS_store_columns.keys()),
+            "ValidTime": sorted([int(ValidTime.strftime("%Y%m%d%H")) for ValidTime in ValidTime_list]),
+            "Station": [str(Station) for Station in Station_list],
+            "NumObs": int(len(ind_sorted))
+            }
+      FileMeta = OBS_store_filename(DirStore, Acc)
+      with open(FileMeta + ".tmp", "w") as f:
+            json.dump(meta, f)
+      os.replace(FileMeta + ".tmp", FileMeta)
+
+
+# Reading the observation store
+# Note: the function returns a dictionary with the memory-mapped columns in Column_list (all the columns if None) and the metadata.
+def read_OBS_store(DirStore, Acc, Column_list=None):
+
+      with open(OBS_store_filename(DirStore, Acc)) as f:
+            meta = json.load(f)
+      if Column_list is None:
+            Column_list = meta["Columns"]
+
+      obs_store = {Column: np.load(OBS_store_filename(DirStore, Acc, Column), mmap_mode="r") for Column in set(Column_list) | {"ValidTime"}}
+      obs_store["meta"] = meta
+
+      return obs_store
+
+
+# Positions, in the store, of the observations for the accumulation periods ending between ValidTimeS and ValidTimeF (both included)
+# Note: only the accumulation periods ending at the hours in Hour_list (if provided), and the observations in the region RegionCode
+# (if provided) are selected. The function raises an error if some of the selected accumulation periods were not ingested (e.g.
+# because their raw files were missing), i.e. if any day between ValidTimeS and ValidTimeF has no accumulation period ingested at
+# one of the hours in Hour_list (or at one of the hours ingested in the store, if Hour_list is None).
+def OBS_store_select(obs_store, ValidTimeS, ValidTimeF, Hour_list=None, RegionCode=None):
+
+      ValidTime_Ingested = np.asarray(obs_store["meta"]["ValidTime"], dtype=np.int64)
+      if len(ValidTime_Ingested) == 0:
+            raise ValueError("No accumulation period was ingested in the observation store.")
+
+      # Checking that all the selected accumulation periods were ingested
+      Hour_Expected = Hour_list if Hour_list is not None else np.unique(ValidTime_Ingested % 100).tolist()
+      ValidTime_Expected = []
+      Day = datetime(ValidTimeS.year, ValidTimeS.month, ValidTimeS.day)
+      while Day <= ValidTimeF:
+            for Hour in Hour_Expected:
+                  ValidTime = Day + timedelta(hours=int(Hour))
+                  if ValidTimeS <= ValidTime <= ValidTimeF:
+                        ValidTime_Expected.append(int(ValidTime.strftime("%Y%m%d%H")))
+            Day += timedelta(days=1)
+      ValidTime_Expected = np.array(sorted(ValidTime_Expected), dtype=np.int64)
+      ValidTime_Missing = ValidTime_Expected[~np.isin(ValidTime_Expected, ValidTime_Ingested)]
+      if len(ValidTime_Missing) != 0:
+            raise ValueError(str(len(ValidTime_Missing)) + " of the accumulation periods ending between " + ValidTimeS.strftime("%Y%m%d%H") + " and " + ValidTimeF.strftime("%Y%m%d%H") + " were not ingested in the observation store (the first one ends at " + str(ValidTime_Missing[0]) + ").")
+
+      ValidTimeS = int(ValidTimeS.strftime("%Y%m%d%H"))
+      ValidTimeF = int(ValidTimeF.strftime("%Y%m%d%H"))
+      Start = np.searchsorted(obs_store["ValidTime"], ValidTimeS, side="left")
+      End = np.searchsorted(obs_store["ValidTime"], ValidTimeF, side="right")
+      ind = np.arange(Start, End)
+      if Hour_list is not None:
+            ind = ind[np.isin(np.asarray(obs_store["ValidTime"][Start:End]) % 100, Hour_list)]
+      if RegionCode is not None:
+            ind = ind[np.asarray(obs_store["Region"][ind]) == RegionCode]
+
+      return ind
@@ -0,0 +1,262 @@
+import os
+import glob
+import json
+import shutil
+import fcntl
+from datetime import datetime, timedelta
+import numpy as np
+
+from CT_Store import CT_store_filename, CT_store_shape, read_CT_store_year, create_store_files
+from Bootstrap import bootstrap_daily_transform, bootstrap_CI_replicates
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Online_Bootstrap.py contains the functions to bootstrap the daily scores while they are computed by the
+# fused verification pass (see "Scripts/Functions/Verif_Pass.py"), instead of reading them back from the
+# stores of daily scores once they are all computed (see "Scripts/Functions/Bootstrap.py"). Each daily
+# value is added, as soon as it is computed, to RepetitionsBS replicate accumulators, weighted by Poisson(1)
+# weights (i.e. the Poisson bootstrap, where each day is drawn a Poisson(1) number of times in each replicate
+# instead of a multinomial one). The first accumulator has all weights equal to 1, i.e. it contains the
+# original totals. The weights of a day depend only on the seed and on the day, so they are shared by all
+# the steps, scores, EFFCI indexes, VRTs, regions and forecasting systems (i.e. the bootstrapped values are
+# paired), and they do not depend on the order in which the days are computed.
+# The accumulators mirror the stores of daily scores: one memory-mapped int64 array with dimensions
+# (NumStepF, RepetitionsBS+1, ...) per score, EFFCI index, VRT, forecasting system, region and year, with a
+# boolean array with dimensions (NumDays, NumStepF) that indicates which daily values were already added (so
+# that a daily value is never added twice, e.g. when a run is resumed), and a small .json metadata sidecar. Each
+# update is journaled (only the day and the steps) before the accumulators are changed, and the steps of an
+# interrupted update are rebuilt from the stores of daily scores, so the accumulators and the days added always
+# agree (see update_online_bootstrap).
+# Since the Poisson weights of different days are independent, the accumulators of different years can be
+# added, and new days can be added to the accumulators at any time (e.g. daily updates of the confidence
+# intervals). The accumulators are updated under a file lock, so different processes can add different
+# days of the same accumulators at the same time.
+##########################################################################################################
+
+
+# Poisson(1) weights of a day for the RepetitionsBS replicates, preceded by the weight of the original totals (i.e. 1)
+def online_bootstrap_weights(BaseDateTime, RepetitionsBS, SeedBS):
+
+      rng = np.random.default_rng([SeedBS, int(BaseDateTime.strftime("%Y%m%d%H"))])
+      weights = np.ones(RepetitionsBS + 1, dtype=np.int64)
+      weights[1:] = rng.poisson(1, size=RepetitionsBS)
+
+      return weights
+
+
+# Name of the files containing the accumulators, the days already added and their metadata
+def online_bootstrap_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, RepetitionsBS, SeedBS):
+
+      FileCT, FileValid, FileMeta = CT_store_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year)
+      FileName = os.path.dirname(FileCT) + "/OnlineBS/" + os.path.basename(FileCT)[:-4] + "_Rep" + str(RepetitionsBS) + "_Seed" + str(SeedBS)
+
+      return FileName + ".npy", FileName + "_Added.npy", FileName + ".json"
+
+
+
+# Number of replicates of the accumulators filled with the seed SeedBS, read from their metadata
+# Note: the number of replicates is part of the name of the accumulators, so it is read from the only accumulators with the seed
+# SeedBS (e.g. the ones filled by "19_Compute_Daily_Prob_Contingency_Tables.py" with RepetitionsOnlineBS replicates).
+def online_bootstrap_repetitions(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, SeedBS):
+
+      FileAcc, FileAdded, FileMeta = online_bootstrap_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, "*", SeedBS)
+      FileMeta_list = sorted(glob.glob(FileMeta))
+      if len(FileMeta_list) != 1:
+            raise ValueError(str(len(FileMeta_list)) + " online bootstraps with seed " + str(SeedBS) + " exist for " + os.path.basename(FileAcc)[:-4].replace("_Rep*", "") + " (one was expected). Run the fused verification pass with the online bootstrap, or remove the unused ones.")
+      with open(FileMeta_list[0]) as f:
+            meta = json.load(f)
+
+      return int(meta["RepetitionsBS"])
+
+# Opening the accumulators for writing (they are created, filled with zeros and with no days added, if they do not exist)
+# Note: the accumulators are created by only one process (see create_store_files in "Scripts/Functions/CT_Store.py"). When they
+# are opened for writing, an update interrupted before completing is rolled back (see rollback_online_bootstrap).
+def open_online_bootstrap(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, BaseTime, StepF_list, NumEM, RepetitionsBS, SeedBS, mode="r+"):
+
+      FileAcc, FileAdded, FileMeta = online_bootstrap_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, RepetitionsBS, SeedBS)
+
+      if not os.path.isfile(FileMeta):
+
+            # Creating the list of days in the considered year
+            BaseDateTime_list = []
+            BaseDateTime = datetime(Year,1,1) + timedelta(hours=BaseTime)
+            while BaseDateTime.year == Year:
+                  BaseDateTime_list.append(BaseDateTime)
+                  BaseDateTime += timedelta(days=1)
+
+            # Creating the memory-mapped arrays and the metadata
+            meta = {
+                  "Score": Score,
+                  "Acc": int(Acc),
+                  "EFFCI": int(EFFCI),
+                  "VRT": int(MagnitudeInPerc_Rain_Event_FR),
+                  "SystemFC": SystemFC,
+                  "RegionName": RegionName,
+                  "BaseDateTime": [BaseDateTime.strftime("%Y%m%d%H") for BaseDateTime in BaseDateTime_list],
+                  "StepF": [int(StepF) for StepF in StepF_list],
+                  "NumEM": int(NumEM),
+                  "RepetitionsBS": int(RepetitionsBS),
+                  "SeedBS": int(SeedBS)
+                  }
+            shape_acc = (len(StepF_list), RepetitionsBS + 1) + CT_store_shape(Score, NumEM)
+            shape_Added = (len(BaseDateTime_list), len(StepF_list))
+            create_store_files([FileAcc, FileAdded], [np.int64, bool], [shape_acc, shape_Added], FileMeta, meta)
+
+      with open(FileMeta) as f:
+            meta = json.load(f)
+      acc = np.load(FileAcc, mmap_mode=mode)
+      Added = np.load(FileAdded, mmap_mode=mode)
+
+      # Adding the look-up tables to find days and steps in the accumulators, the store of daily scores, the lock file and the journal of the updates
+      meta["ind_BaseDateTime"] = {BaseDateTimeSTR: ind for ind, BaseDateTimeSTR in enumerate(meta["BaseDateTime"])}
+      meta["ind_StepF"] = {StepF: ind for ind, StepF in enumerate(meta["StepF"])}
+      meta["DirStore"] = DirStore
+      meta["FileLock"] = FileAcc[:-4] + ".lock"
+      meta["FilePending"] = online_bootstrap_pending_filename(FileAcc)
+
+      # Rolling back an interrupted update
+      if mode == "r+":
+            with open(meta["FileLock"], "a") as f:
+                  fcntl.flock(f, fcntl.LOCK_EX)
+                  rollback_online_bootstrap(acc, Added, meta)
+                  fcntl.flock(f, fcntl.LOCK_UN)
+
+      return acc, Added, meta
+
+
+# Name of the journal of the update of the accumulators in progress
+def online_bootstrap_pending_filename(FileAcc):
+
+      return FileAcc[:-4] + "_Pending.npz"
+
+
+# Rolling back an update of the accumulators interrupted before completing (see update_online_bootstrap)
+# Note: the journal contains only the day and the steps of the update. The day is marked as not added for those steps, so it is
+# added again (only once) by the next update, and the accumulators of those steps are rebuilt from the daily values of the days
+# still marked as added, read from the store of daily scores (which is flushed to disk before the accumulators are updated), and
+# from their Poisson weights. The function must be called under the lock of the accumulators.
+def rollback_online_bootstrap(acc, Added, meta):
+
+      if not os.path.isfile(meta["FilePending"]):
+            return
+
+      with np.load(meta["FilePending"]) as pending:
+            ind_Day = int(pending["ind_Day"])
+            ind_StepF_acc = pending["ind_StepF"]
+      Added[ind_Day, ind_StepF_acc] = False
+
+      # Rebuilding the accumulators of the journaled steps
+      Year = int(meta["BaseDateTime"][0][:4])
+      ct, Valid, meta_store = read_CT_store_year(meta["DirStore"], meta["Score"], meta["Acc"], meta["EFFCI"], meta["VRT"], meta["SystemFC"], meta["RegionName"], Year)
+      NumElements = int(np.prod(acc.shape[2:]))
+      for ind_StepF_acc_temp in ind_StepF_acc:
+            ind_Day_acc = np.where(Added[:, ind_StepF_acc_temp])[0]
+            ind_Day_store = np.array([meta_store["ind_BaseDateTime"][meta["BaseDateTime"][ind]] for ind in ind_Day_acc], dtype=np.int64)
+            ind_StepF_store = meta_store["ind_StepF"][meta["StepF"][ind_StepF_acc_temp]]
+            if not np.all(Valid[ind_Day_store, ind_StepF_store]):
+                  raise ValueError("The days added to the online bootstrap for " + os.path.basename(meta["FilePending"])[:-12] + " are not all in the store of daily scores. Remove the online bootstrap and run the fused verification pass again.")
+            weights = np.array([online_bootstrap_weights(datetime.strptime(meta["BaseDateTime"][ind], "%Y%m%d%H"), meta["RepetitionsBS"], meta["SeedBS"]) for ind in ind_Day_acc], dtype=np.int64).reshape(len(ind_Day_acc), acc.shape[1])
+            values_days = bootstrap_daily_transform(meta["Score"], ct[ind_Day_store, ind_StepF_store], meta["NumEM"]).astype(np.int64).reshape(len(ind_Day_acc), NumElements)
+            acc[ind_StepF_acc_temp] = (weights.T @ values_days).reshape(acc.shape[1:])
+      acc.flush()
+      Added.flush()
+      os.remove(meta["FilePending"])
+
+
+# Adding the daily values of a run (one per step in StepF_list, with dimensions (NumStepF, ...)) to the accumulators
+# Note: the daily values already added (e.g. by a previous run that was interrupted before recording its work units) are not
+# added again. Before the accumulators are changed, the day and the steps to update are saved in a small journal, which is moved
+# to its final name atomically and removed only once the accumulators and the days added are both flushed to disk. If the update
+# is interrupted in between, the journal is used to roll it back (see rollback_online_bootstrap), so a daily value is never added
+# twice nor recorded as added without being added.
+def update_online_bootstrap(acc_store, BaseDateTime, StepF_list, values_steps):
+
+      acc, Added, meta = acc_store
+      ind_Day = meta["ind_BaseDateTime"][BaseDateTime.strftime("%Y%m%d%H")]
+      weights = online_bootstrap_weights(BaseDateTime, meta["RepetitionsBS"], meta["SeedBS"])
+      values_steps = bootstrap_daily_transform(meta["Score"], values_steps, meta["NumEM"]).astype(np.int64)
+
+      with open(meta["FileLock"], "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            rollback_online_bootstrap(acc, Added, meta)
+
+            # Selecting the steps whose daily values were not added yet
+            indStepF_new = [indStepF for indStepF in range(len(StepF_list)) if not Added[ind_Day, meta["ind_StepF"][StepF_list[indStepF]]]]
+            ind_StepF_acc = np.array([meta["ind_StepF"][StepF_list[indStepF]] for indStepF in indStepF_new], dtype=np.int64)
+
+            if len(indStepF_new) > 0:
+
+                  # Saving the journal of the update
+                  FilePending_temp = meta["FilePending"][:-4] + "." + str(os.getpid()) + ".tmp.npz"
+                  np.savez(FilePending_temp, ind_Day=ind_Day, ind_StepF=ind_StepF_acc)
+                  os.replace(FilePending_temp, meta["FilePending"])
+
+                  # Adding the daily values to the accumulators
+                  for indStepF, ind_StepF_acc_temp in zip(indStepF_new, ind_StepF_acc):
+                        acc[ind_StepF_acc_temp] += weights.reshape((-1,) + (1,) * (values_steps.ndim - 1)) * values_steps[indStepF]
+                        Added[ind_Day, ind_StepF_acc_temp] = True
+                  acc.flush()
+                  Added.flush()
+                  os.remove(meta["FilePending"])
+
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Removing all the accumulators of the scores stored in DirStore (e.g. to start the fused verification pass from scratch)
+def remove_online_bootstrap(DirStore, Acc):
+
+      DirAcc = DirStore + "/" + f"{Acc:02d}" + "h/OnlineBS"
+      if os.path.exists(DirAcc):
+            shutil.rmtree(DirAcc)
+
+
+# Original and bootstrapped totals between DateS and DateF, read from the accumulators
+# Note: the accumulators of the years between DateS and DateF are added. The days added to the accumulators must be exactly the
+# valid days between DateS and DateF in the stores of daily scores (i.e. the fused verification pass must have run over the same
+# period). The function returns the totals, with dimensions (RepetitionsBS+1, NumStepF, ...).
+def read_online_bootstrap(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, RepetitionsBS, SeedBS):
+
+      totals = None
+      for Year in range(DateS.year, DateF.year + 1):
+            FileAcc, FileAdded, FileMeta = online_bootstrap_filename(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year, RepetitionsBS, SeedBS)
+            if not os.path.isfile(FileMeta):
+                  raise ValueError("The online bootstrap for " + os.path.basename(FileAcc)[:-4] + " does not exist. Run the fused verification pass with the online bootstrap.")
+            if os.path.isfile(online_bootstrap_pending_filename(FileAcc)):
+                  raise ValueError("An update of the online bootstrap for " + os.path.basename(FileAcc)[:-4] + " was interrupted. Run the fused verification pass again (with Resume=True) to roll it back and complete it.")
+            with open(FileMeta) as f:
+                  meta = json.load(f)
+            acc = np.load(FileAcc, mmap_mode="r")
+            Added = np.load(FileAdded, mmap_mode="r")
+            ct, Valid, meta_store = read_CT_store_year(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, Year)
+
+            # Checking that the days added are the valid days in the considered period
+            ind_StepF_acc = [meta["StepF"].index(StepF) for StepF in StepF_list]
+            ind_StepF_store = [meta_store["ind_StepF"][StepF] for StepF in StepF_list]
+            InPeriod = np.array([DateS.strftime("%Y%m%d%H") <= BaseDateTimeSTR <= DateF.strftime("%Y%m%d%H") for BaseDateTimeSTR in meta["BaseDateTime"]])
+            Added_steps = np.asarray(Added[:, ind_StepF_acc])
+            if np.any(Added_steps[~InPeriod]) or not np.array_equal(Added_steps[InPeriod], np.asarray(Valid[InPeriod][:, ind_StepF_store])):
+                  raise ValueError("The days added to the online bootstrap for " + os.path.basename(FileAcc)[:-4] + " are not the valid days between " + DateS.strftime("%Y%m%d") + " and " + DateF.strftime("%Y%m%d") + ".")
+
+            acc_steps = np.asarray(acc[ind_StepF_acc])
+            totals = acc_steps if totals is None else totals + acc_steps
+
+      return np.moveaxis(totals, 1, 0)
+
+
+# Original and bootstrapped scores for a partition (forecasting system, EFFCI index, VRT and region), from the accumulators
+# Note: args is as in bootstrap_store (see "Scripts/Functions/Bootstrap.py"), so the two functions can be swapped. The resampling
+# plan, the memory budget and the tolerance for stopping early are not used, since the bootstrapped totals are already computed.
+# If Perc_CI is None, the function returns all the scores, with dimensions (NumStepF, RepetitionsBS+1). Otherwise, it returns the
+# original score and the percentiles of the bootstrapped scores, with dimensions (NumStepF, 1+NumPerc), the number of replicates,
+# and the Monte-Carlo errors of the percentiles, with dimensions (NumStepF, NumPerc).
+def online_bootstrap_store(args):
+
+      DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, NumEM, stat_func, DirPlan, RepetitionsBS, SeedBS, MemoryBS_MB, Perc_CI, ToleranceBS = args
+      totals = read_online_bootstrap(DirStore, Score, Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, RepetitionsBS, SeedBS)
+      stat = stat_func(totals.astype(float))
+      if Perc_CI is None:
+            return stat.T
+
+      perc_CI, MC_error = bootstrap_CI_replicates(stat[1:], Perc_CI)
+
+      return np.concatenate((stat[:1], perc_CI), axis=0).T, RepetitionsBS, MC_error.T
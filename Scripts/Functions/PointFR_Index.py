@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+##########################################################################################################
+# CODE DESCRIPTION
+# PointFR_Index.py contains the functions to build and query the index of the point flood reports. The index
+# sorts the point flood reports by report time (in UTC) only once, and keeps the columns needed by the
+# compute stages as compact arrays (report time, EFFCI index, region code and lat/lon coordinates). The point
+# flood reports in an accumulation window [WindowS, WindowF) are then a contiguous slice of the index, found
+# with two binary searches (np.searchsorted), instead of two comparisons over the whole database for each
+# window. Any number of windows, of any length and offset (e.g. 6-, 12- or 24-hourly, or sliding windows),
+# can be enumerated in one pass.
+##########################################################################################################
+
+
+# Creation of the index of the point flood reports from the cleaned point flood reports (see "01_Compute_Clean_PointFR.py")
+# Note: the function returns a dictionary with the report times ("Time"), EFFCI indexes ("EFFCI"), region codes ("Region", i.e.
+# the positions of the regions' names in "RegionName_list"), lat/lon coordinates ("Lat", "Lon") and rows in the original
+# database ("Ind_Row") of the point flood reports, sorted by report time.
+def create_PointFR_index(PointFR):
+
+      Time = pd.to_datetime(PointFR["ReportDateTimeUTC"]).to_numpy().astype("datetime64[s]")
+      ind_sorted = np.argsort(Time, kind="stable")
+      Region, RegionName_list = pd.factorize(PointFR["Georegion"].to_numpy()[ind_sorted], sort=True)
+
+      PointFR_index = {
+            "Time": Time[ind_sorted],
+            "EFFCI": PointFR["EFFCI"].to_numpy().astype(np.int8)[ind_sorted],
+            "Region": Region.astype(np.int8),
+            "RegionName_list": list(RegionName_list),
+            "Lat": PointFR["Y_DD"].to_numpy(dtype=float)[ind_sorted],
+            "Lon": PointFR["X_DD"].to_numpy(dtype=float)[ind_sorted],
+            "Ind_Row": PointFR.index.to_numpy()[ind_sorted]
+            }
+
+      return PointFR_index
+
+
+# First and last+1 positions, in the index, of the point flood reports in the windows [WindowS, WindowF)
+# Note: WindowS and WindowF can be single times or arrays of times.
+def PointFR_window_bounds(PointFR_index, WindowS, WindowF):
+
+      Start = np.searchsorted(PointFR_index["Time"], np.asarray(WindowS, dtype="datetime64[s]"), side="left")
+      End = np.searchsorted(PointFR_index["Time"], np.asarray(WindowF, dtype="datetime64[s]"), side="left")
+
+      return Start, End
+
+
+# Positions, in the index, of the point flood reports in the window [WindowS, WindowF), with EFFCI index not smaller than EFFCI and in region RegionName (if provided)
+def PointFR_window_select(PointFR_index, WindowS, WindowF, EFFCI=None, RegionName=None):
+
+      Start, End = PointFR_window_bounds(PointFR_index, WindowS, WindowF)
+      ind = np.arange(Start, End)
+      if EFFCI is not None:
+            ind = ind[PointFR_index["EFFCI"][ind] >= EFFCI]
+      if RegionName is not None:
+            ind = ind[PointFR_index["Region"][ind] == PointFR_index["RegionName_list"].index(RegionName)]
+
+      return ind
+
+
+# All the (window, point flood report) pairs for the windows [WindowS_array, WindowF_array), enumerated in one pass
+# Note: the function returns the positions of the windows in WindowS_array and the positions of the point flood reports in the
+# index, ordered by window and by report time. The windows can overlap (e.g. sliding windows).
+def PointFR_windows(PointFR_index, WindowS_array, WindowF_array):
+
+      Start, End = PointFR_window_bounds(PointFR_index, WindowS_array, WindowF_array)
+      NumPointFR_Window = np.maximum(End - Start, 0)
+      ind_Window = np.repeat(np.arange(len(Start)), NumPointFR_Window)
+      ind_PointFR = np.arange(len(ind_Window)) - np.repeat(np.cumsum(NumPointFR_Window) - NumPointFR_Window, NumPointFR_Window) + np.repeat(Start, NumPointFR_Window)
+
+      return ind_Window, ind_PointFR
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Prob_CT.py contains the functions to compute daily probabilistic contingency tables. The tables have
+# dimensions (NumEM+1, 5), and their columns are:
+#     0: N. OF MEMBERS (AT LEAST) EXCEEDING VRT (from NumEM to 0)
+#     1: HITS
+#     2: FALSE ALARMS
+#     3: MISSES
+#     4: CORRECT NEGATIVES
+# The count of members exceeding the VRT is computed once per grid-point, and the counts are binned
+# separately for the grid-points with and without observed events. The reverse cumulative sums of the
+# two histograms provide the elements of the contingency tables for all the probability thresholds, so
+# the cost is O(NumGP + NumEM) instead of O(NumEM x NumGP).
+# The function daily_prob_ct_block evaluates one forecast field against the observations for many EFFCI
+# indexes, VRTs and regions in one call, returning the whole block of contingency tables. The function
+# daily_scores_block computes, from the same counts of members exceeding the VRTs, all the daily scores
+# requested by the fused verification pass (see "Scripts/Functions/Verif_Pass.py").
+##########################################################################################################
+
+
+# Computation of the contingency tables from the counts of members exceeding the VRTs
+# Note: count_members_exceeding_VRT has dimensions (..., NumGP), obs has dimensions that can be broadcast to those of 
+# count_members_exceeding_VRT (e.g. (NumGP) when all the tables share the same observations), and the returned tables 
+# have dimensions (..., NumEM+1, 5).
+def prob_ct_from_counts(count_members_exceeding_VRT, obs, NumEM):
+
+      count_members_exceeding_VRT = np.asarray(count_members_exceeding_VRT)
+      shape_batch = count_members_exceeding_VRT.shape[:-1]
+      NumGP = count_members_exceeding_VRT.shape[-1]
+      counts = count_members_exceeding_VRT.reshape((-1, NumGP))
+      NumBatch = counts.shape[0]
+
+      # Defining the grid-points with observed events ("yes" obs) and without observed events ("no" obs)
+      ind_obs_yes = np.broadcast_to((np.asarray(obs) > 0), count_members_exceeding_VRT.shape).reshape((NumBatch, NumGP))
+      ind_obs_no = np.broadcast_to((np.asarray(obs) == 0), count_members_exceeding_VRT.shape).reshape((NumBatch, NumGP))
+
+      # Binning the counts of members for the grid-points with and without observed events
+      # Note: each batch is shifted by (NumEM+1) bins so that all batches are binned in one call.
+      counts_shifted = counts + (np.arange(NumBatch) * (NumEM+1))[:,np.newaxis]
+      hist_obs_yes = np.bincount(counts_shifted[ind_obs_yes], minlength=NumBatch*(NumEM+1)).reshape((NumBatch, NumEM+1))
+      hist_obs_no = np.bincount(counts_shifted[ind_obs_no], minlength=NumBatch*(NumEM+1)).reshape((NumBatch, NumEM+1))
+
+      # Computing the number of grid-points with at least count_members members exceeding the VRT, for count_members from NumEM to 0
+      # Note: the reverse cumulative sum over the bins from NumEM to 0 gives directly the rows of the contingency tables.
+      hits = np.cumsum(hist_obs_yes[:,::-1], axis=1)
+      false_alarms = np.cumsum(hist_obs_no[:,::-1], axis=1)
+
+      # Building the contingency tables
+      ct = np.empty((NumBatch, NumEM+1, 5), dtype=int)
+      ct[:,:,0] = np.arange(NumEM, -1, -1) # N. OF MEMBERS (AT LEAST) EXCEEDING VRT
+      ct[:,:,1] = hits # HITS
+      ct[:,:,2] = false_alarms # FALSE ALARMS
+      ct[:,:,3] = np.count_nonzero(ind_obs_yes, axis=1)[:,np.newaxis] - hits # MISSES
+      ct[:,:,4] = np.count_nonzero(ind_obs_no, axis=1)[:,np.newaxis] - false_alarms # CORRECT NEGATIVES
+
+      return ct.reshape(shape_batch + (NumEM+1, 5))
+
+
+# Computation of the daily probabilistic contingency table for a single VRT
+# Note: tp has dimensions (NumEM, NumGP) and obs (NumGP).
+def daily_prob_ct(tp, obs, VRT, NumEM):
+
+      # Counting how many ensemble members exceed the VRT
+      count_members_exceeding_VRT = np.sum((tp >= VRT), axis=0)
+
+      return prob_ct_from_counts(count_members_exceeding_VRT, obs, NumEM)
+
+
+# Computation of the daily probabilistic contingency tables for many VRTs in one call
+# Note: tp has dimensions (NumEM, NumGP), obs (NumGP), and VRT_list (NumVRT). The returned tables have dimensions (NumVRT, NumEM+1, 5).
+def daily_prob_ct_multi_VRT(tp, obs, VRT_list, NumEM):
+
+      # Counting how many ensemble members exceed each VRT
+      VRT_array = np.asarray(VRT_list, dtype=float)
+      count_members_exceeding_VRT = np.sum((tp[np.newaxis,:,:] >= VRT_array[:,np.newaxis,np.newaxis]), axis=1)
+
+      return prob_ct_from_counts(count_members_exceeding_VRT, obs, NumEM)
+
+
+# Computation of the counts of members exceeding the VRTs for many EFFCI indexes, VRTs and regions
+# Note: tp has dimensions (NumEM, NumGP), VRT_array (NumEFFCI, NumReg, NumVRT) since the VRTs are defined by the climatology 
+# of each EFFCI index and region, and ind_region_fc_list contains the indexes of the grid-points in tp for each region. The 
+# function returns a list (one element per region) of counts with dimensions (NumEFFCI, NumVRT, NumGP_region).
+def count_members_exceeding_VRT_block(tp, VRT_array, ind_region_fc_list):
+
+      VRT_array = np.asarray(VRT_array, dtype=float)
+      count_members_exceeding_VRT_list = []
+      for indReg in range(len(ind_region_fc_list)):
+            tp_region = tp[:, ind_region_fc_list[indReg]]
+            VRT_region = VRT_array[:, indReg, :]
+            count_members_exceeding_VRT_list.append(np.sum((tp_region[np.newaxis,np.newaxis,:,:] >= VRT_region[:,:,np.newaxis,np.newaxis]), axis=2))
+      
+      return count_members_exceeding_VRT_list
+
+
+# Computation of the daily probabilistic contingency tables for many EFFCI indexes, VRTs and regions in one call
+# Note: tp has dimensions (NumEM, NumGP), obs_EFFCI (NumEFFCI, NumGP_obs) with the observations for all the EFFCI indexes 
+# stacked, VRT_array (NumEFFCI, NumReg, NumVRT), and ind_region_fc_list and ind_region_obs_list contain the indexes of the 
+# grid-points of each region in tp and obs_EFFCI. The returned tables have dimensions (NumEFFCI, NumVRT, NumReg, NumEM+1, 5).
+# If count_members_exceeding_VRT_list is provided (see count_members_exceeding_VRT_block), the counts are not recomputed.
+def daily_prob_ct_block(tp, obs_EFFCI, VRT_array, ind_region_fc_list, ind_region_obs_list, NumEM, count_members_exceeding_VRT_list=None):
+
+      if count_members_exceeding_VRT_list is None:
+            count_members_exceeding_VRT_list = count_members_exceeding_VRT_block(tp, VRT_array, ind_region_fc_list)
+
+      # Computing the contingency tables for all the EFFCI indexes and VRTs for a specific region
+      # Note: regions have different numbers of grid-points, so they are batched separately.
+      ct_block = np.empty((obs_EFFCI.shape[0], np.shape(VRT_array)[2], len(ind_region_fc_list), NumEM+1, 5), dtype=int)
+      for indReg in range(len(ind_region_fc_list)):
+            obs_region = obs_EFFCI[:, ind_region_obs_list[indReg]]
+            ct_block[:,:,indReg] = prob_ct_from_counts(count_members_exceeding_VRT_list[indReg], obs_region[:,np.newaxis,:], NumEM)
+
+      return ct_block
+
+
+# Computation of the counts of forecasts (all members and grid-points) and observations exceeding the VRTs for many EFFCI indexes, VRTs and regions
+# Note: the returned counts have dimensions (NumEFFCI, NumVRT, NumReg, 2), where the last dimension contains the counts for the forecasts and the observations.
+def count_fc_obs_block(obs_EFFCI, ind_region_obs_list, count_members_exceeding_VRT_list):
+
+      NumEFFCI, NumVRT = count_members_exceeding_VRT_list[0].shape[:2]
+      count_fc_obs = np.empty((NumEFFCI, NumVRT, len(ind_region_obs_list), 2), dtype=int)
+      for indReg in range(len(ind_region_obs_list)):
+            count_fc_obs[:,:,indReg,0] = np.sum(count_members_exceeding_VRT_list[indReg], axis=-1)
+            count_fc_obs[:,:,indReg,1] = np.sum(obs_EFFCI[:, ind_region_obs_list[indReg]] > 0, axis=-1)[:,np.newaxis]
+
+      return count_fc_obs
+
+
+# Computation of the frequency bias (FB) from the totals of the counts of yes-events in the forecasts and in the observations
+# Note: count_tot has dimensions (..., 2), where the last dimension contains the totals for the forecasts and the observations.
+def frequency_bias(count_tot):
+
+      with np.errstate(divide="ignore", invalid="ignore"):
+            return count_tot[..., 0] / count_tot[..., 1]
+
+
+# Computation of many daily scores for many EFFCI indexes, VRTs and regions from one forecast field
+# Note: the counts of members exceeding the VRTs are computed only once and shared by all the scores in Score_list. The
+# function returns a dictionary with the blocks of each score, with dimensions (NumEFFCI, NumVRT, NumReg, ...). To add a 
+# new daily score, add its computation here and its trailing dimensions in "Scripts/Functions/CT_Store.py" (CT_store_shape).
+def daily_scores_block(tp, obs_EFFCI, VRT_array, ind_region_fc_list, ind_region_obs_list, NumEM, Score_list):
+
+      count_members_exceeding_VRT_list = count_members_exceeding_VRT_block(tp, VRT_array, ind_region_fc_list)
+
+      scores_block = {}
+      for Score in Score_list:
+            if Score == "CT":
+                  scores_block[Score] = daily_prob_ct_block(tp, obs_EFFCI, VRT_array, ind_region_fc_list, ind_region_obs_list, NumEM, count_members_exceeding_VRT_list)[..., 1:] # the probability thresholds are stored in the metadata of the stores
+            elif Score == "Count_FC_OBS":
+                  scores_block[Score] = count_fc_obs_block(obs_EFFCI, ind_region_obs_list, count_members_exceeding_VRT_list)
+            else:
+                  raise ValueError("The score " + Score + " is not supported by the fused verification pass.")
+
+      return scores_block
+
+
+# Reading the verifying rainfall events (VRTs) from the climatology of rainfall events associated with flash floods
+# Note: the climatology is read only once for all the EFFCI indexes and regions. The returned VRTs have dimensions (NumEFFCI, NumReg, NumVRT).
+def read_VRT_array(DirIN_Climate_Rain_FR, Acc, EFFCI_list, RegionName_list, MagnitudeInPerc_Rain_Event_FR_list, Perc_VRT):
+
+      VRT_array = np.empty((len(EFFCI_list), len(RegionName_list), len(MagnitudeInPerc_Rain_Event_FR_list)))
+      for indEFFCI in range(len(EFFCI_list)):
+            EFFCI = EFFCI_list[indEFFCI]
+            for indReg in range(len(RegionName_list)):
+                  RegionName = RegionName_list[indReg]
+                  File_Rain_Climate_FR = DirIN_Climate_Rain_FR + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/Climate_Rain_FR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName + ".csv"
+                  climate_rain_FR = pd.read_csv(File_Rain_Climate_FR)
+                  for indVRT in range(len(MagnitudeInPerc_Rain_Event_FR_list)):
+                        MagnitudeInPerc_Rain_Event_FR = MagnitudeInPerc_Rain_Event_FR_list[indVRT]
+                        VRT_array[indEFFCI, indReg, indVRT] = climate_rain_FR["RainEvent_Magnitude_" + str(MagnitudeInPerc_Rain_Event_FR) + "th_Percentile"][Perc_VRT]
+
+      return VRT_array
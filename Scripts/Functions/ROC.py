@@ -0,0 +1,46 @@
+import numpy as np
+
+##########################################################################################################
+# CODE DESCRIPTION
+# ROC.py contains the functions to compute the ROC curves and the area under them (AROC) from probabilistic
+# contingency tables. The contingency tables can have any leading batch dimensions (e.g. bootstrapped
+# replicates, lead times, regions), with the last two dimensions being the probability thresholds (from
+# NumEM to 0 members exceeding the VRT, as in the "CT" stores, see "Scripts/Functions/CT_Store.py") and
+# the elements of the contingency tables (hits, false alarms, misses, correct negatives). Hit rates,
+# false alarm rates and AROC are computed for all the batch dimensions in one vectorized call.
+##########################################################################################################
+
+
+# Computation of the ROC curves, i.e. the hit rates (hr) and false alarm rates (far) for all the probability thresholds
+# Note: ct has dimensions (..., NumProbThr, NumElementsCT). The points (0,0) and (1,1) are added at the beginning and at the end
+# of the curves to ensure they are closed, so hr and far have dimensions (..., NumProbThr+2). The rates are NaN if there are no
+# observed events (hr) or no observed non-events (far).
+def roc_curve(ct):
+
+      ct = np.asarray(ct, dtype=float)
+      with np.errstate(divide="ignore", invalid="ignore"):
+            hr = ct[...,0] / (ct[...,0] + ct[...,2])
+            far = ct[...,1] / (ct[...,1] + ct[...,3])
+
+      # Adding the points (0,0) and (1,1)
+      pad = [(0,0)] * (hr.ndim - 1) + [(1,1)]
+      hr = np.pad(hr, pad, constant_values=(0,1))
+      far = np.pad(far, pad, constant_values=(0,1))
+
+      return hr, far
+
+
+# Computation of the area under the ROC curves, using the trapezoidal approximation
+# Note: the function returns hr, far (see roc_curve) and the unrounded AROC, with dimensions (...).
+def roc_aroc(ct):
+
+      hr, far = roc_curve(ct)
+      aroc = np.sum((hr[...,:-1] + hr[...,1:]) * (far[...,1:] - far[...,:-1]), axis=-1) / 2
+
+      return hr, far, aroc
+
+
+# Computation of the area under the ROC curves only (e.g. for the bootstrapped replicates)
+def AROC_trapezoidal(ct):
+
+      return roc_aroc(ct)[2]
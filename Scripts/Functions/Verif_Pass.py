@@ -0,0 +1,238 @@
+import time
+from datetime import timedelta
+from multiprocessing import Pool
+import numpy as np
+
+from FC_Cube import open_FC_cube, FC_cube_run_acc, FC_cube_region_index
+from Prob_CT import daily_scores_block
+from CT_Store import open_CT_store
+from Manifest import unit_key, read_manifest, mark_units_done
+from Online_Bootstrap import open_online_bootstrap, update_online_bootstrap
+from GridFR_Events import read_GridFR_events, GridFR_cache, GridFR_cache_lookup
+from Mask_Geometry import mask_geometry_index
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Verif_Pass.py contains the fused verification pass, i.e. the function that reads each input (forecast
+# runs, gridded flood reports, domain's mask and climatology of rainfall events associated with flash
+# floods) only once, and computes from it all the requested daily scores (e.g. the daily probabilistic
+# contingency tables of "19_Compute_Daily_Prob_Contingency_Tables.py" and the counts of forecasts and
+# observations exceeding the VRTs of "23_Compute_Counts_FC_OBS_Exceeding_VRT.py"). The daily scores are
+# saved in the stores of daily scores (see "Scripts/Functions/CT_Store.py").
+# To add a new daily score, add its computation in "Scripts/Functions/Prob_CT.py" (daily_scores_block) and
+# the trailing dimensions of its stores in "Scripts/Functions/CT_Store.py" (CT_store_shape).
+# The fused verification pass can also be run in parallel (see verif_pass_parallel). The work is divided in
+# shards, i.e. (forecasting system, steps, date range) units, that are run across a pool of local processes.
+# Since each shard writes different (day, step) elements of the same stores, the outputs are identical to
+# those of a serial run, whatever the order in which the shards complete.
+# The daily scores can also be bootstrapped while they are computed (see "Scripts/Functions/Online_Bootstrap.py"), 
+# so that the bootstrapped totals over the verification period are available at the end of the pass.
+##########################################################################################################
+
+
+# Opening the stores of daily scores for all the scores, EFFCI indexes, VRTs and regions for a specific forecasting system and year
+# Note: the stores are created if they do not exist. StepF_list contains all the steps stored in the stores.
+def open_verif_stores(Git_repo, SystemFC, Year, BaseTime, StepF_list, NumEM, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list):
+
+      stores = {}
+      for indScore in range(len(Score_list)):
+            for indEFFCI in range(len(EFFCI_list)):
+                  for indVRT in range(len(MagnitudeInPerc_Rain_Event_FR_list)):
+                        for indReg in range(len(RegionName_list)):
+                              stores[(Score_list[indScore], indEFFCI, indVRT, indReg)] = open_CT_store(Git_repo + "/" + DirOUT_Score_list[indScore], Score_list[indScore], Acc, EFFCI_list[indEFFCI], MagnitudeInPerc_Rain_Event_FR_list[indVRT], SystemFC, RegionName_list[indReg], Year, BaseTime, StepF_list, NumEM)
+
+      return stores
+
+
+# Opening the accumulators of the online bootstrap for all the scores, EFFCI indexes, VRTs and regions for a specific forecasting system and year
+# Note: OnlineBS contains the number of replicates and the seed of the online bootstrap (RepetitionsBS, SeedBS).
+def open_verif_online_bootstrap(Git_repo, SystemFC, Year, BaseTime, StepF_list, NumEM, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list, OnlineBS):
+
+      acc_stores = {}
+      for indScore in range(len(Score_list)):
+            for indEFFCI in range(len(EFFCI_list)):
+                  for indVRT in range(len(MagnitudeInPerc_Rain_Event_FR_list)):
+                        for indReg in range(len(RegionName_list)):
+                              acc_stores[(Score_list[indScore], indEFFCI, indVRT, indReg)] = open_online_bootstrap(Git_repo + "/" + DirOUT_Score_list[indScore], Score_list[indScore], Acc, EFFCI_list[indEFFCI], MagnitudeInPerc_Rain_Event_FR_list[indVRT], SystemFC, RegionName_list[indReg], Year, BaseTime, StepF_list, NumEM, OnlineBS[0], OnlineBS[1])
+
+      return acc_stores
+
+
+# Fused verification pass for a specific forecasting system over the runs between DateS and DateF
+# Note: mask_geo contains the geometry of the domain's mask (see "Scripts/Functions/Mask_Geometry.py"), VRT_array the VRTs with dimensions (NumEFFCI,
+# NumReg, NumVRT) (see read_VRT_array in "Scripts/Functions/Prob_CT.py"), and DirOUT_Score_list the relative paths of the
+# directories containing the stores for each score in Score_list. If only a subset of the steps is computed (e.g. in a 
+# shard), StepF_list_store contains all the steps stored in the stores. If FileManifest is provided, the (system, step, date) 
+# units already recorded in the work-unit manifest are skipped, and the completed units are recorded once the stores are 
+# flushed to disk (see "Scripts/Functions/Manifest.py"). If OnlineBS (RepetitionsBS, SeedBS) is provided, the daily scores of each
+# run are also added to the accumulators of the online bootstrap, before its work units are recorded (see 
+# "Scripts/Functions/Online_Bootstrap.py"). The function returns the number of forecast fields (i.e. run and step) processed.
+def verif_pass(Git_repo, SystemFC, DateS, DateF, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, StepF_list_store=None, FileManifest=None, OnlineBS=None):
+
+      if StepF_list_store is None:
+            StepF_list_store = StepF_list
+
+      # Reading the work units already completed
+      UnitKey_done = read_manifest(FileManifest) if FileManifest is not None else set()
+
+      # Opening the forecast cube for the considered forecasting system
+      cube, meta = open_FC_cube(Git_repo + "/" + DirIN_FC_Cube, SystemFC, Acc)
+
+      # Loading the gridded flood reports for all the accumulation periods of the considered runs and steps in memory
+      # Note: the gridded flood reports are loaded from their event table (see "Scripts/Functions/GridFR_Events.py") only for the 
+      # grid-boxes of the considered regions, so the observational fields are not read again for each run and step.
+      Ind_GP_Cache = mask_geometry_index(mask_geo, RegionCode_list)
+      GridFR_cache_pass = GridFR_cache(read_GridFR_events(Git_repo + "/" + DirIN_GridFR, Acc), DateS + timedelta(hours=min(StepF_list)), DateF + timedelta(hours=max(StepF_list)), EFFCI_list, Ind_GP_Cache)
+
+      # Selecting the grid-boxes belonging to the considered regions in the cache of the observational fields and in the forecast cube
+      ind_mask_region_list = [np.searchsorted(Ind_GP_Cache, mask_geo["Ind_GP"][RegionCode]) for RegionCode in RegionCode_list]
+      ind_cube_region_list = [FC_cube_region_index(meta, mask_geo, RegionCode) for RegionCode in RegionCode_list]
+
+      # Computing the daily scores for a specific forecast run
+      # Note: each run is read from the forecast cube only once, and all its accumulation periods are built in memory.
+      NumFields = 0
+      Year_stores = None
+      TheDate = DateS
+      while TheDate <= DateF:
+
+            print(" ")
+            print(" - Reading " + SystemFC + ", FC date: " + TheDate.strftime("%Y-%m-%d") + " at " + TheDate.strftime("%H") + " UTC")
+
+            # Selecting the steps not completed yet for the considered run
+            UnitKey_list = [unit_key(SystemFC, f"{StepF:03d}", TheDate.strftime("%Y%m%d%H")) for StepF in StepF_list]
+            if all([UnitKey in UnitKey_done for UnitKey in UnitKey_list]):
+                  print("   - NOTE: all the steps for this run were already completed.")
+                  TheDate += timedelta(days=1)
+                  continue
+
+            # Opening the stores of daily scores for the year of the considered run (they are created if they do not exist)
+            if Year_stores != TheDate.year:
+                  Year_stores = TheDate.year
+                  stores = open_verif_stores(Git_repo, SystemFC, TheDate.year, TheDate.hour, StepF_list_store, meta["NumEM"], Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list)
+                  if OnlineBS is not None:
+                        acc_stores = open_verif_online_bootstrap(Git_repo, SystemFC, TheDate.year, TheDate.hour, StepF_list_store, meta["NumEM"], Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list, OnlineBS)
+
+            # Reading the rainfall forecasts for all the accumulation periods of the considered run
+            # Note: the forecasts are extracted from the forecast cube as rainfall accumulated over the considered period, in mm.
+            tp_run, Avail_run = FC_cube_run_acc(cube, meta, TheDate, StepF_list, Acc)
+
+            # Computing the daily scores for a specific lead time
+            StepF_list_run = []
+            scores_block_list = []
+            for indStepF in range(len(StepF_list)):
+
+                  StepF = StepF_list[indStepF]
+                  if UnitKey_list[indStepF] in UnitKey_done:
+                        continue
+                  print("   - StepF=" + str(StepF))
+
+                  # Checking that the rainfall forecasts exist for the considered date. If not, the daily scores are not valid
+                  if Avail_run[indStepF]:
+
+                        # Selecting the rainfall forecasts for the considered lead time
+                        tp = tp_run[indStepF]
+                        NumFields += 1
+
+                        # Defining the valid time for the accumulation period
+                        ValidTimeF = TheDate + timedelta(hours=StepF)
+
+                        # Selecting the accumulated gridded flood reports for all the EFFCI indexes from the cache
+                        # Note: the accumulated gridded flood reports are identified by the end of the accumulated period.
+                        GridFR_EFFCI = GridFR_cache_lookup(GridFR_cache_pass, ValidTimeF)
+
+                        # Computing all the daily scores for all the EFFCI indexes, VRTs and regions in one call
+                        scores_block = daily_scores_block(tp, GridFR_EFFCI, VRT_array, ind_cube_region_list, ind_mask_region_list, meta["NumEM"], Score_list)
+                        StepF_list_run.append(StepF)
+                        scores_block_list.append(scores_block)
+
+                        # Saving the daily scores for a specific score, EFFCI index, VRT and region
+                        print("     - Saving " + ", ".join(Score_list) + " for all EFFCI indexes, VRTs and regions")
+                        for (Score, indEFFCI, indVRT, indReg), (score_store, Valid_store, meta_store) in stores.items():
+                              ind_Day = meta_store["ind_BaseDateTime"][TheDate.strftime("%Y%m%d%H")]
+                              ind_StepF_store = meta_store["ind_StepF"][StepF]
+                              score_store[ind_Day, ind_StepF_store] = scores_block[Score][indEFFCI, indVRT, indReg]
+                              Valid_store[ind_Day, ind_StepF_store] = True
+
+                  else:
+
+                        print("   - NOTE: the requested forecast is not present in the database.")
+
+            # Flushing the stores of daily scores to disk once the run has been processed
+            for (score_store, Valid_store, meta_store) in stores.values():
+                  score_store.flush()
+                  Valid_store.flush()
+
+            # Adding the daily scores of the run to the accumulators of the online bootstrap (for all the steps of the run at once)
+            if OnlineBS is not None and len(StepF_list_run) > 0:
+                  for (Score, indEFFCI, indVRT, indReg), acc_store in acc_stores.items():
+                        update_online_bootstrap(acc_store, TheDate, StepF_list_run, np.array([scores_block[Score][indEFFCI, indVRT, indReg] for scores_block in scores_block_list]))
+
+            # Recording the completed work units, once their daily scores are on disk
+            if FileManifest is not None:
+                  mark_units_done(FileManifest, [UnitKey for UnitKey in UnitKey_list if UnitKey not in UnitKey_done])
+
+            TheDate += timedelta(days=1)
+
+      return NumFields
+
+
+# Division of the fused verification pass into shards, i.e. (forecasting system, steps, date range) units
+# Note: each shard contains at most Shard_NumDays runs and Shard_NumStepF steps. The shards are listed in a deterministic order.
+def verif_pass_shards(SystemFC_list, DateS, DateF, StepF_list, Shard_NumDays, Shard_NumStepF):
+
+      shards = []
+      for SystemFC in SystemFC_list:
+            for indStepF in range(0, len(StepF_list), Shard_NumStepF):
+                  DateS_shard = DateS
+                  while DateS_shard <= DateF:
+                        DateF_shard = min(DateS_shard + timedelta(days=Shard_NumDays-1), DateF)
+                        shards.append((SystemFC, DateS_shard, DateF_shard, StepF_list[indStepF:indStepF+Shard_NumStepF]))
+                        DateS_shard = DateF_shard + timedelta(days=1)
+
+      return shards
+
+
+# Running the fused verification pass for a single shard
+# Note: the function is run in the processes of the pool, so it takes a single tuple with all the arguments. It returns the
+# shard, the number of forecast fields processed and the runtime (in seconds).
+def verif_pass_shard(args):
+
+      shard, Git_repo, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, FileManifest, OnlineBS = args
+      SystemFC, DateS_shard, DateF_shard, StepF_list_shard = shard
+
+      start = time.time()
+      NumFields = verif_pass(Git_repo, SystemFC, DateS_shard, DateF_shard, StepF_list_shard, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, StepF_list, FileManifest, OnlineBS)
+
+      return shard, NumFields, time.time() - start
+
+
+# Running the fused verification pass in parallel over NumProcesses local processes
+# Note: the stores of daily scores are created before starting the pool, so that the processes only write in them. Each
+# shard writes different (day, step) elements of the stores, so the outputs are the same as those of a serial run.
+def verif_pass_parallel(NumProcesses, Shard_NumDays, Shard_NumStepF, Git_repo, SystemFC_list, DateS, DateF, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, FileManifest=None, OnlineBS=None):
+
+      # Creating the stores of daily scores (and the accumulators of the online bootstrap) for all the forecasting systems and years
+      for SystemFC in SystemFC_list:
+            cube, meta = open_FC_cube(Git_repo + "/" + DirIN_FC_Cube, SystemFC, Acc)
+            for Year in range(DateS.year, DateF.year + 1):
+                  open_verif_stores(Git_repo, SystemFC, Year, DateS.hour, StepF_list, meta["NumEM"], Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list)
+                  if OnlineBS is not None:
+                        open_verif_online_bootstrap(Git_repo, SystemFC, Year, DateS.hour, StepF_list, meta["NumEM"], Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionName_list, Score_list, DirOUT_Score_list, OnlineBS)
+
+      # Dividing the work into shards
+      shards = verif_pass_shards(SystemFC_list, DateS, DateF, StepF_list, Shard_NumDays, Shard_NumStepF)
+      args_list = [(shard, Git_repo, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, FileManifest, OnlineBS) for shard in shards]
+      print(" ")
+      print("Running the fused verification pass in " + str(len(shards)) + " shards over " + str(NumProcesses) + " processes")
+
+      # Running the shards, and reporting the throughput of each shard
+      start = time.time()
+      NumFields_tot = 0
+      with Pool(processes=NumProcesses) as pool:
+            for shard, NumFields, runtime in pool.imap_unordered(verif_pass_shard, args_list):
+                  SystemFC, DateS_shard, DateF_shard, StepF_list_shard = shard
+                  NumFields_tot += NumFields
+                  print(" - Completed shard " + SystemFC + ", " + DateS_shard.strftime("%Y%m%d") + "-" + DateF_shard.strftime("%Y%m%d") + ", StepF=" + str(StepF_list_shard[0]) + "-" + str(StepF_list_shard[-1]) + ": " + str(NumFields) + " forecast fields in " + str(round(runtime)) + " s (" + str(round(NumFields / max(runtime, 1e-6), 2)) + " fields/s)")
+      runtime = time.time() - start
+      print(" ")
+      print("Fused verification pass completed: " + str(NumFields_tot) + " forecast fields in " + str(round(runtime)) + " s (" + str(round(NumFields_tot / max(runtime, 1e-6), 2)) + " fields/s)")
@@ -0,0 +1,331 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Prob_CT import prob_ct_from_counts, daily_prob_ct, daily_prob_ct_multi_VRT, daily_prob_ct_block
+from CT_Store import open_CT_store
+from Bootstrap import bootstrap_blocks, bootstrap_percentiles_weighted, bootstrap_percentiles_block, bootstrap_store, bootstrap_CI_percentiles, run_bootstrap_tasks, CI_sketch, update_CI_sketch, CI_sketch_percentiles, CI_sketch_MC_error, bootstrap_apply, bootstrap_apply_CI
+from Online_Bootstrap import online_bootstrap_weights, open_online_bootstrap, update_online_bootstrap
+from ROC import AROC_trapezoidal
+from Grid_Index import create_grid_index, grid_index_nearest
+
+##########################################################################################################
+# CODE DESCRIPTION
+# test_kernels.py contains the regression checks of the kernels that replaced the original computations
+# of the scripts in "Scripts/Processed". Each check compares, on random inputs (including missing
+# observations and samples with a single value), the kernel with the original computation, which is
+# kept here as a reference. The bootstrap is also checked to give the same outputs in serial and across
+# local processes, the online bootstrap is checked against the weighted sums of the daily values (including the
+# roll back of an interrupted update), and the index of the grid is checked against a brute-force search of the
+# nearest grid-points.
+# Note: run the checks with "python -m pytest Scripts/Functions/test_kernels.py".
+##########################################################################################################
+
+
+# Original computation of the daily probabilistic contingency table (from "19_Compute_Daily_Prob_Contingency_Tables.py")
+def daily_prob_ct_reference(tp, obs, VRT, NumEM):
+
+      count_members_exceeding_VRT = np.sum((tp >= VRT), axis=0)
+      ct = np.empty([NumEM+1,5])
+      for index in range(NumEM+1):
+            count_members = NumEM - index
+            OBS_yes_fc = obs[np.where(count_members_exceeding_VRT >= count_members)[0]]
+            OBS_no_fc = obs[np.where(count_members_exceeding_VRT < count_members)[0]]
+            ct[index][0] = count_members
+            ct[index][1] = np.where(OBS_yes_fc > 0)[0].shape[0]
+            ct[index][2] = np.where(OBS_yes_fc == 0)[0].shape[0]
+            ct[index][3] = np.where(OBS_no_fc > 0)[0].shape[0]
+            ct[index][4] = np.where(OBS_no_fc == 0)[0].shape[0]
+
+      return ct.astype(int)
+
+
+# Random rainfall forecasts, with dimensions (NumEM, NumGP), and gridded flood reports, with dimensions (NumGP), with some missing values
+def random_fc_obs(rng, NumEM, NumGP):
+
+      tp = rng.gamma(0.5, 10, size=(NumEM, NumGP))
+      obs = rng.poisson(0.3, size=NumGP).astype(float)
+      obs[rng.random(NumGP) < 0.1] = np.nan
+
+      return tp, obs
+
+
+def test_daily_prob_ct():
+
+      rng = np.random.default_rng(1)
+      for NumEM, NumGP in [(1, 1), (5, 40), (51, 300)]:
+            tp, obs = random_fc_obs(rng, NumEM, NumGP)
+            for VRT in [0, 2.5, 10, 1000]:
+                  np.testing.assert_array_equal(daily_prob_ct(tp, obs, VRT, NumEM), daily_prob_ct_reference(tp, obs, VRT, NumEM))
+
+
+def test_daily_prob_ct_single_value():
+
+      NumEM = 10
+      tp = np.full((NumEM, 25), 3.0)
+      for obs in [np.zeros(25), np.ones(25), np.full(25, np.nan)]:
+            for VRT in [1, 3, 5]:
+                  np.testing.assert_array_equal(daily_prob_ct(tp, obs, VRT, NumEM), daily_prob_ct_reference(tp, obs, VRT, NumEM))
+
+
+def test_daily_prob_ct_multi_VRT():
+
+      rng = np.random.default_rng(2)
+      NumEM = 20
+      tp, obs = random_fc_obs(rng, NumEM, 200)
+      VRT_list = [0.5, 5, 20]
+      ct = daily_prob_ct_multi_VRT(tp, obs, VRT_list, NumEM)
+      for indVRT in range(len(VRT_list)):
+            np.testing.assert_array_equal(ct[indVRT], daily_prob_ct_reference(tp, obs, VRT_list[indVRT], NumEM))
+
+
+def test_daily_prob_ct_block():
+
+      rng = np.random.default_rng(3)
+      NumEM, NumGP, NumEFFCI, NumVRT = 11, 150, 3, 2
+      tp = rng.gamma(0.5, 10, size=(NumEM, NumGP))
+      obs_EFFCI = rng.poisson(0.3, size=(NumEFFCI, NumGP)).astype(float)
+      obs_EFFCI[:, rng.random(NumGP) < 0.1] = np.nan
+      ind_region_list = [np.arange(0, 60), np.arange(60, 61), np.arange(61, NumGP)]
+      VRT_array = rng.uniform(0, 15, size=(NumEFFCI, len(ind_region_list), NumVRT))
+      ct_block = daily_prob_ct_block(tp, obs_EFFCI, VRT_array, ind_region_list, ind_region_list, NumEM)
+      for indEFFCI in range(NumEFFCI):
+            for indVRT in range(NumVRT):
+                  for indReg in range(len(ind_region_list)):
+                        ind = ind_region_list[indReg]
+                        ct_ref = daily_prob_ct_reference(tp[:, ind], obs_EFFCI[indEFFCI, ind], VRT_array[indEFFCI, indReg, indVRT], NumEM)
+                        np.testing.assert_array_equal(ct_block[indEFFCI, indVRT, indReg], ct_ref)
+
+
+def test_prob_ct_from_counts_batch():
+
+      rng = np.random.default_rng(4)
+      NumEM = 8
+      counts = rng.integers(0, NumEM+1, size=(4, 3, 50))
+      obs = rng.poisson(0.5, size=50).astype(float)
+      obs[:5] = np.nan
+      ct = prob_ct_from_counts(counts, obs, NumEM)
+      for i in range(4):
+            for j in range(3):
+                  tp = (np.arange(NumEM)[:, np.newaxis] < counts[i, j][np.newaxis, :]).astype(float)
+                  np.testing.assert_array_equal(ct[i, j], daily_prob_ct_reference(tp, obs, 1, NumEM))
+
+
+# Original computation of the bootstrapped percentiles of a sample (from "15_Compute_Obs_Rain_Climate.py"), with each replicate built from its counts of the unique values
+def bootstrap_percentiles_reference(values_unique, counts_BS, Perc_list):
+
+      return np.array([np.percentile(np.repeat(values_unique, counts), Perc_list) for counts in counts_BS]).T
+
+
+def test_bootstrap_percentiles_weighted():
+
+      rng = np.random.default_rng(6)
+      Perc_list = np.concatenate((np.arange(1,100), np.array([99.5,99.8,99.9])))
+      sample_list = [np.round(rng.gamma(0.4, 8, size=500), 1), rng.integers(0, 3, size=40).astype(float), np.array([7.5]), np.full(30, 2.0)]
+      sample_nan = np.round(rng.gamma(0.4, 8, size=200), 1)
+      sample_nan[:3] = np.nan
+      sample_list.append(sample_nan)
+      for vals_obs in sample_list:
+            values_unique, counts_unique = np.unique(vals_obs, return_counts=True)
+            NumValues = int(np.sum(counts_unique))
+            counts_BS = rng.multinomial(NumValues, counts_unique / NumValues, size=200)
+            np.testing.assert_allclose(bootstrap_percentiles_weighted(values_unique, counts_BS, Perc_list), bootstrap_percentiles_reference(values_unique, counts_BS, Perc_list), rtol=1e-12, atol=0)
+            np.testing.assert_allclose(bootstrap_percentiles_weighted(values_unique, counts_unique[np.newaxis], Perc_list)[:, 0], np.percentile(vals_obs, Perc_list), rtol=1e-12, atol=0)
+
+
+# Monte-Carlo error of the percentiles of bootstrapped scores, with dimensions (NumRep, NumElements), computed from all the sorted non-NaN replicates
+def CI_MC_error_reference(stat_BS, Perc_CI):
+
+      MC_error = np.full((len(Perc_CI), stat_BS.shape[1]), np.nan)
+      for ind_Element in range(stat_BS.shape[1]):
+            values = np.sort(stat_BS[~np.isnan(stat_BS[:, ind_Element]), ind_Element])
+            NumValid = len(values)
+            if NumValid == 0:
+                  continue
+            for ind_Perc, q in enumerate(np.asarray(Perc_CI) / 100):
+                  std = np.sqrt(NumValid * q * (1 - q))
+                  ind_low = int(np.clip(np.floor(NumValid * q - std), 0, NumValid - 1))
+                  ind_high = int(np.clip(np.ceil(NumValid * q + std), 0, NumValid - 1))
+                  MC_error[ind_Perc, ind_Element] = (values[ind_high] - values[ind_low]) / 2
+
+      return MC_error
+
+
+def test_CI_sketch():
+
+      rng = np.random.default_rng(7)
+      Perc_CI = bootstrap_CI_percentiles([90, 95, 99])
+      for RepetitionsBS, NumRep_chunk in [(1, 1), (7, 3), (2500, 1000), (3000, 128)]:
+            stat_BS = rng.normal(size=(RepetitionsBS, 6))
+            stat_BS[:, 1] = np.round(stat_BS[:, 1]) # many ties
+            stat_BS[:, 2] = 0.5 # single value
+            stat_BS[rng.random(RepetitionsBS) < 0.2, 3] = np.nan # some NaN replicates
+            stat_BS[:, 4] = np.nan # all NaN replicates
+            sketch = CI_sketch(Perc_CI, RepetitionsBS)
+            for ind_Rep in range(0, RepetitionsBS, NumRep_chunk):
+                  update_CI_sketch(sketch, stat_BS[ind_Rep:ind_Rep+NumRep_chunk])
+            with np.errstate(invalid="ignore"):
+                  perc_ref = np.array([np.nanpercentile(stat_BS[:, ind], Perc_CI) if np.any(~np.isnan(stat_BS[:, ind])) else np.full(len(Perc_CI), np.nan) for ind in range(stat_BS.shape[1])]).T
+            np.testing.assert_allclose(CI_sketch_percentiles(sketch), perc_ref, rtol=1e-12, atol=0)
+            np.testing.assert_allclose(CI_sketch_MC_error(sketch), CI_MC_error_reference(stat_BS, Perc_CI), rtol=1e-12, atol=0)
+
+
+def test_bootstrap_apply_CI():
+
+      rng = np.random.default_rng(8)
+      Perc_CI = bootstrap_CI_percentiles([90, 95])
+      values_days = rng.integers(0, 30, size=(60, 3, 6, 4)).astype(float)
+      values_days[rng.random(60) < 0.2] = 0 # missing days
+      stat_all = bootstrap_apply(values_days, 2000, AROC_trapezoidal, rng=np.random.default_rng(9), MemoryBS_MB=1)
+      stat_CI, NumRep_BS, MC_error = bootstrap_apply_CI(values_days, 2000, AROC_trapezoidal, Perc_CI, rng=np.random.default_rng(9), MemoryBS_MB=1)
+      assert NumRep_BS == 2000
+      np.testing.assert_array_equal(stat_CI[0], stat_all[0])
+      np.testing.assert_allclose(stat_CI[1:], np.nanpercentile(stat_all[1:], Perc_CI, axis=0), rtol=1e-12, atol=0)
+      np.testing.assert_allclose(MC_error, CI_MC_error_reference(stat_all[1:], Perc_CI), rtol=1e-12, atol=0)
+
+
+# Bootstrap tasks of 15 (blocks of replicates of the observations) and of 20 (partitions of a store of daily contingency tables, with a shared plan)
+def bootstrap_tasks(DirStore):
+
+      rng = np.random.default_rng(5)
+      vals_obs_unique, counts_obs_unique = np.unique(np.round(rng.gamma(0.4, 8, size=2000), 1), return_counts=True)
+      args_obs_list = [(vals_obs_unique, counts_obs_unique, np.arange(1, 100), Block) for Block in bootstrap_blocks(np.random.SeedSequence(20200101), 2500)]
+
+      NumEM, StepF_list = 5, [12, 24]
+      DateS, DateF = datetime(2020,1,1), datetime(2020,1,31)
+      args_store_list = []
+      for RegionName in ["Costa", "Sierra"]:
+            ct, Valid, meta = open_CT_store(DirStore, "CT", 12, 1, 85, "ENS", RegionName, 2020, 0, StepF_list, NumEM)
+            ct[:31] = rng.integers(0, 20, size=ct[:31].shape)
+            Valid[:31] = rng.random(Valid[:31].shape) < 0.8
+            ct.flush()
+            Valid.flush()
+            for Perc_CI in [None, bootstrap_CI_percentiles([90, 95])]:
+                  args_store_list.append((DirStore, "CT", 12, 1, 85, "ENS", RegionName, DateS, DateF, StepF_list, NumEM, AROC_trapezoidal, DirStore + "/Plan", 1500, 20200101, 1, Perc_CI, None))
+
+      return [(bootstrap_percentiles_block, args_obs_list), (bootstrap_store, args_store_list)]
+
+
+def test_run_bootstrap_tasks_processes(tmp_path):
+
+      for func, args_list in bootstrap_tasks(str(tmp_path)):
+            results_serial = run_bootstrap_tasks(func, args_list, 1)
+            results_parallel = run_bootstrap_tasks(func, args_list, 2)
+            for result_serial, result_parallel in zip(results_serial, results_parallel):
+                  if isinstance(result_serial, tuple):
+                        for value_serial, value_parallel in zip(result_serial, result_parallel):
+                              np.testing.assert_array_equal(value_serial, value_parallel)
+                  else:
+                        np.testing.assert_array_equal(result_serial, result_parallel)
+
+
+
+# Store of daily Count_FC_OBS values for 20 days, and accumulators of the online bootstrap filled with them
+def online_bootstrap_days(DirStore, NumDays=20):
+
+      rng = np.random.default_rng(11)
+      NumEM, StepF_list = 5, [12, 24, 36]
+      values_store, Valid_store, meta_store = open_CT_store(DirStore, "Count_FC_OBS", 12, 1, 85, "ENS", "Costa", 2020, 0, StepF_list, NumEM)
+      values_store[:NumDays+1] = rng.integers(0, 50, size=values_store[:NumDays+1].shape)
+      Valid_store[:NumDays+1] = True
+      values_store.flush()
+      Valid_store.flush()
+      acc_store = open_online_bootstrap(DirStore, "Count_FC_OBS", 12, 1, 85, "ENS", "Costa", 2020, 0, StepF_list, NumEM, 300, 20200101)
+      for ind_Day in range(NumDays):
+            update_online_bootstrap(acc_store, datetime(2020,1,1) + timedelta(days=ind_Day), StepF_list, values_store[ind_Day])
+
+      return acc_store, np.asarray(values_store), StepF_list
+
+
+# Original and bootstrapped totals of the daily values, with dimensions (NumStepF, RepetitionsBS+1, ...), as the sums of the daily values weighted by their Poisson weights
+def online_bootstrap_reference(values_days, ind_Day_list, RepetitionsBS, SeedBS, NumEM):
+
+      totals = 0
+      for ind_Day in ind_Day_list:
+            weights = online_bootstrap_weights(datetime(2020,1,1) + timedelta(days=int(ind_Day)), RepetitionsBS, SeedBS)
+            values = values_days[ind_Day].astype(np.int64)
+            values[..., 0] = np.round(values[..., 0] / NumEM)
+            totals = totals + weights[np.newaxis, :, np.newaxis] * values[:, np.newaxis, :]
+
+      return totals
+
+
+def test_update_online_bootstrap(tmp_path):
+
+      (acc, Added, meta), values_days, StepF_list = online_bootstrap_days(str(tmp_path))
+      totals_ref = online_bootstrap_reference(values_days, range(20), 300, 20200101, 5)
+      np.testing.assert_array_equal(acc, totals_ref)
+      assert Added[:20].all() and not Added[20:].any()
+
+      # Adding again the days already added (even with different values) does not change the accumulators
+      for ind_Day in [0, 7, 19]:
+            update_online_bootstrap((acc, Added, meta), datetime(2020,1,1) + timedelta(days=ind_Day), StepF_list, values_days[ind_Day] + 1)
+      np.testing.assert_array_equal(acc, totals_ref)
+
+      # Adding a day one step at a time, and then for all the steps, adds each daily value only once
+      update_online_bootstrap((acc, Added, meta), datetime(2020,1,21), StepF_list[1:2], values_days[20][1:2])
+      update_online_bootstrap((acc, Added, meta), datetime(2020,1,21), StepF_list, values_days[20])
+      np.testing.assert_array_equal(acc, online_bootstrap_reference(values_days, range(21), 300, 20200101, 5))
+
+
+def test_rollback_online_bootstrap(tmp_path):
+
+      (acc, Added, meta), values_days, StepF_list = online_bootstrap_days(str(tmp_path))
+
+      # Interrupting the update of a new day, after some of its values were added, and of a day already added, before removing the journal
+      for ind_Day, ind_StepF_list in [(20, [0, 2]), (3, [1])]:
+            acc[ind_StepF_list[0]] += 1000
+            Added[ind_Day, ind_StepF_list[0]] = True
+            acc.flush()
+            Added.flush()
+            np.savez(meta["FilePending"], ind_Day=ind_Day, ind_StepF=np.array(ind_StepF_list))
+
+            # Opening the accumulators again rolls back the interrupted update
+            acc, Added, meta = open_online_bootstrap(str(tmp_path), "Count_FC_OBS", 12, 1, 85, "ENS", "Costa", 2020, 0, StepF_list, 5, 300, 20200101)
+            assert not os.path.isfile(meta["FilePending"])
+            assert not Added[ind_Day, ind_StepF_list].any()
+            ind_Day_list = [ind for ind in range(21) if ind != ind_Day]
+            np.testing.assert_array_equal(acc[ind_StepF_list], online_bootstrap_reference(values_days, ind_Day_list, 300, 20200101, 5)[ind_StepF_list])
+
+            # Adding the day again completes the update
+            update_online_bootstrap((acc, Added, meta), datetime(2020,1,1) + timedelta(days=ind_Day), StepF_list, values_days[ind_Day])
+      np.testing.assert_array_equal(acc, online_bootstrap_reference(values_days, range(21), 300, 20200101, 5))
+      assert Added[:21].all()
+
+# Octahedral-style grid, with 4*i+16 grid-points on the i-th row from each pole, and one grid-point on each pole
+def octahedral_grid(NumRow_Hemisphere):
+
+      lats, lons = [90.0, -90.0], [0.0, 0.0]
+      Lat_Row_list = np.linspace(90, 0, NumRow_Hemisphere + 1, endpoint=False)[1:]
+      for ind_Row, Lat_Row in enumerate(Lat_Row_list):
+            NumGP_Row = 4 * (ind_Row + 1) + 16
+            for Sign in [1, -1]:
+                  lats.extend([Sign * Lat_Row] * NumGP_Row)
+                  lons.extend(np.arange(NumGP_Row) * 360 / NumGP_Row)
+
+      return np.array(lats), np.array(lons)
+
+
+# Brute-force search of the nearest grid-points, by great-circle distance (i.e. largest cosine of the angle between the points)
+def cos_angle_reference(lats_grid, lons_grid, lats, lons):
+
+      lats_grid, lons_grid = np.radians(lats_grid)[np.newaxis, :], np.radians(lons_grid)[np.newaxis, :]
+      lats, lons = np.radians(lats)[:, np.newaxis], np.radians(lons)[:, np.newaxis]
+
+      return np.sin(lats) * np.sin(lats_grid) + np.cos(lats) * np.cos(lats_grid) * np.cos(lons - lons_grid)
+
+
+def test_grid_index_nearest():
+
+      rng = np.random.default_rng(10)
+      lats_grid, lons_grid = octahedral_grid(24)
+      # Note: points on the poles, near the poles and around the longitudes 0/360 are added to the random points, to check the pole rows and the wrap of the longitudes.
+      lats = np.concatenate((rng.uniform(-90, 90, size=2000), rng.uniform(80, 90, size=200), rng.uniform(-90, -80, size=200), [90, -90, 89.9, -89.9, 0, 45, -45, 10, 10, 10]))
+      lons = np.concatenate((rng.uniform(-180, 360, size=2000), rng.uniform(-1, 1, size=400), [0, 123, 200, 359.99, 0.01, -0.01, 359.999, 360, 720.5, -359.5]))
+
+      Ind_GP = grid_index_nearest(create_grid_index(lats_grid, lons_grid), lats, lons)
+      cos_angle = cos_angle_reference(lats_grid, lons_grid, lats, lons)
+      # Note: the distances are compared, instead of the indexes, since some points are at the same distance from two grid-points.
+      np.testing.assert_allclose(cos_angle[np.arange(len(lats)), Ind_GP], np.max(cos_angle, axis=1), rtol=0, atol=1e-12)
@@ -1,25 +1,42 @@
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 import pandas as pd
 import metview as mv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Mask_Geometry import read_mask_geometry
+from Grid_Index import create_grid_index, grid_index_nearest
+from PointFR_Index import create_PointFR_index
+from GridFR_Events import create_GridFR_events, save_GridFR_events, read_GridFR_events, GridFR_dense
+
 ###############################################################################
 # CODE DESCRIPTION
 # 03_Compute_GridFR_EFFCI_AccPer.py computes the gridded flood observational fields from 
 # the point flood reports, for specific EFFCI indexes and accumulation periods. The fields are 
-# saved in .grib files that contain the number of flood reports in each grid-box of the domain of 
-# interest. The file names contain the end time of the accumulation period.
-# Note: the code can take up 5 minutes to run in serial.
+# saved as a sparse event table that contains, for each accumulation period (identified by its end 
+# time) and EFFCI index, the grid-boxes of the domain of interest with flood reports and their number 
+# of flood reports (see "Scripts/Functions/GridFR_Events.py"). The following stages materialise the 
+# gridded fields from the event table only when they need them.
+# Note: the code takes a few seconds to run in serial. The index of the mask's grid is built only once from the 
+# mask's geometry, and all the point flood reports are assigned to their nearest grid-points in one vectorized query 
+# (see "Scripts/Functions/Grid_Index.py"). The point flood reports are sorted by report time only once (see 
+# "Scripts/Functions/PointFR_Index.py"), so the reports in each accumulation period are found with two binary searches, 
+# and the gridded flood reports for all the accumulation periods are counted in one pass.
+# Note: set SaveGRIB = True to also save the gridded flood observational fields as .grib files (one per 
+# accumulation period and EFFCI index, with the end time of the accumulation period in the file names).
 
 # INPUT PARAMETERS DESCRIPTION
 # Year (year, in YYYY format): year to consider.
 # Acc (number, in hours): accumulation to consider.
 # AccPerS_list (list of numbers, in UTC hour): start of the accumulation periods to consider.
 # EFFCI_list (list of integers, from 1 to 10): EFFCI indexes to consider.
+# SaveGRIB (boolean): if True, the gridded flood observational fields are also saved as .grib files.
 # Git_repo (string): repository's local path.
 # FileIN_Mask (string): relative path of the file containing the domain's mask.
+# DirIN_Mask_Geo (string): relative path of the directory containing the geometry of the domain's mask (see "Scripts/Raw/Create_Mask_Geometry.py").
 # FileIN_PointFR (string): relative path of the file containing the clean point flood reports.
-# DirOUT (string): relative path of the directory containing the gridded flood observational fields.
+# DirOUT (string): relative path of the directory containing the event table of the gridded flood observational fields.
 
 # INPUT PARAMETERS
 DateS = datetime(2020,1,1)
@@ -27,8 +44,10 @@ DateF = datetime(2021,1,10)
 Acc = 12
 AccPerS_list = [0,6,12,18]
 EFFCI_list = [1,6,10]
+SaveGRIB = False
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
 FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
+DirIN_Mask_Geo = "Data/Raw/Mask_Geometry"
 FileIN_PointFR = "Data/Compute/01_Clean_PointFR/Ecu_FF_Hist_ECMWF.csv"
 DirOUT = "Data/Compute/03_GridFR_EFFCI_AccPer"
 ###############################################################################
@@ -40,53 +59,37 @@ AccSTR = f"{Acc:02d}"
 FileIN_Mask = Git_repo + "/" + FileIN_Mask
 Mask = mv.read(FileIN_Mask)
 
-# Reading the cleaned point flood reports
+# Setting the template for the flood observational fields (zero within the domain's fields, missing elsewhere)
+GridFR_template = mv.values(Mask * 0)
+
+# Building the index of the mask's grid
+mask_geo = read_mask_geometry(Git_repo + "/" + DirIN_Mask_Geo)
+grid_index = create_grid_index(mask_geo["Lat"], mask_geo["Lon"])
+
+# Reading the cleaned point flood reports, and sorting them by report time in the index of the point flood reports
 FileIN_PointFR = Git_repo + "/" + FileIN_PointFR
 PointFR = pd.read_csv(FileIN_PointFR)
-PointFR["ReportDateTimeUTC"] = pd.to_datetime(PointFR["ReportDateTimeUTC"] )
-
-# Selecting the point flood reports for EFFCI indexes of interest
-for EFFCI in EFFCI_list: 
-    
-    EFFCI_STR = f"{EFFCI:02d}"
-    PointFR_EFFCI = PointFR.loc[PointFR["EFFCI"] >= EFFCI]
-    
-    # Selecting the point flood reports for the days of interest
-    TheDate = DateS
-    while TheDate <= DateF:
+PointFR_index = create_PointFR_index(PointFR)
 
-        print("Creating the gridded flood observational fields for EFFCI>=" + str(EFFCI) + " on " + TheDate.strftime("%Y%m%d"))
+# Assigning all the point flood reports to the correspondent grid boxes
+PointFR_index["Ind_GP"] = grid_index_nearest(grid_index, PointFR_index["Lat"], PointFR_index["Lon"])
 
-        # Selecting the point flood reports for the accumulation periods of interest
-        for AccPerS in AccPerS_list:
-            
-            AccPerF = AccPerS + Acc
-            
-            # Setting the template for the flood observational fields
-            GridFR_template = mv.values(Mask * 0)
-            
-            # Selecting the point flood reports for the considered accumulation period
-            Date_AccPerS = TheDate + timedelta(hours=AccPerS) 
-            Date_AccPerF = TheDate + timedelta(hours=AccPerF) 
-            ind = PointFR_EFFCI.index[ (PointFR_EFFCI["ReportDateTimeUTC"]>=Date_AccPerS) & (PointFR_EFFCI["ReportDateTimeUTC"]<Date_AccPerF) ]
-            
-            if ind.shape[0] != 0: # Assigning the point flood reports to the correspondent grid boxes
-                lats = PointFR_EFFCI.loc[ind, "Y_DD"].to_numpy()
-                lons = PointFR_EFFCI.loc[ind, "X_DD"].to_numpy()
-                for i in range(len(lats)):
-                    temp = mv.nearest_gridpoint_info(Mask, lats[i], lons[i])
-                    temp_list = str(temp[0]).split(",")
-                    PointFR_index_grid = int(float((temp_list[2].split(":"))[1]))
-                    GridFR_template[PointFR_index_grid] = GridFR_template[PointFR_index_grid] + 1
-                GridFR_grib_temp = mv.set_values (Mask,GridFR_template)
-            else: # Saving an observational field full of zeros because there are no point flood reports in the considered accumulation period
-                GridFR_grib_temp = Mask * 0 
+# Creating the event table of the gridded flood reports for all the EFFCI indexes and accumulation periods of interest
+print("Creating the gridded flood reports for EFFCI>=" + str(EFFCI_list) + " between " + DateS.strftime("%Y%m%d") + " and " + DateF.strftime("%Y%m%d"))
+GridFR_events, ValidTimeF_list = create_GridFR_events(PointFR_index, DateS, DateF, Acc, AccPerS_list, EFFCI_list)
+save_GridFR_events(Git_repo + "/" + DirOUT, Acc, GridFR_events, ValidTimeF_list, EFFCI_list, GridFR_template.shape[0])
+print(" - " + str(GridFR_events.shape[0]) + " grid-boxes with flood reports in " + str(len(ValidTimeF_list) * len(EFFCI_list)) + " gridded fields")
 
-            # Saving the gridded flood observational fields
+# Saving the gridded flood observational fields as .grib files (if requested)
+if SaveGRIB:
+    GridFR_events_store = read_GridFR_events(Git_repo + "/" + DirOUT, Acc)
+    for EFFCI in EFFCI_list: 
+        EFFCI_STR = f"{EFFCI:02d}"
+        for ValidTimeF in ValidTimeF_list:
+            Date_AccPerF = datetime.strptime(str(ValidTimeF), "%Y%m%d%H")
+            GridFR_grib_temp = mv.set_values(Mask, GridFR_dense(GridFR_events_store, Date_AccPerF, [EFFCI], GridFR_template)[0])
             DirOUT_temp= Git_repo + "/" + DirOUT + "/" + AccSTR + "h/EFFCI" + EFFCI_STR + "/" + Date_AccPerF.strftime("%Y%m%d")
             FileOUT = "GridFR_" + AccSTR + "h_EFFCI" + EFFCI_STR + "_" + Date_AccPerF.strftime("%Y%m%d") + "_" + Date_AccPerF.strftime("%H") + ".grib"
             if not os.path.exists(DirOUT_temp):
                 os.makedirs(DirOUT_temp)
             mv.write(DirOUT_temp + "/" + FileOUT, GridFR_grib_temp)
-        
-        TheDate += timedelta(days=1) 
\ No newline at end of file
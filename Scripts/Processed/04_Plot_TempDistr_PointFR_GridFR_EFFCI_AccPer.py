@@ -1,17 +1,22 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
-import metview as mv
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.dates import DateFormatter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from GridFR_Events import read_GridFR_events, GridFR_events_window
+
 ##############################################################################
 # CODE DESCRIPTION
 # 04_Plot_TempDistr_PointFR_GridFR_EFFCI_AccPer.py plots the temporal distribution of point 
 # and gridded flood reports for each day in the verification period, EFFCI index, and 
 # accumulation period.
-# Note: the code takes 5 minutes to run in serial.
+# Note: the code takes a few seconds to run in serial. The number of point and gridded flood reports in each 
+# accumulation period are read directly from the event table of the gridded flood reports (see 
+# "Scripts/Functions/GridFR_Events.py"), without materialising the gridded fields.
 
 # INPUT PARAMETERS DESCRIPTION
 # DateS (date, in format YYYYMMDD): start date of the considered period of time.
@@ -21,7 +26,7 @@ from matplotlib.dates import DateFormatter
 # EFFCI_list (list of integers, from 1 to 10): EFFCI indexes to consider.
 # MaxFR (integer): maximum number of flood reports in the whole period.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path of the directory containing the gridded, accumulated flood reports.
+# DirIN (string): relative path of the directory containing the event table of the gridded, accumulated flood reports.
 # DirOUT (string): relative path of the directory containing the distribution's plots.
 
 # INPUT PARAMETERS
@@ -37,6 +42,9 @@ DirOUT = "Data/Plot/04_TempDistr_PointFR_GridFR_EFFCI_AccPer"
 ##############################################################################
 
 
+# Reading the event table of the gridded flood reports
+GridFR_events_store = read_GridFR_events(Git_repo + "/" + DirIN, Acc)
+
 # Considering a specific EFFCI index
 for EFFCI in EFFCI_list: 
 
@@ -64,9 +72,8 @@ for EFFCI in EFFCI_list:
                   # Defining the valid date for the considered end of the accumulation period
                   Date_AccPerF = TheDate + timedelta(hours=AccPerF) 
 
-                  # Reading the file containing the number of point flood reports per grid-box in the considered domain
-                  FileIN= Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/" + Date_AccPerF.strftime("%Y%m%d") + "/" + "GridFR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" + Date_AccPerF.strftime("%Y%m%d") + "_" + Date_AccPerF.strftime("%H") + ".grib"
-                  FR = mv.values(mv.read(FileIN))
+                  # Reading the number of point flood reports in the grid-boxes with flood reports in the considered domain
+                  Ind_GP_FR, FR = GridFR_events_window(GridFR_events_store, Date_AccPerF, EFFCI)
                   
                   # Extracting the number of point and gridded flood reports per grid-box in the considered domain
                   Num_PointFR.append(int(np.sum(FR)))
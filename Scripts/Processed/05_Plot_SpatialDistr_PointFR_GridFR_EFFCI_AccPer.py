@@ -1,9 +1,14 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 import metview as mv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from GridFR_Events import read_GridFR_events, GridFR_dense
+from PointFR_Index import create_PointFR_index, PointFR_window_select
+
 #####################################################################################
 # CODE DESCRIPTION
 # 05_Plot_SpatialDistr_PointFR_GridFR_EFFCI_AccPer.py plots a map that shows the location of point 
@@ -21,7 +26,7 @@ import metview as mv
 # Git_repo (string): repository's local path.
 # FileIN_Mask (string): relative path of the file containing the domain's mask.
 # FileIN_PointFR (string): relative path of the file containing the clean point flood reports.
-# DirIN_GridFR (string): relative path of the directory containing the gridded, accumulated flood reports.
+# DirIN_GridFR (string): relative path of the directory containing the event table of the gridded, accumulated flood reports.
 # DirOUT (string): relative path where to store the map plots.
 
 # INPUT PARAMETERS
@@ -50,20 +55,19 @@ FileIN_Mask = Git_repo + "/" + FileIN_Mask
 mask = mv.read(FileIN_Mask)
 
 # Reading the gridded flood reports
-FileIN_GridFR = Git_repo + "/" + DirIN_GridFR + "/" +  f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/" + DateF.strftime("%Y%m%d") + "/" + "GridFR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" + DateF.strftime("%Y%m%d") + "_" + DateF.strftime("%H") + ".grib"                 
-GridFR = mv.read(FileIN_GridFR)
+# Note: the gridded field is materialised from the event table of the gridded flood reports, on the grid of the domain's mask.
+GridFR_events_store = read_GridFR_events(Git_repo + "/" + DirIN_GridFR, Acc)
+GridFR = mv.set_values(mask, GridFR_dense(GridFR_events_store, DateF, [EFFCI], mv.values(mask * 0))[0])
 
 # Reading the point flood reports
 FileIN_PointFR = Git_repo + "/" + FileIN_PointFR
-PointFR = pd.read_csv(FileIN_PointFR)
-PointFR["ReportDateTimeUTC"] = pd.to_datetime(PointFR["ReportDateTimeUTC"] )
-PointFR_EFFCI = PointFR.loc[PointFR["EFFCI"] >= EFFCI]
-ind = PointFR_EFFCI.index[ (PointFR_EFFCI["ReportDateTimeUTC"]>=DateS) & (PointFR_EFFCI["ReportDateTimeUTC"]<DateF) ]
+PointFR_index = create_PointFR_index(pd.read_csv(FileIN_PointFR))
+ind = PointFR_window_select(PointFR_index, DateS, DateF, EFFCI=EFFCI)
 PointFR = mv.create_geo(
       type = "xyv",
-      latitudes = PointFR_EFFCI.loc[ind, "Y_DD"].to_numpy(),
-      longitudes = PointFR_EFFCI.loc[ind, "X_DD"].to_numpy(),
-      values = np.zeros(len(PointFR_EFFCI.loc[ind, "Y_DD"].to_numpy())),
+      latitudes = PointFR_index["Lat"][ind],
+      longitudes = PointFR_index["Lon"][ind],
+      values = np.zeros(len(ind)),
 )
 
 # Plotting the point and grid flood reports
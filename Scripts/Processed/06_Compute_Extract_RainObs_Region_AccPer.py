@@ -1,14 +1,27 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
 import metview as mv
-import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Mask_Geometry import read_mask_geometry
+from Grid_Index import create_grid_index, grid_index_nearest
+from OBS_Store import create_OBS_store
 
 ############################################################################################
 # CODE DESCRIPTION
 # 06_Compute_Extract_RainObs_Region_AccPer.py extracts the rainfall observations per region and accumulation 
 # period.
-# Code runtime: the code takes up to 30 minutes to run in series.
+# Code runtime: the code takes up to 10 minutes to run in series.
+# Note: the code is the only one that reads the raw rainfall observations. Each geopoints file is read only once, 
+# and each observation is tagged with the region of its nearest grid-point in the domain's mask (found for all the 
+# observations of the file in one vectorized query, see "Scripts/Functions/Grid_Index.py"), its station, and the end 
+# and the accumulation of its accumulation period. The observations in the considered regions are saved in one 
+# columnar observation store (see "Scripts/Functions/OBS_Store.py"), which is read by all the consumers of the 
+# rainfall observations (i.e. "07_Plot_RainObs_Loc_Distr.py", "08_Plot_RainObs_Diurnal_Cycle.py", 
+# "11_Compute_AverageYear_RainOBS.py" and "15_Compute_Obs_Rain_Climate.py"). The considered period must therefore 
+# cover the periods of all the consumers.
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
@@ -16,12 +29,10 @@ import matplotlib.pyplot as plt
 # DateF (date, in format YYYYMMDD): final day of the period to consider.
 # AccPerF_list (list of integer, inUTC hours): list of the final times of the accumulation periods to consider.
 # RegionCode_list (list of integers): codes for the domain's regions to consider. 
-# RegionName_list (list of strings): names for the domain's regions to consider.
-# RegionColour_list (list of strings): rgb-codes for the domain's regions to consider.
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
+# DirIN_Mask_Geo (string): relative path of the directory containing the geometry of the domain's mask (see "Scripts/Raw/Create_Mask_Geometry.py").
 # DirIN (string): relative path containing the raw rainfall observations.
-# DirOUT (string): relative path containing the extracted rainfall observations per region and accumulation period.
+# DirOUT (string): relative path containing the observation store with the extracted rainfall observations per region and accumulation period.
 
 # INPUT PARAMETERS
 Acc = 12
@@ -29,17 +40,19 @@ DateS = datetime(2010,1,1,0)
 DateF = datetime(2020,12,31,0)
 AccPerF_list = [12,0]
 RegionCode_list = [1,2,3]
-RegionName_list = ["Costa", "Sierra", "Oriente"]
-RegionColour_list = ["#ffea00", "#c19a6b", "#A9FE00"]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
+DirIN_Mask_Geo = "Data/Raw/Mask_Geometry"
 DirIN = "Data/Raw/OBS/Rain"
 DirOUT = "Data/Compute/06_Extract_RainObs_Region_AccPer"
 ############################################################################################
 
-# Reading the domain's mask
-FileIN_Mask = Git_repo + "/" + FileIN_Mask
-mask = mv.read(FileIN_Mask)
+# Reading the geometry of the domain's mask, and building the index of its grid
+mask_geo = read_mask_geometry(Git_repo + "/" + DirIN_Mask_Geo)
+grid_index = create_grid_index(mask_geo["Lat"], mask_geo["Lon"])
+
+# Initializing the variables that will contain the columns of the observation store
+obs_list = {"ValidTime": [], "Region": [], "Station": [], "Lat": [], "Lon": [], "Value": []}
+ValidTime_list = []
 
 # Reading the rainfall observations for each day
 TheDate = DateS
@@ -52,27 +65,34 @@ while TheDate <= DateF:
 
             # Reading the observations
             FileIN = Git_repo + "/" + DirIN + "_" + f"{Acc:02d}" + "h/" + TheDate.strftime("%Y%m%d") + "/tp" +  f"{Acc:02d}" + "_obs_" + TheDate.strftime("%Y%m%d") + f"{AccPerF:02d}" + ".geo"
+            if not os.path.isfile(FileIN):
+                  print(" - NOTE: the observations for this accumulation period are not present in the database.")
+                  continue
             obs_global = mv.read(FileIN)
+            ValidTime_list.append(TheDate + timedelta(hours=AccPerF))
+            lats_obs = np.asarray(mv.latitudes(obs_global), dtype=float)
+            lons_obs = np.asarray(mv.longitudes(obs_global), dtype=float)
+            vals_obs = np.asarray(mv.values(obs_global), dtype=float)
 
-            # Extracting the rainfall observations for a specific region
-            for in_Region in range(len(RegionName_list)):
-
-                  # Select the region to consider
-                  RegionName = RegionName_list[in_Region]
-                  RegionCode = RegionCode_list[in_Region]
+            # Defining the stations of the observations (from their coordinates if the geopoints have no station identifiers)
+            stnids_obs = mv.stnids(obs_global)
+            if stnids_obs is None or len(stnids_obs) != len(vals_obs):
+                  stnids_obs = [f"{lat:.4f}" + "_" + f"{lon:.4f}" for lat, lon in zip(lats_obs, lons_obs)]
 
-                  # Extracting the observations for the region to consider
-                  mask_obs = mv.nearest_gridpoint (mask, obs_global)
-                  vals_obs_region = mv.values(mv.filter(obs_global, mask_obs == RegionCode))
-                  lats_obs_region = mv.latitudes(mv.filter(obs_global, mask_obs == RegionCode))
-                  lons_obs_region = mv.longitudes(mv.filter(obs_global, mask_obs == RegionCode))
-                  obs_region = np.vstack((lats_obs_region, lons_obs_region, vals_obs_region))
-
-                  # Save the extracted rainfall observations
-                  DirOUT_temp = Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h/" + TheDate.strftime("%Y%m%d")
-                  if not os.path.exists(DirOUT_temp):
-                        os.makedirs(DirOUT_temp)
-                  FileNameOUT = "tp" +  f"{Acc:02d}" + "_obs_" + TheDate.strftime("%Y%m%d") + f"{AccPerF:02d}" + "_" +  RegionName + ".npy"
-                  np.save(DirOUT_temp + "/" + FileNameOUT, obs_region)
+            # Extracting the observations for the regions to consider
+            region_obs = np.asarray(mask_geo["Mask"])[grid_index_nearest(grid_index, lats_obs, lons_obs)]
+            ind_region = np.where(np.isin(region_obs, RegionCode_list))[0]
+            obs_list["ValidTime"].append(np.full(len(ind_region), int((TheDate + timedelta(hours=AccPerF)).strftime("%Y%m%d%H"))))
+            obs_list["Region"].append(region_obs[ind_region])
+            obs_list["Station"].append(np.asarray(stnids_obs, dtype=str)[ind_region])
+            obs_list["Lat"].append(lats_obs[ind_region])
+            obs_list["Lon"].append(lons_obs[ind_region])
+            obs_list["Value"].append(vals_obs[ind_region])
             
-      TheDate = TheDate + timedelta(days=1)
\ No newline at end of file
+      TheDate = TheDate + timedelta(days=1)
+
+# Saving the observation store
+obs = {Column: np.concatenate(obs_list[Column]) if len(obs_list[Column]) > 0 else np.array([]) for Column in obs_list}
+Station_list, obs["Station"] = np.unique(obs["Station"].astype(str), return_inverse=True)
+create_OBS_store(Git_repo + "/" + DirOUT, Acc, obs, ValidTime_list, Station_list)
+print("Observation store created with " + str(len(obs["Value"])) + " observations from " + str(len(Station_list)) + " stations")
@@ -1,4 +1,5 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
@@ -7,11 +8,16 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.dates import DateFormatter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from OBS_Store import read_OBS_store, OBS_store_select
+
 #####################################################################################
 # CODE DESCRIPTION
 # 07_Plot_RainObs_Loc_Distr.py plots a map with the location of rainfall observations, and the 
 # distribution of the rainfall totals.
 # Code runtime: negligible.
+# Note: the rainfall observations are read from the observation store (see "06_Compute_Extract_RainObs_Region_AccPer.py" 
+# and "Scripts/Functions/OBS_Store.py").
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
@@ -19,10 +25,12 @@ from matplotlib.dates import DateFormatter
 # DateF (date, in format YYYYMMDD): final day of the period to consider.
 # AccPerF_list (list of integer, inUTC hours): list of the final times of the accumulation periods to consider.
 # CornersDomain_list (list of floats): coordinates [N/E/S/W] of the domain to plot.
+# RegionCode_list (list of integers): codes for the domain's regions to consider. 
 # RegionName_list (list of strings): names for the domain's regions to consider.
 # RegionColour_list (list of strings): rgb-codes for the domain's regions to consider.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the rainfall observations.
+# FileIN_Mask (string): relative path of the file containing the domain's mask.
+# DirIN (string): relative path containing the observation store with the rainfall observations.
 # DirOUT (string): relative path containing the plots.
 
 # INPUT PARAMETERS
@@ -31,9 +39,11 @@ DateS = datetime(2010,1,1,0)
 DateF = datetime(2020,12,31,0)
 AccPerF_list = [12,0]
 CornersDomain_list = [2,-81.5,-5.5,-74.5] 
+RegionCode_list = [1,2,3]
 RegionName_list = ["Costa", "Sierra", "Oriente"]
 RegionColour_list = ["#ffea00", "#c19a6b", "#A9FE00"]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
+FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
 DirIN = "Data/Compute/06_Extract_RainObs_Region_AccPer"
 DirOUT = "Data/Plot/07_RainObs_Loc_Distr"
 #####################################################################################
@@ -46,6 +56,10 @@ if not os.path.exists(DirOUT_temp):
 # Creating the array containing all the dates in the considered period
 dates = pd.date_range(start=DateS, end=DateF, freq='D')
 
+# Reading the domain's mask and the observation store
+mask = mv.read(Git_repo + "/" + FileIN_Mask)
+obs_store = read_OBS_store(Git_repo + "/" + DirIN, Acc, ["Region", "Lat", "Lon", "Value"])
+
 # Initializing the variables that contain all the rainfall observations
 obs_lats_all = np.array([])
 obs_lons_all = np.array([])
@@ -59,6 +73,7 @@ for ind_Region in range(len(RegionName_list)):
 
       # Select the region to consider for the computation of the observational rainfall climatology
       RegionName = RegionName_list[ind_Region]
+      RegionCode = RegionCode_list[ind_Region]
       RegionColour = RegionColour_list[ind_Region]
 
       # Reading the rainfall observations for a specific accumulation period
@@ -66,31 +81,17 @@ for ind_Region in range(len(RegionName_list)):
             
             AccPerF = AccPerF_list[ind_AccPerF]
 
-            # Initializing the variables that will contain the  rainfall observations
-            obs_lats = np.array([])
-            obs_lons = np.array([])
-            obs_vals = np.array([])
-            obs_counts = []
-
-            # Reading the rainfall observations for each day of the considered time period
-            TheDate_list = []
-            TheDate = DateS
-            while TheDate <= DateF:
-
-                  print("Reading rainfall observations for " + RegionName + " for the " + f"{Acc:02d}" + "-hourly rainfall observations for the accumulation period ending on " + TheDate.strftime("%Y%m%d") + " at " +  f"{AccPerF:02d}" + " UTC") 
-
-                  # Reading the observations
-                  FileIN = Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/" + TheDate.strftime("%Y%m%d") + "/tp" +  f"{Acc:02d}" + "_obs_" + TheDate.strftime("%Y%m%d") + f"{AccPerF:02d}" + "_" + RegionName + ".npy"
-                  temp = np.load(FileIN)
-                  obs_lats = np.concatenate((obs_lats, temp[0,:]))
-                  obs_lons = np.concatenate((obs_lons, temp[1,:]))
-                  obs_vals = np.concatenate((obs_vals, temp[2,:]))
-                  obs_counts.append(temp.shape[1])
-
-                  # Creating the list containing the dates in the period of interest
-                  TheDate_list.append(TheDate)
-
-                  TheDate += timedelta(days=1)
+            # Reading the rainfall observations for all the days of the considered time period
+            print("Reading rainfall observations for " + RegionName + " for the " + f"{Acc:02d}" + "-hourly rainfall observations for the accumulation periods ending at " +  f"{AccPerF:02d}" + " UTC") 
+            ind = OBS_store_select(obs_store, DateS, DateF + timedelta(hours=23), Hour_list=[AccPerF], RegionCode=RegionCode)
+            obs_lats = np.asarray(obs_store["Lat"][ind])
+            obs_lons = np.asarray(obs_store["Lon"][ind])
+            obs_vals = np.asarray(obs_store["Value"][ind])
+
+            # Counting the rainfall observations for each day of the considered time period
+            ValidTime_Day = np.array([int(TheDate.strftime("%Y%m%d")) * 100 + AccPerF for TheDate in dates])
+            ValidTime_obs = np.asarray(obs_store["ValidTime"][ind])
+            obs_counts = np.searchsorted(ValidTime_obs, ValidTime_Day, side="right") - np.searchsorted(ValidTime_obs, ValidTime_Day, side="left")
 
             # Concatenating all the observations
             obs_lats_all = np.concatenate((obs_lats_all, obs_lats))
@@ -1,23 +1,29 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
-import metview as mv
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from OBS_Store import read_OBS_store, OBS_store_select
+
 #####################################################################
 # CODE DESCRIPTION
 # 08_Plot_RainObs_Diurnal_Cycle.py plots the rainfall's diurnal cycle in Ecuador. 
 # Code runtime: negligible.
+# Note: the rainfall observations are read from the observation store (see "06_Compute_Extract_RainObs_Region_AccPer.py" 
+# and "Scripts/Functions/OBS_Store.py").
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
 # DateS (date, in format YYYYMMDD): start day of the period to consider.
 # DateF (date, in format YYYYMMDD): final day of the period to consider.
 # CornersDomain_list (list of floats): coordinates [N/E/S/W] of the domain to plot.
+# RegionCode_list (list of integers): codes for the domain's regions to consider. 
 # RegionName_list (list of strings): names for the domain's regions to consider.
 # RegionColour_list (list of strings): rgb-codes for the domain's regions to consider.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the rainfall observations.
+# DirIN (string): relative path containing the observation store with the rainfall observations.
 # DirOUT (string): relative path containing the plots.
 
 # INPUT PARAMETERS
@@ -25,6 +31,7 @@ Acc = 12
 DateS = datetime(2010,1,1,0)
 DateF = datetime(2020,12,31,0)
 AccPerF_list = [12,0]
+RegionCode_list = [1,2,3]
 RegionName_list = ["Costa", "Sierra", "Oriente"]
 RegionColour_list = ["#ffea00", "#c19a6b", "#A9FE00"]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
@@ -32,6 +39,9 @@ DirIN = "Data/Compute/06_Extract_RainObs_Region_AccPer"
 DirOUT = "Data/Plot/08_RainObs_Diurnal_Cycle"
 #####################################################################
 
+# Reading the observation store
+obs_store = read_OBS_store(Git_repo + "/" + DirIN, Acc, ["Region", "Value"])
+
 # Starting the figure that will containg the rainfall's diurnal cycle
 fig, ax = plt.subplots(figsize=(14, 8))
 
@@ -43,6 +53,7 @@ for ind_Region in range(len(RegionName_list)):
 
       # Select the region to consider for the computation of the observational rainfall climatology
       RegionName = RegionName_list[ind_Region]
+      RegionCode = RegionCode_list[ind_Region]
       RegionColour = RegionColour_list[ind_Region]
 
       # Reading the rainfall observations for a specific accumulation period
@@ -50,20 +61,9 @@ for ind_Region in range(len(RegionName_list)):
             
             AccPerF = AccPerF_list[ind_AccPerF]
             
-            # Initializing the variables that will contain the  rainfall observations
-            obs_vals = np.array([])
-
-            # Reading the rainfall observations for each day of the considered time period
-            TheDate = DateS
-            while TheDate <= DateF:
-
-                  print("Reading rainfall observations for " + RegionName + " for the " + f"{Acc:02d}" + "-hourly rainfall observations for the accumulation period ending on " + TheDate.strftime("%Y%m%d") + " at " +  f"{AccPerF:02d}" + " UTC") 
-
-                  # Reading the observations
-                  FileIN = Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/" + TheDate.strftime("%Y%m%d") + "/tp" +  f"{Acc:02d}" + "_obs_" + TheDate.strftime("%Y%m%d") + f"{AccPerF:02d}" + "_" + RegionName + ".npy"
-                  obs_vals = np.concatenate((obs_vals, np.load(FileIN)[2,:]))
-
-                  TheDate += timedelta(days=1)
+            # Reading the rainfall observations for all the days of the considered time period
+            print("Reading rainfall observations for " + RegionName + " for the " + f"{Acc:02d}" + "-hourly rainfall observations for the accumulation periods ending at " +  f"{AccPerF:02d}" + " UTC") 
+            obs_vals = np.asarray(obs_store["Value"][OBS_store_select(obs_store, DateS, DateF + timedelta(hours=23), Hour_list=[AccPerF], RegionCode=RegionCode)])
 
             # Computing the avearge rainfall for a specific accumulation period
             rain_diurnal_cycle[ind_AccPerF] = np.average(obs_vals)
@@ -1,7 +1,12 @@
 import os
+import sys
 from datetime import datetime, timedelta
+import numpy as np
 import metview as mv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from FC_Cube import open_FC_cube, FC_cube_acc, FC_cube_global
+
 #####################################################################
 # CODE DESCRIPTION
 # 09_Plot_PercFC.py plots a map that shows the rainfall totals associated with 
@@ -16,8 +21,8 @@ import metview as mv
 # RegionName_list (list of strings): names for the domain's regions to consider.
 # RegionColour_list (list of strings): rgb-codes for the domain's regions to consider.
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
-# FileIN (string): relative path of the file containing the clean point flood reports.
+# FileIN_Mask (string): relative path of the file containing the domain's mask (used as grid template for the plotted fields).
+# DirIN_FC_Cube (string): relative path of the directory containing the forecast cubes (see "Scripts/Raw/Create_FC_Cube.py").
 # DirOUT (string): relative path where to store the map plots.
 
 # INPUT PARAMETERS
@@ -29,30 +34,33 @@ Perc_list = [85, 99]
 CornersDomain_list = [2,-81.5,-5.5,-74.5] 
 SystemFC_list = ["ENS", "ecPoint"]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-DirIN = "Data/Raw/FC"
+FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
+DirIN_FC_Cube = "Data/Raw/FC_Cube"
 DirOUT = "Data/Plot/09_PercFC"
 #####################################################################
 
 
 StepS = StepF - Acc
+BaseDateTime = BaseDate + timedelta(hours=BaseTime)
+
+# Reading the domain's mask, used as grid template for the plotted fields
+mask = mv.read(Git_repo + "/" + FileIN_Mask)
 
 for SystemFC in SystemFC_list:
 
+    # Reading the forecasts, as rainfall accumulated over the considered period in mm, from the forecast cube
+    cube, meta = open_FC_cube(Git_repo + "/" + DirIN_FC_Cube, SystemFC, Acc)
+    # Note: the grid-points not stored in the forecast cube (if only the domain's regions were extracted) are set to missing values.
+    tp = FC_cube_global(meta, FC_cube_acc(cube, meta, BaseDateTime, StepF, Acc))
+
     for Perc in Perc_list:
     
         print("Plotting the " + str(Perc) + "th percentile for " + SystemFC)
 
         if SystemFC == "ENS":
-            FileIN1 = Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDate.strftime("%Y%m%d") + f"{BaseTime:02d}" + "/tp_" + BaseDate.strftime("%Y%m%d") + "_" + f"{BaseTime:02d}" + "_" + f"{StepS:03d}" + ".grib"
-            FileIN2 = Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDate.strftime("%Y%m%d") + f"{BaseTime:02d}" + "/tp_" + BaseDate.strftime("%Y%m%d") + "_" + f"{BaseTime:02d}" + "_" + f"{StepF:03d}" + ".grib"
-            tp1 = mv.read(FileIN1)
-            tp2 = mv.read(FileIN2)
-            tp = (tp2-tp1) * 1000
-            tp_perc = mv.percentile(interpolation = "linear", percentiles = Perc, data = tp)
+            tp_perc = mv.set_values(mask, np.nanpercentile(tp, Perc, axis=0))
         elif SystemFC == "ecPoint":
-            FileIN = Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDate.strftime("%Y%m%d") + f"{BaseTime:02d}" + "/Pt_BC_PERC_" + f"{Acc:03d}" + "_" + BaseDate.strftime("%Y%m%d") + "_" + f"{BaseTime:02d}" + "_" + f"{StepF:03d}" + ".grib"
-            tp = mv.read(FileIN)
-            tp_perc = tp[Perc-1]
+            tp_perc = mv.set_values(mask, tp[Perc-1])
             
             
         # Plotting the maps
@@ -1,7 +1,11 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
-import metview as mv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from FC_Cube import open_FC_cube, FC_cube_acc, FC_cube_region_index
+from Mask_Geometry import read_mask_geometry
 
 ###################################################################################
 # CODE DESCRIPTION
@@ -20,8 +24,8 @@ import metview as mv
 # RegionName_list (list of strings): list of names for the domain's regions.
 # RegionCode_list (list of integers): codes for the domain's regions to consider. 
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
-# DirIN (string): relative path containing the raw rainfall forecasts.
+# DirIN_Mask_Geo (string): relative path of the directory containing the geometry of the domain's mask (see "Scripts/Raw/Create_Mask_Geometry.py").
+# DirIN_FC_Cube (string): relative path of the directory containing the forecast cubes (see "Scripts/Raw/Create_FC_Cube.py").
 # DirOUT (string): relative path for the plots containing annual average of rainfall from forecasts.
 
 # INPUT PARAMETERS
@@ -35,13 +39,13 @@ SystemFC_list = ["ENS", "ecPoint"]
 RegionName_list = ["Costa","Sierra"]
 RegionCode_list = [1,2]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
-DirIN = "Data/Raw/FC"
+DirIN_Mask_Geo = "Data/Raw/Mask_Geometry"
+DirIN_FC_Cube = "Data/Raw/FC_Cube"
 DirOUT = "Data/Compute/10_AverageYear_RainFC"
 ###################################################################################
 
-# Reading the mask for the regions in the considered domain
-mask = mv.values(mv.read(Git_repo + "/" + FileIN_Mask))
+# Reading the geometry of the mask for the regions in the considered domain
+mask_geo = read_mask_geometry(Git_repo + "/" + DirIN_Mask_Geo)
 
 # Creating the variable that stores the lead times to consider
 StepF_list = np.arange(StepF_S,StepF_F+1, Disc_StepF)
@@ -52,11 +56,14 @@ for ind_Region in range(len(RegionName_list)):
       
       RegionName = RegionName_list[ind_Region]
       RegionCode = RegionCode_list[ind_Region]
-      ind_mask_region = np.where(mask == RegionCode)[0]
 
       # Computing the annual rainfall average for a specific forecasting system
       for SystemFC in SystemFC_list:
 
+            # Opening the forecast cube for the considered forecasting system
+            cube, meta = open_FC_cube(Git_repo + "/" + DirIN_FC_Cube, SystemFC, Acc)
+            ind_cube_region = FC_cube_region_index(meta, mask_geo, RegionCode) # grid-points of the forecast cube belonging to the considered region
+
             # Initializing the variables that will contain the annual rainfall averages
             tp_av_year = np.empty((Num_StepF,2)) * np.nan
             
@@ -64,7 +71,6 @@ for ind_Region in range(len(RegionName_list)):
             for ind_StepF in range(Num_StepF):
                   
                   StepF = StepF_list[ind_StepF]
-                  StepS = StepF - Acc
 
                   # Computing the annual rainfall average for all dates
                   tp_av_year_temp = []
@@ -73,20 +79,12 @@ for ind_Region in range(len(RegionName_list)):
                         
                         print("Computing the annual average for " + SystemFC + " in " + RegionName + ", for StepF=" + str(StepF) + ", for the run on " + BaseDateTime.strftime("%Y%m%d") + " at " + BaseDateTime.strftime("%H") + " UTC")
                                     
-                        # Reading the forecasts
-                        if SystemFC == "ENS":
-                              FileIN1 =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/tp_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepS:03d}" + ".grib"
-                              FileIN2 =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/tp_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                              if os.path.isfile(FileIN1) and os.path.isfile(FileIN2):
-                                    tp = mv.values((mv.read(FileIN2) - mv.read(FileIN1)) * 1000)
-                        if SystemFC == "ecPoint":
-                              FileIN =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/Pt_BC_PERC_" + f"{Acc:03d}"+ "_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                              if os.path.isfile(FileIN):
-                                    tp = mv.values(mv.read(FileIN))
+                        # Reading the forecasts, as rainfall accumulated over the considered period in mm, from the forecast cube
+                        tp = FC_cube_acc(cube, meta, BaseDateTime, StepF, Acc)
 
                         # Extracting the forecasts for a specific region
                         if len(tp) != 0:
-                              tp_av_year_temp.append(np.mean(tp[:,ind_mask_region]))
+                              tp_av_year_temp.append(np.mean(tp[:,ind_cube_region]))
 
                         BaseDateTime += timedelta(days=1)
 
@@ -1,13 +1,17 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
-import metview as mv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from OBS_Store import read_OBS_store, OBS_store_select
 
 ######################################################################################
 # CODE DESCRIPTION
 # 11_Compute_AverageYear_RainOBS.py computes the annual average rain for different accumulation 
 # periods, and extracts the location of the rainfall observations used in the computations.
-# Note: the code takes up to 5 minutes to run in serial.
+# Note: the code runtime is negligible. The rainfall observations are read from the observation store (see 
+# "06_Compute_Extract_RainObs_Region_AccPer.py" and "Scripts/Functions/OBS_Store.py"), instead of the raw rainfall observations.
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
@@ -17,8 +21,7 @@ import metview as mv
 # RegionName_list (list of strings): list of names for the domain's regions.
 # RegionCode_list (list of integers): codes for the domain's regions to consider. 
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
-# DirIN (string): relative path containing the raw rainfall observations.
+# DirIN (string): relative path containing the observation store with the rainfall observations.
 # DirOUT (string): relative path of the plots containing the annual average rain.
 
 # INPUT PARAMETERS
@@ -29,8 +32,7 @@ AccPerF_list = [12,0]
 RegionName_list = ["Costa", "Sierra"]
 RegionCode_list = [1,2]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
-DirIN = "Data/Raw/OBS/Rain"
+DirIN = "Data/Compute/06_Extract_RainObs_Region_AccPer"
 DirOUT = "Data/Compute/11_AverageYear_RainOBS"
 ######################################################################################
 
@@ -39,8 +41,8 @@ DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h"
 if not os.path.exists(DirOUT_temp):
       os.makedirs(DirOUT_temp)
 
-# Reading the mask for the regions in the considered domain
-mask = mv.read(Git_repo + "/" + FileIN_Mask)
+# Reading the observation store
+obs_store = read_OBS_store(Git_repo + "/" + DirIN, Acc, ["Region", "Lat", "Lon", "Value"])
 
 # Computing the annual rainfall average for a specific region
 for ind_Region in range(len(RegionName_list)):
@@ -56,28 +58,12 @@ for ind_Region in range(len(RegionName_list)):
             
             AccPerF = AccPerF_list[ind_AccPerF]
 
-            # Initializing the variable that will contain the rainfall observations for the region
-            vals_obs_region = np.array([])
-            lats_obs_region = np.array([])
-            lons_obs_region = np.array([])
-
-            # Computing the annual average rainfall for the considered year
-            TheDateTime = DateTimeS + timedelta(hours=AccPerF)
-            while TheDateTime <= DateTimeF:
-                  
-                  print("Post-processing observations for period ending on ", TheDateTime, " for ", RegionName)
-            
-                  # Reading global rainfall observations
-                  FileIN = Git_repo + "/" + DirIN + "_" + f"{Acc:02d}" + "h/" + TheDateTime.strftime("%Y%m%d") + "/tp" + f"{Acc:02d}" + "_obs_" + TheDateTime.strftime("%Y%m%d") + TheDateTime.strftime("%H") + ".geo"
-                  obs = mv.read(FileIN)
-
-                  # Selecting the observations for the region and the considered accumulation period
-                  mask_at_obs = mv.nearest_gridpoint(mask, obs)
-                  vals_obs_region = np.concatenate((vals_obs_region, mv.values(mv.filter(obs, mask_at_obs == RegionCode))))
-                  lats_obs_region = np.concatenate((lats_obs_region, mv.latitudes(mv.filter(obs, mask_at_obs == RegionCode))))
-                  lons_obs_region = np.concatenate((lons_obs_region, mv.longitudes(mv.filter(obs, mask_at_obs == RegionCode))))
-                  
-                  TheDateTime = TheDateTime + timedelta(days=1)
+            # Selecting the observations for the region and the accumulation periods ending at AccPerF in the considered year
+            print("Post-processing observations for periods ending at ", f"{AccPerF:02d}", " UTC for ", RegionName)
+            ind = OBS_store_select(obs_store, DateTimeS + timedelta(hours=AccPerF), DateTimeF, Hour_list=[AccPerF], RegionCode=RegionCode)
+            vals_obs_region = np.asarray(obs_store["Value"][ind])
+            lats_obs_region = np.asarray(obs_store["Lat"][ind])
+            lons_obs_region = np.asarray(obs_store["Lon"][ind])
 
             # Computing the annual rainfall average 
             tp_av_year[ind_AccPerF,0] = AccPerF
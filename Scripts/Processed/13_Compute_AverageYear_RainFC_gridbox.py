@@ -1,13 +1,21 @@
 import os
+import sys
 from datetime import datetime, timedelta
 import numpy as np
 import metview as mv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from FC_Cube import open_FC_cube, FC_cube_acc, FC_cube_global
+from Manifest import unit_key, read_manifest, mark_units_done, reset_manifest, save_checkpoint, read_checkpoint, remove_checkpoint
+
 ###################################################################################
 # CODE DESCRIPTION
 # 13_Compute_AverageYear_RainFC_gridbox.py computes the annual average rain for different  
 # accumulation periods and different lead times, per grid-box.
 # Note: It can take up to 24 hours to run is series.
+# Note: the code is resumable. The completed (system, step) units are recorded in a work-unit manifest, and the partial 
+# sums over the runs are saved in a checkpoint every Checkpoint_NumDays runs (see "Scripts/Functions/Manifest.py"). A 
+# restarted run (with Resume=True) skips the completed units, and restarts the partial ones from their last checkpoint.
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
@@ -17,9 +25,11 @@ import metview as mv
 # StepF_F (integer, in hours): lead time indicating the end of the last accumulation period to consider.
 # Disc_StepF (integer, in hours): discretization between accumulation periods.
 # SystemFC_list (list of strings): list of forecasting systems to consider.
+# Resume (boolean): True to resume the work completed by a previous run, False to start from scratch.
+# Checkpoint_NumDays (integer): number of runs between two checkpoints of the partial sums.
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
-# DirIN (string): relative path containing the raw rainfall forecasts.
+# FileIN_Mask (string): relative path of the file containing the domain's mask (used as grid template for the output .grib files).
+# DirIN_FC_Cube (string): relative path of the directory containing the forecast cubes (see "Scripts/Raw/Create_FC_Cube.py").
 # DirOUT (string): relative path for the plots containing annual average of rainfall from forecasts.
 
 # INPUT PARAMETERS
@@ -30,12 +40,24 @@ StepF_S = 60
 StepF_F = 72
 Disc_StepF = 12
 SystemFC_list = ["ENS", "ecPoint"]
+Resume = True
+Checkpoint_NumDays = 30
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
 FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
-DirIN = "Data/Raw/FC"
+DirIN_FC_Cube = "Data/Raw/FC_Cube"
 DirOUT = "Data/Compute/13_AverageYear_RainFC_gridbox"
 ###################################################################################
 
+# Reading the domain's mask, used as grid template for the output .grib files
+mask = mv.read(Git_repo + "/" + FileIN_Mask)
+
+# Reading the work units already completed
+DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h" 
+FileManifest = DirOUT_temp + "/Manifest.txt"
+if not Resume:
+      reset_manifest(FileManifest)
+UnitKey_done = read_manifest(FileManifest)
+
 # Creating the variable that stores the lead times to consider
 StepF_list = np.arange(StepF_S,StepF_F+1, Disc_StepF)
 Num_StepF = StepF_list.shape[0]
@@ -43,6 +65,9 @@ Num_StepF = StepF_list.shape[0]
 # Computing the annual rainfall average for a specific forecasting system
 for SystemFC in SystemFC_list:
 
+      # Opening the forecast cube for the considered forecasting system
+      cube, meta = open_FC_cube(Git_repo + "/" + DirIN_FC_Cube, SystemFC, Acc)
+
       # Initializing the variables that will contain the annual rainfall averages
       tp_av_year = None
       
@@ -50,40 +75,62 @@ for SystemFC in SystemFC_list:
       for ind_StepF in range(Num_StepF):
             
             StepF = StepF_list[ind_StepF]
-            StepS = StepF - Acc
+
+            # Checking whether the considered unit was already completed
+            UnitKey = unit_key(SystemFC, f"{StepF:03d}")
+            if UnitKey in UnitKey_done:
+                  print("The annual average for " + SystemFC + ", for StepF=" + str(StepF) + " was already completed.")
+                  continue
+
+            # Initializing the annual rainfall sum, or resuming it from the last checkpoint
+            FileCheckpoint = DirOUT_temp + "/Checkpoint_" + SystemFC + "_" + f"{StepF:03d}" + ".npz"
+            checkpoint = read_checkpoint(FileCheckpoint) if Resume else None
+            if checkpoint is None:
+                  tp_sum_year = None
+                  NumRealizations = 0
+                  BaseDateTime = BaseDateTimeS
+            else:
+                  NumRealizations = int(checkpoint["NumRealizations"])
+                  tp_sum_year = checkpoint["tp_sum_year"] if NumRealizations > 0 else None
+                  BaseDateTime = datetime.strptime(str(checkpoint["BaseDateTime_Next"]), "%Y%m%d%H")
+                  print("Resuming the annual average for " + SystemFC + ", for StepF=" + str(StepF) + " from the run on " + BaseDateTime.strftime("%Y%m%d") + " at " + BaseDateTime.strftime("%H") + " UTC")
 
             # Computing the annual rainfall average for all dates
-            tp_av_year_temp = None
-            BaseDateTime = BaseDateTimeS
+            NumDays_Checkpoint = 0
             while BaseDateTime <= BaseDateTimeF:
                   
                   print("Computing the annual average for " + SystemFC + ", for StepF=" + str(StepF) + ", for the run on " + BaseDateTime.strftime("%Y%m%d") + " at " + BaseDateTime.strftime("%H") + " UTC")
                               
-                  # Reading the forecasts
-                  if SystemFC == "ENS":
-                        FileIN1 =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/tp_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepS:03d}" + ".grib"
-                        FileIN2 =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/tp_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                        if os.path.isfile(FileIN1) and os.path.isfile(FileIN2):
-                              tp = (mv.read(FileIN2) - mv.read(FileIN1)) * 1000
-                  if SystemFC == "ecPoint":
-                        FileIN =  Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")  + "/Pt_BC_PERC_" + f"{Acc:03d}"+ "_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                        if os.path.isfile(FileIN):
-                              tp = mv.read(FileIN)
-
-                  # Extracting the forecasts for a specific region
+                  # Reading the forecasts, as rainfall accumulated over the considered period in mm, from the forecast cube
+                  tp = FC_cube_acc(cube, meta, BaseDateTime, StepF, Acc)
+
+                  # Adding the ensemble mean for the considered run
                   if len(tp) != 0:
-                        NumEM = int(mv.count(tp))
-                        tp_av_year_temp = mv.merge(tp_av_year_temp, (mv.sum(tp))/NumEM)
+                        tp_mean = np.mean(tp, axis=0, dtype=np.float64)
+                        if tp_sum_year is None:
+                              tp_sum_year = tp_mean
+                        else:
+                              tp_sum_year = tp_sum_year + tp_mean
+                        NumRealizations = NumRealizations + 1
 
                   BaseDateTime += timedelta(days=1)
 
+                  # Saving the checkpoint of the partial sum
+                  NumDays_Checkpoint = NumDays_Checkpoint + 1
+                  if NumDays_Checkpoint == Checkpoint_NumDays:
+                        save_checkpoint(FileCheckpoint, tp_sum_year=(tp_sum_year if tp_sum_year is not None else np.array([])), NumRealizations=np.array(NumRealizations), BaseDateTime_Next=np.array(BaseDateTime.strftime("%Y%m%d%H")))
+                        NumDays_Checkpoint = 0
+
             # Computing the annual rainfall average
-            NumRealizations = int(mv.count(tp_av_year_temp))
-            tp_av_year = (mv.sum(tp_av_year_temp))/NumRealizations
+            # Note: the grid-points not stored in the forecast cube (if only the domain's regions were extracted) are set to missing values.
+            tp_av_year = mv.set_values(mask, FC_cube_global(meta, tp_sum_year / NumRealizations))
             
             # Saving the plot
-            DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h" 
             FileNameOUT_temp = "AverageYear_RainFC_" + f"{Acc:02d}" + "h_" + SystemFC + "_" + f"{StepF:03d}" + ".grib"
             if not os.path.exists(DirOUT_temp):
                   os.makedirs(DirOUT_temp)
-            mv.write(DirOUT_temp + "/" + FileNameOUT_temp, tp_av_year)
\ No newline at end of file
+            mv.write(DirOUT_temp + "/" + FileNameOUT_temp, tp_av_year)
+
+            # Recording the completed unit, and removing its checkpoint
+            mark_units_done(FileManifest, [UnitKey])
+            remove_checkpoint(FileCheckpoint)
\ No newline at end of file
@@ -1,14 +1,35 @@
 import os
+import sys
 from datetime import datetime, timedelta
-from  random import choices
 import numpy as np
-import metview as mv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from OBS_Store import read_OBS_store, OBS_store_select
+from Bootstrap import bootstrap_blocks, bootstrap_percentiles_block, bootstrap_CI_percentiles, CI_sketch, update_CI_sketch, CI_sketch_percentiles, CI_sketch_MC_error, CI_change, save_CI_summary, run_bootstrap_tasks
 
 #############################################################################################
 # CODE DESCRIPTION
 # 15_Compute_Obs_Rain_Climate.py computes the observational rainfall climatology for
 # each region in the domain of interest. 
-# Code runtime: it can take up to 45 minutes to run in serial if the observations need to be read for the first time.
+# Code runtime: negligible for reading the observations, which are selected from the observation store (see 
+# "06_Compute_Extract_RainObs_Region_AccPer.py" and "Scripts/Functions/OBS_Store.py"), instead of the raw rainfall observations.
+# Note: the observations are resampled individually (not by day), so the resampling plans over days used in 20 and 24 do not 
+# apply. The bootstrapped observations are drawn from generators seeded with SeedBS (one child of the seed sequence per region, 
+# and one grandchild per block of replicates, see "Scripts/Functions/Bootstrap.py"), so the bootstrapped percentiles are reproducible.
+# Note: the observations are sorted and compressed only once per region into their unique values and counts. Each bootstrapped 
+# replicate is then a vector of multinomial weights over the unique values, and its percentiles are found with a search in the 
+# cumulative weights, so the replicates are never built nor sorted (see "Scripts/Functions/Bootstrap.py"). The percentiles 
+# are identical to those computed with np.percentile on the resampled observations.
+# Note: set NumProcesses > 1 to compute the blocks of replicates across NumProcesses local processes (see run_bootstrap_tasks in 
+# "Scripts/Functions/Bootstrap.py").
+# Note: by default, the bootstrapped percentiles are not kept. Each block of replicates is summarised into the bounds of the 
+# confidence intervals for the confidence levels in CL_list (see "Scripts/Functions/Bootstrap.py"), which are identical to the 
+# ones computed with np.nanpercentile over all the replicates. Only the compact CI summaries are saved, and read directly by 
+# "16_Plot_Obs_Rain_Climate.py". Set SaveReplicatesBS = True to save also the full arrays with all the bootstrapped percentiles.
+# Note: set ToleranceBS to a number (in mm) to stop the bootstrap of a region once the bounds of its confidence intervals change 
+# by no more than ToleranceBS between two consecutive blocks of 1000 replicates, instead of always drawing RepetitionsBS
+# replicates. The convergence is checked in the order of the blocks, whatever NumProcesses. The number of replicates drawn and 
+# the Monte-Carlo errors of the bounds are saved with the CI summaries. ToleranceBS is ignored if SaveReplicatesBS = True.
 
 # INPUT PARAMETERS DESCRIPTION
 # Acc (number, in hours): rainfall accumulation to consider.
@@ -17,9 +38,15 @@ import metview as mv
 # AccPerF_list (list of integers): list of the final times of the accumulation periods to consider.
 # RegionName_list (list of strings): list of names for the domain's regions.
 # RegionCode_list (list of integers): codes for the domain's regions to consider. 
+# RepetitionsBS (integer, from 0 to infinite): number of repetitions to consider in the bootstrapping.
+# SeedBS (integer): seed of the bootstrapping.
+# NumProcesses (integer): number of local processes to use (1 to run in serial).
+# CL_list (list of integers from 0 to 100, in percent): confidence levels for the definition of the confidence intervals.
+# SaveReplicatesBS (boolean): if True, the full arrays with all the bootstrapped percentiles are also saved.
+# ToleranceBS (float, in mm, or None): largest change of the bounds of the confidence intervals for stopping the bootstrap early (None to always draw RepetitionsBS replicates).
+# Perc_list (list of floats, from 0 to 100): percentiles to compute for the observational rainfall climatology.
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
-# DirIN (string): relative path containing the rainfall observations.
+# DirIN (string): relative path containing the observation store with the rainfall observations.
 # DirOUT (string): relative path where the observational rainfall climatologies will be stored.
 
 # INPUT PARAMETERS
@@ -30,10 +57,14 @@ AccPerF_list = [12,0]
 RegionName_list = ["Costa", "Sierra"]
 RegionCode_list = [1,2]
 RepetitionsBS = 10000
+SeedBS = 20200101
+NumProcesses = 1
+CL_list = [90,95,99]
+SaveReplicatesBS = False
+ToleranceBS = None
 Perc_list = np.concatenate((np.arange(1,100), np.array([99.5,99.8,99.9]))) # up to ~ 1 event in 3 years
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
-DirIN = "Data/Raw/OBS/Rain"
+DirIN = "Data/Compute/06_Extract_RainObs_Region_AccPer"
 DirOUT = "Data/Compute/15_Obs_Rain_Climate"
 #############################################################################################
 
@@ -43,8 +74,14 @@ DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h"
 if not os.path.exists(DirOUT_temp):
       os.makedirs(DirOUT_temp)
 
-# Reading the mask for the regions in the considered domain
-mask = mv.read(Git_repo + "/" + FileIN_Mask)
+# Reading the observation store
+obs_store = read_OBS_store(Git_repo + "/" + DirIN, Acc, ["Region", "Value"])
+
+# Defining the percentiles of the bootstrapped percentiles that define the confidence intervals
+Perc_CI = bootstrap_CI_percentiles(CL_list)
+
+# Creating the seeds for the bootstrapping in each region
+SeedSeq_Region_list = np.random.SeedSequence(SeedBS).spawn(len(RegionName_list))
 
 # Computing the observational rainfall climatology
 for in_Region in range(len(RegionName_list)):
@@ -55,66 +92,63 @@ for in_Region in range(len(RegionName_list)):
 
       print("Computing the rainfall calimatology from rainfall observations for " + RegionName)
 
-      # Initializing the variable that will contain the original/bootstrapped percentiles
-      obs_clim = np.empty([len(Perc_list),RepetitionsBS+1]) * np.nan
-
       # Reading the rainfall realizations from the observations
-      FileNameOUT_RainOBS_vals = "Obs_Rain_Vals_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + "_" + RegionName
-      FileNameOUT_RainOBS_lats = "Obs_Rain_Lats_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + "_" + RegionName
-      FileNameOUT_RainOBS_lons = "Obs_Rain_Lons_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + "_" + RegionName
-      if not os.path.exists(DirOUT_temp + "/" + FileNameOUT_RainOBS_vals + ".npy") and not os.path.exists(DirOUT_temp + "/" + FileNameOUT_RainOBS_lats + ".npy") and not os.path.exists(DirOUT_temp + "/" + FileNameOUT_RainOBS_lons + ".npy"): # if the files exist already, the while loop is not necessary and it is skipped
-            
-            # Initializing the variable that will contain the rainfall realizations
-            vals_obs = np.array([])
-            lats_obs = np.array([])
-            lons_obs = np.array([])
-
-            TheDate = DateS
-            while TheDate <= DateF:
-                  
-                  for AccPerF in AccPerF_list:
-                        
-                        print(" - Reading observations for accumulation period ending on " + TheDate.strftime("%Y%m%d") + " at " + f"{AccPerF:02d}")
-
-                        # Reading the rainfall observations
-                        FileIN = Git_repo + "/" + DirIN + "_" + f"{Acc:0d}" + "h/" + TheDate.strftime("%Y%m%d") + "/tp" + f"{Acc:02d}" + "_obs_" + TheDate.strftime("%Y%m%d") + f"{AccPerF:02d}" + ".geo"
-                        vals_obs_global = mv.read(FileIN)
-
-                        # Extracting the observations for the region to consider
-                        mask_obs = mv.nearest_gridpoint (mask,vals_obs_global)
-                        vals_obs_region = mv.values(mv.filter(vals_obs_global, mask_obs == RegionCode))
-                        lats_obs_region = mv.latitudes(mv.filter(vals_obs_global, mask_obs == RegionCode))
-                        lons_obs_region = mv.longitudes(mv.filter(vals_obs_global, mask_obs == RegionCode))
-
-                        if vals_obs_region is not None:
-                              vals_obs = np.concatenate((vals_obs, vals_obs_region))
-                              lats_obs = np.concatenate((lats_obs, lats_obs_region))
-                              lons_obs = np.concatenate((lons_obs, lons_obs_region))
-
-                  TheDate += timedelta(days=1)
-      
-            # Saving the rainfall observation realizations
-            np.save(DirOUT_temp + "/" + FileNameOUT_RainOBS_vals, vals_obs)
-            np.save(DirOUT_temp + "/" + FileNameOUT_RainOBS_lats, lats_obs)
-            np.save(DirOUT_temp + "/" + FileNameOUT_RainOBS_lons, lons_obs)
-
-      else:
-            
-            print(" - Reading the file containing all " + str(Acc) + "-hourly observations ending at " + str(AccPerF_list[0]) + " and " + str(AccPerF_list[-1])  +" UTC between " + DateS.strftime("%Y%m%d") + " and " + DateF.strftime("%Y%m%d"))
-            vals_obs = np.load(DirOUT_temp + "/" + FileName_RainOBS + ".npy")
+      # Note: the percentiles do not depend on the order of the observations, so they are read in the order of the store.
+      print(" - Reading all " + str(Acc) + "-hourly observations ending at " + str(AccPerF_list[0]) + " and " + str(AccPerF_list[-1])  +" UTC between " + DateS.strftime("%Y%m%d") + " and " + DateF.strftime("%Y%m%d"))
+      vals_obs = np.asarray(obs_store["Value"][OBS_store_select(obs_store, DateS, DateF + timedelta(hours=23), Hour_list=AccPerF_list, RegionCode=RegionCode)])
 
       # Computing the percentiles for the original observations
       print("Computing the original percentiles")
-      obs_clim[:,0] = np.percentile(vals_obs, Perc_list)
+      obs_clim_original = np.percentile(vals_obs, Perc_list)
 
       # Computing the percentiles for the bootstrapped observations
+      # Note: the rainfall realizations are compressed into their sorted unique values and counts, shared by all the replicates. The 
+      # blocks of bootstrapped percentiles are computed NumProcesses at a time, and summarised into the bounds of the confidence 
+      # intervals in the order of the blocks. If ToleranceBS is not None, the convergence is checked after each block, in the order
+      # of the blocks, and the blocks after the one where the bounds change by no more than ToleranceBS are discarded, so the number
+      # of replicates and the bounds do not depend on NumProcesses.
       print("Computing the bootstrapped percentiles")
-      for ind_BS in range(1,RepetitionsBS+1):
-            vals_obs_BS = np.array(choices(population=vals_obs, k=vals_obs.shape[0])) # list of bootstrapped obs
-            obs_clim[:,ind_BS] = np.percentile(vals_obs_BS, Perc_list)
+      vals_obs_unique, counts_obs_unique = np.unique(vals_obs, return_counts=True)
+      args_list = [(vals_obs_unique, counts_obs_unique, Perc_list, Block) for Block in bootstrap_blocks(SeedSeq_Region_list[in_Region], RepetitionsBS)]
+      if SaveReplicatesBS:
+            obs_clim_BS_list = run_bootstrap_tasks(bootstrap_percentiles_block, args_list, NumProcesses)
+      sketch = CI_sketch(Perc_CI, RepetitionsBS)
+      obs_clim_CI = np.empty([len(Perc_CI),len(Perc_list)]) * np.nan
+      NumRep_BS = 0
+      Converged = False
+      for ind_Block in range(0, len(args_list), NumProcesses):
+            if SaveReplicatesBS:
+                  obs_clim_BS_group = obs_clim_BS_list[ind_Block:(ind_Block+NumProcesses)]
+            else:
+                  obs_clim_BS_group = run_bootstrap_tasks(bootstrap_percentiles_block, args_list[ind_Block:(ind_Block+NumProcesses)], NumProcesses)
+            for obs_clim_BS in obs_clim_BS_group:
+                  update_CI_sketch(sketch, obs_clim_BS.T)
+                  NumRep_BS = NumRep_BS + obs_clim_BS.shape[1]
+                  if ToleranceBS is not None and not SaveReplicatesBS:
+                        obs_clim_CI_prev = obs_clim_CI
+                        obs_clim_CI = CI_sketch_percentiles(sketch)
+                        if NumRep_BS > obs_clim_BS.shape[1] and CI_change(obs_clim_CI, obs_clim_CI_prev) <= ToleranceBS:
+                              print(" - The bounds of the confidence intervals converged after " + str(NumRep_BS) + " replicates")
+                              Converged = True
+                              break
+            if Converged:
+                  break
+      if NumRep_BS > 0:
+            obs_clim_CI = CI_sketch_percentiles(sketch)
+            MC_error = CI_sketch_MC_error(sketch)
+      else:
+            MC_error = np.empty([len(Perc_CI),len(Perc_list)]) * np.nan
 
-      # Saving the plot
+      # Saving the original/bootstrapped percentiles (if requested)
       FileNameOUT_ClimOBS = "Obs_Rain_Climate_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + "_" + RegionName
       FileNameOUT_Percs = "Percs_computed_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d")
-      np.save(DirOUT_temp + "/" + FileNameOUT_ClimOBS, obs_clim)
-      np.save(DirOUT_temp + "/" + FileNameOUT_Percs, Perc_list)
\ No newline at end of file
+      if SaveReplicatesBS:
+            obs_clim = np.empty([len(Perc_list),RepetitionsBS+1]) * np.nan
+            obs_clim[:,0] = obs_clim_original
+            if len(obs_clim_BS_list) > 0:
+                  obs_clim[:,1:] = np.concatenate(obs_clim_BS_list, axis=1)
+            np.save(DirOUT_temp + "/" + FileNameOUT_ClimOBS, obs_clim)
+      np.save(DirOUT_temp + "/" + FileNameOUT_Percs, Perc_list)
+
+      # Saving the CI summaries, containing the percentiles, the original rainfall values, the lower and upper bounds of the confidence intervals, and their Monte-Carlo errors
+      save_CI_summary(DirOUT_temp + "/" + FileNameOUT_ClimOBS, Perc_list, obs_clim_original, obs_clim_CI.T, MC_error.T, CL_list, NumRep_BS, RepetitionsBS, ToleranceBS)
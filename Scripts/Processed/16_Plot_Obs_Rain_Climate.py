@@ -41,14 +41,25 @@ for ind_Region in range(len(RegionName_list)):
       DirIN_temp = Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h"
       FileIN_percs = "Percs_computed_"+ f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + ".npy"
       FileIN_rain_climate = "Obs_Rain_Climate_" + f"{Acc:02d}" + "h_" + DateS.strftime("%Y%m%d") + "_" + DateF.strftime("%Y%m%d") + "_" + RegionName + ".npy"
+      FileIN_rain_climate_CI = FileIN_rain_climate[:-4] + "_CI" + f"{CL:02d}" + ".npy"
       percs = np.load(DirIN_temp + "/" + FileIN_percs)
-      rain_climate_original = np.load(DirIN_temp + "/" + FileIN_rain_climate)[:,0]
-      rain_climate_BS = np.load(DirIN_temp + "/" + FileIN_rain_climate)[:,1:]
 
-      # Computing the confidence intervals from the bootstrapped rainfall values
-      alpha = 100 - CL # significance level (in %)
-      CI_lower = np.nanpercentile(rain_climate_BS, alpha/2, axis=1)
-      CI_upper = np.nanpercentile(rain_climate_BS, 100 - (alpha/2), axis=1)
+      # Reading the confidence intervals
+      # Note: the CI summary saved by "15_Compute_Obs_Rain_Climate.py" for the confidence level CL is read if it exists. Otherwise, 
+      # the confidence intervals are computed from the bootstrapped rainfall values.
+      if os.path.exists(DirIN_temp + "/" + FileIN_rain_climate_CI):
+            rain_climate_CI = np.load(DirIN_temp + "/" + FileIN_rain_climate_CI)
+            rain_climate_original = rain_climate_CI[:,1]
+            CI_lower = rain_climate_CI[:,2]
+            CI_upper = rain_climate_CI[:,3]
+      else:
+            rain_climate_original = np.load(DirIN_temp + "/" + FileIN_rain_climate)[:,0]
+            rain_climate_BS = np.load(DirIN_temp + "/" + FileIN_rain_climate)[:,1:]
+
+            # Computing the confidence intervals from the bootstrapped rainfall values
+            alpha = 100 - CL # significance level (in %)
+            CI_lower = np.nanpercentile(rain_climate_BS, alpha/2, axis=1)
+            CI_upper = np.nanpercentile(rain_climate_BS, 100 - (alpha/2), axis=1)
       
       # Plotting the observational rainfall climatologies
       fig, ax = plt.subplots(figsize=(8, 8))
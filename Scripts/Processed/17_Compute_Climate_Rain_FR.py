@@ -1,13 +1,21 @@
 import os
+import sys
 from datetime import datetime, time, timedelta
 import numpy as np
 import pandas as pd
 import metview as mv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Manifest import unit_key, read_manifest, mark_units_done, reset_manifest, save_checkpoint, read_checkpoint, remove_checkpoint
+
 ##########################################################################################################
 # CODE DESCRIPTION
 # 17_Compute_Climate_Rain_FR.py computes the climatology of rainfall events associated with flash floods.
 # Note: the code can take up 3 hours to run in serial.
+# Note: the code is resumable. The completed (EFFCI index, region) units are recorded in a work-unit manifest, and the 
+# rainfall events associated with the flood reports already considered are saved in a checkpoint every Checkpoint_NumFR 
+# reports (see "Scripts/Functions/Manifest.py"). A restarted run (with Resume=True) skips the completed units, and 
+# restarts the partial ones from their last checkpoint.
 
 # INPUT PARAMETERS DESCRIPTION
 # Year (year, in YYYY format): year to consider.
@@ -17,6 +25,8 @@ import metview as mv
 # Climate_Percs (list of floats, from 0 to 100): list of percentiles to compute for the rainfall climatology.
 # Format_Climate_Percs (string): format in the output files for the climatology percentiles.
 # RegionName_list (list of strings): names for the domain's regions.
+# Resume (boolean): True to resume the work completed by a previous run, False to start from scratch.
+# Checkpoint_NumFR (integer): number of flood reports between two checkpoints of the rainfall events.
 # Git_repo (string): repository's local path.
 # FileIN_FR (string): relative path of the file containing the cleaned point point flood reports.
 # DirIN_FC (string): relative path of the directory containing the ecPoint rainfall forecasts.
@@ -30,12 +40,20 @@ MagnitudeInPerc_Rain_Event_FR_list = [50, 75, 85, 90, 95, 98, 99]
 Climate_Percs = range(0,100)
 Format_Climate_Percs = "%d"
 RegionName_list = ["La Costa","La Sierra"]
+Resume = True
+Checkpoint_NumFR = 50
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
 FileIN_FR = "Data/Compute/01_Clean_PointFR/Ecu_FF_Hist_ECMWF.csv"
 DirIN_FC = "Data/Raw/FC/ecPoint"
 DirOUT = "Data/Compute/17_Climate_Rain_FR"
 ##########################################################################################################
 
+# Reading the work units already completed
+FileManifest = Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h/Manifest_" + str(Year) + ".txt"
+if not Resume:
+      reset_manifest(FileManifest)
+UnitKey_done = read_manifest(FileManifest)
+
 # Reading the cleaned point point flood reports for the considered year
 PointFR = pd.read_csv(Git_repo + "/" + FileIN_FR)
 
@@ -56,6 +74,12 @@ for EFFCI in EFFCI_list:
             print(" ")
             print("Computing the rainfall climatologies for EFFCI: " + str(EFFCI) + ", Region: " + RegionName)
 
+            # Checking whether the considered unit was already completed
+            UnitKey = unit_key(f"{EFFCI:02d}", RegionName)
+            if UnitKey in UnitKey_done:
+                  print(" - Already completed.")
+                  continue
+
             # Extracting the point point flood reports for a specific year, EFFCI  index and region
             PointFR_temp = PointFR.loc[(PointFR["year"] == Year) & (PointFR["EFFCI"] >= EFFCI) & (PointFR["Georegion"] == RegionName)]
 
@@ -65,10 +89,19 @@ for EFFCI in EFFCI_list:
             date_time_list = list(PointFR_temp["ReportDateTimeUTC"])
 
             # Initializing the variable that will contain the rainfall events associated with the point point flood reports
-            rain_event_FR = np.array(MagnitudeInPerc_Rain_Event_FR_list)
+            # Note: if a checkpoint exists, the rainfall events are resumed from it, starting from the first report not yet considered.
+            FileCheckpoint = Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h/Checkpoint_" + str(Year) + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName.split()[1] + ".npz"
+            checkpoint = read_checkpoint(FileCheckpoint) if Resume else None
+            if checkpoint is None:
+                  rain_event_FR = np.array(MagnitudeInPerc_Rain_Event_FR_list)
+                  ind_PointFR_S = 0
+            else:
+                  rain_event_FR = checkpoint["rain_event_FR"]
+                  ind_PointFR_S = int(checkpoint["ind_PointFR_next"])
+                  print(" - Resuming from point flood report n." + str(ind_PointFR_S+1))
 
             # Computing the rainfall climatology
-            for ind_PointFR in range(len(PointFR_temp)):
+            for ind_PointFR in range(ind_PointFR_S, len(PointFR_temp)):
                   
                   print(" - Considering point flood report n." + str(ind_PointFR+1) + " of " + str(len(PointFR_temp)))
 
@@ -112,6 +145,10 @@ for EFFCI in EFFCI_list:
                   # Computing different magnitudes of rainfall events associated with the point flood reports
                   rain_event_FR = np.vstack([rain_event_FR, np.percentile(np.array(fc_FR), MagnitudeInPerc_Rain_Event_FR_list)])
 
+                  # Saving the checkpoint of the rainfall events
+                  if (ind_PointFR + 1) % Checkpoint_NumFR == 0:
+                        save_checkpoint(FileCheckpoint, rain_event_FR=rain_event_FR, ind_PointFR_next=np.array(ind_PointFR + 1))
+
             # Computing the rainfall climatology for the different events' magnitudes
             climate_rain_FR = np.percentile(rain_event_FR[1:], Climate_Percs, axis=0) # eliminate the first row of values which come from the initialization of the variable
 
@@ -123,4 +160,8 @@ for EFFCI in EFFCI_list:
             FileNameOUT = "Climate_Rain_FR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" +  RegionName.split()[1] + ".csv"
             if not os.path.exists(DirOUT_temp):
                   os.makedirs(DirOUT_temp)
-            np.savetxt(DirOUT_temp + "/" + FileNameOUT, climate_rain_FR, delimiter=",", fmt=Format, header=Headers, comments='')            
\ No newline at end of file
+            np.savetxt(DirOUT_temp + "/" + FileNameOUT, climate_rain_FR, delimiter=",", fmt=Format, header=Headers, comments='')
+
+            # Recording the completed unit, and removing its checkpoint
+            mark_units_done(FileManifest, [UnitKey])
+            remove_checkpoint(FileCheckpoint)            
\ No newline at end of file
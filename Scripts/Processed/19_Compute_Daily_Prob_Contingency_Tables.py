@@ -1,15 +1,46 @@
 import os
-from datetime import datetime, timedelta
-import numpy as np
-import pandas as pd
-import metview as mv 
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Prob_CT import read_VRT_array
+from Mask_Geometry import read_mask_geometry
+from Verif_Pass import verif_pass, verif_pass_parallel
+from Manifest import reset_manifest
+from Online_Bootstrap import remove_online_bootstrap
 
 ##########################################################################################################
 # CODE DESCRIPTION
-# 19_Compute_Daily_Prob_Contingency_Tables.py computes daily probabilistic contingency tables, and stores them in a 3d-array 
-# whose dimensions are (NumDays, NumProbThr, NumElementsCT).
-# Note: the code can take up 4 days to run in serial. It is recommended to run separate months in parallel to take down the 
-# runtime to 8 hours. 
+# 19_Compute_Daily_Prob_Contingency_Tables.py computes daily probabilistic contingency tables, and stores them, for each 
+# forecasting system, EFFCI index, VRT, region and year, in a 4d-array whose dimensions are (NumDays, NumStepF, NumEM+1, 4), 
+# i.e. the probability thresholds (number of members, from NumEM to 0, exceeding the VRT) and the elements of the contingency 
+# tables, with a separate validity mask whose dimensions are (NumDays, NumStepF) (see "Scripts/Functions/CT_Store.py").
+# Note: the code can take up 4 days to run in serial. Set NumProcesses > 1 to run it in parallel: the work is divided in 
+# shards, i.e. (forecasting system, steps, date range) units, which are run across NumProcesses local processes (see 
+# verif_pass_parallel in "Scripts/Functions/Verif_Pass.py"). The outputs are the same as those of a serial run.
+# Note: the code is resumable. Each completed (system, step, date) unit is recorded in a work-unit manifest (see 
+# "Scripts/Functions/Manifest.py"), and a restarted run (with Resume=True) skips the units already completed. Set 
+# Resume=False to recompute everything (e.g. after changing the EFFCI indexes, the VRTs or the regions).
+# Note: the forecasts are traversed run by run. Each run is read only once from the forecast cube, all its accumulation 
+# periods are built in memory, and the contingency tables for all steps, EFFCI indexes, VRTs and regions are computed 
+# in that single visit.
+# Note: for each forecast field, the gridded flood reports for all the EFFCI indexes are stacked and the whole block of 
+# contingency tables (EFFCI x VRT x region x probability threshold) is computed in one call (see "Scripts/Functions/Prob_CT.py").
+# The climatology of rainfall events associated with flash floods and the regions' grid-points are read only once, and 
+# the gridded flood reports of the whole period are loaded at startup in an in-memory cache restricted to the regions' 
+# grid-points (see "Scripts/Functions/GridFR_Events.py").
+# Note: the daily probabilistic contingency tables are saved in contingency-table stores (see "Scripts/Functions/CT_Store.py"), 
+# i.e. one memory-mapped array per forecasting system, EFFCI index, VRT, region and year, indexed by date, step, probability 
+# threshold and element of the contingency table, together with a validity mask for the missing forecasts. Different 
+# periods (e.g. separate months) can be run in parallel, since they write different days of the same stores.
+# Note: the code runs the fused verification pass (see "Scripts/Functions/Verif_Pass.py"). From the same read of each input, 
+# it also computes the daily counts of forecasts and observations exceeding the VRTs (i.e. the outputs of 
+# "23_Compute_Counts_FC_OBS_Exceeding_VRT.py"), so 23 does not need to be run. Further daily scores can be added to Score_list.
+# Note: set OnlineBS = True to bootstrap the daily scores while they are computed (see "Scripts/Functions/Online_Bootstrap.py"). 
+# Each day is given, in each of the RepetitionsOnlineBS replicates, a Poisson(1) weight generated from SeedBS and the day, and 
+# the weighted daily scores are added to accumulators saved beside the stores. At the end of the pass, the bootstrapped totals 
+# over the verification period are already available, and "20_Compute_AROC_Bootstrapping.py" (with OnlineBS = True) does 
+# not need to re-read the daily contingency tables. The accumulators are valid only for the verification period of the pass.
 
 # INPUT PARAMETERS DESCRIPTION
 # DateS (date, in format YYYYMMDD): start date of the considered verification period.
@@ -24,13 +55,21 @@ import metview as mv
 # RegionCode_list (list of integers): list of codes for the domain's regions. 
 # RegionName_list (list of strings): list of names for the domain's regions.
 # SystemFC_list (list of strings): list of names of forecasting systems to consider.
+# Score_list (list of strings): list of daily scores to compute in the fused verification pass.
+# NumProcesses (integer): number of local processes to use (1 to run in serial).
+# Shard_NumDays (integer): maximum number of runs in each shard (used only if NumProcesses > 1).
+# Shard_NumStepF (integer): maximum number of final steps in each shard (used only if NumProcesses > 1).
+# Resume (boolean): True to skip the work units completed by a previous run, False to start from scratch.
+# OnlineBS (boolean): True to bootstrap the daily scores while they are computed.
+# RepetitionsOnlineBS (integer): number of repetitions to consider in the online bootstrapping.
+# SeedBS (integer): seed of the online bootstrapping.
 # Git_repo (string): repository's local path.
-# FileIN_Mask (string): relative path of the file containing the domain's mask.
+# DirIN_Mask_Geo (string): relative path of the directory containing the geometry of the domain's mask (see "Scripts/Raw/Create_Mask_Geometry.py").
 # DirIN_Climate_Rain_FR (string): relative path of the file containing the climatology of the rainfall 
 #     events associated with flash floods. 
-# DirIN_FC (string): relative path of the directory containing the rainfall forecasts.
+# DirIN_FC_Cube (string): relative path of the directory containing the forecast cubes (see "Scripts/Raw/Create_FC_Cube.py").
 # DirIN_GridFR (string): relative path containing the gridded flood reports.
-# DirOUT (string): relative path of the directory containing the daily probabilistic contingency tables.
+# DirOUT_Score_list (list of strings): relative paths of the directories containing the stores of each daily score.
 
 # INPUT PARAMETERS
 DateS = datetime(2020,2,1,0)
@@ -45,141 +84,45 @@ Perc_VRT = 25
 RegionCode_list = [1,2];
 RegionName_list = ["Costa","Sierra"];
 SystemFC_list = ["ENS", "ecPoint"]
+Score_list = ["CT", "Count_FC_OBS"]
+NumProcesses = 1
+Shard_NumDays = 31
+Shard_NumStepF = 10
+Resume = True
+OnlineBS = False
+RepetitionsOnlineBS = 1000
+SeedBS = 20200101
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
-FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
+DirIN_Mask_Geo = "Data/Raw/Mask_Geometry"
 DirIN_Climate_Rain_FR = "Data/Compute/07_Climate_Rain_FR"
-DirIN_FC = "Data/Raw/FC"
+DirIN_FC_Cube = "Data/Raw/FC_Cube"
 DirIN_GridFR = "Data/Compute/03_GridFR_EFFCI_AccPer"
-DirOUT = "Data/Compute/19_Daily_Prob_Contingency_Tables"
+DirOUT_Score_list = ["Data/Compute/19_Daily_Prob_Contingency_Tables", "Data/Compute/23_Counts_FC_OBS_Exceeding_VRT"]
 ##########################################################################################################
 
 
-# COSTUME FUNCTIONS
-
-# Computation of daily probabilistic contingency tables
-def daily_prob_ct(tp, obs, VRT, NumEM):
-      
-      # Counting how many ensemble members exceed the VRT
-      count_members_exceeding_VRT = np.sum((tp >= VRT), axis=0)
-
-      # Initializing the variable that will contained the daily probabilistic contingency table
-      ct = np.empty([NumEM+1,5])
-
-      # Computing the daily probabilistic contingency table
-      for index in range(NumEM+1):
-            count_members = NumEM - index
-            OBS_yes_fc = obs[np.where(count_members_exceeding_VRT >= count_members)[0]] # observation instances for "yes" forecasts
-            OBS_no_fc = obs[np.where(count_members_exceeding_VRT < count_members)[0]] # observation instances for "no" forecasts
-            ct[index][0] = count_members # N. OF MEMBERS (AT LEAST) EXCEEDING VRT
-            ct[index][1] = np.where(OBS_yes_fc > 0)[0].shape[0] # HITS
-            ct[index][2] = np.where(OBS_yes_fc == 0)[0].shape[0] # FALSE ALARMS
-            ct[index][3] = np.where(OBS_no_fc > 0)[0].shape[0] # MISSES
-            ct[index][4] = np.where(OBS_no_fc == 0)[0].shape[0] # CORRECT NEGATIVES
-            ct = ct.astype(int) # setting all values as integers
-
-      return ct
-
-################################################################################
+# Reading the geometry of the mask for the considered domain
+mask_geo = read_mask_geometry(Git_repo + "/" + DirIN_Mask_Geo)
 
-
-# Reading the file containing the mask for the considered domain
-mask = mv.values(mv.read(Git_repo + "/" + FileIN_Mask))
+# Reading the verifying rainfall events (VRTs) for all the EFFCI indexes, regions and magnitudes of rainfall events associated with flash floods
+VRT_array = read_VRT_array(Git_repo + "/" + DirIN_Climate_Rain_FR, Acc, EFFCI_list, RegionName_list, MagnitudeInPerc_Rain_Event_FR_list, Perc_VRT)
 
 # Computing the daily probabilistic contingency tables
 print(" ")
 print("Computing daily probabilistic contingency tables for the period between " + DateS.strftime("%Y%m%d") + " and " + DateF.strftime("%Y%m%d"))
 
-# Creating the daily probabilistic contingency tables for a specific forecasting system
-for SystemFC in SystemFC_list:
-
-      # Initializing the list containing, for a specific lead time, the dates for which the rainfall forecasts exist
-      StepF_Dates_list = []
-
-      # Creating the daily probabilistic contingency tables for a specific lead time
-      for StepF in range(StepF_Start, (StepF_Final+1), Disc_Step):
-            
-            # Creating the daily probabilistic contingency tables for a specific date
-            TheDate = DateS
-            while TheDate <= DateF:
-                  
-                  print(" ")
-                  print(" - Reading " + SystemFC + ", StepF=" + str(StepF) + ", FC date: " + TheDate.strftime("%Y-%m-%d") + " at " + TheDate.strftime("%H") + " UTC")
-
-                  # Reading the rainfall forecasts for the considered date
-                  tp = [] # variable needed to asses whether the forecasts for the considered date exist
-                  if SystemFC == "ENS":
-                        # Note: converting the forecasts in accumulated rainfall over the considered period. Converting also their units from m to mm.
-                        StepS = StepF - Acc
-                        FileIN_FC_temp1= Git_repo + "/" + DirIN_FC + "/" + SystemFC + "/" + TheDate.strftime("%Y%m%d%H") + "/tp_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepS:03d}" + ".grib"
-                        FileIN_FC_temp2= Git_repo + "/" + DirIN_FC + "/" + SystemFC + "/" + TheDate.strftime("%Y%m%d%H") + "/tp_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                        if os.path.isfile(FileIN_FC_temp1) and os.path.isfile(FileIN_FC_temp1):
-                              tp1 = mv.read(FileIN_FC_temp1)
-                              tp2 = mv.read(FileIN_FC_temp2)
-                              tp = mv.values((tp2-tp1) * 1000)
-                  elif SystemFC == "ecPoint":
-                        # Note: the forecasts are already accumulated over the considered period, and are already expressed in mm. The forecasts are stored in files whose name indicates the end of the accumulated period.
-                        FileIN_FC_temp= Git_repo + "/" + DirIN_FC + "/" + SystemFC + "/" + TheDate.strftime("%Y%m%d%H") + "/Pt_BC_PERC_" + f"{Acc:03d}" + "_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".grib"
-                        if os.path.isfile(FileIN_FC_temp):
-                              tp = mv.values(mv.read(FileIN_FC_temp))
-                  
-                  # Checking that the rainfall forecasts exist for the considered date. If not, they are not added in the 3d-array
-                  if len(tp) != 0:
-                        
-                        # Extracting the number of ensemble members in the considered forecasting system
-                        NumEM = tp.shape[0]
-
-                        # Defining the valid time for the accumulation period
-                        ValidTimeF = TheDate + timedelta(hours=StepF)
-
-                        # Creating the daily probabilistic contingency tables for a specific EFFCI index
-                        for EFFCI in EFFCI_list: 
-                              
-                              # Reading the accumulated gridded flood reports
-                              # Note: the accumulated gridded flood reports are stored in files whose name indicates the end of the accumulated period.
-                              FileIN_GridFR_temp = Git_repo + "/" + DirIN_GridFR + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/" + ValidTimeF.strftime("%Y%m%d") + "/GridFR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" + ValidTimeF.strftime("%Y%m%d") + "_" + ValidTimeF.strftime("%H") + ".grib"
-                              GridFR = mv.values(mv.read(FileIN_GridFR_temp))
-
-                              # Creating the daily probabilistic contingency tables for a specific region
-                              for indReg in range(len(RegionCode_list)):
-
-                                    # Extracting the name and the code of the region of interest
-                                    RegionName = RegionName_list[indReg]
-                                    RegionCode = RegionCode_list[indReg]
-
-                                    # Selecting the grid-boxes belonging to the considered region
-                                    ind_mask_region = np.where(mask == RegionCode)[0]
-
-                                    # Selecting the grid-boxes in the observational fileds belonging to the considered region
-                                    GridFR_region = GridFR[ind_mask_region]
-                                    
-                                    # Reading the climatology of rainfall events associated with flash floods
-                                    File_Rain_Climate_FR = Git_repo + "/" + DirIN_Climate_Rain_FR + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/Climate_Rain_FR_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName + ".csv"
-                                    climate_rain_FR = pd.read_csv(File_Rain_Climate_FR)
-                                    
-                                    # Creating the daily probabilistic contingency tables for a specific magnitude of rainfall events associated with flash floods
-                                    for MagnitudeInPerc_Rain_Event_FR in MagnitudeInPerc_Rain_Event_FR_list:
-                              
-                                          print("     - Computing ct for VRT>=tp(" + str(MagnitudeInPerc_Rain_Event_FR) + "th perc)" + "," + RegionName + ", EFFCI>=" + str(EFFCI))
-
-                                          # Selecting the considered verifying rainfall event (VRT)
-                                          VRT = climate_rain_FR["RainEvent_Magnitude_" + str(MagnitudeInPerc_Rain_Event_FR) + "th_Percentile"][Perc_VRT]
-
-                                          # Selecting the grid-boxes in the forecast fields belonging to the considered region 
-                                          tp_region = tp[:, ind_mask_region]
-                                          
-                                          # Computing the probabilistic contingecy table
-                                          ct = daily_prob_ct(tp_region, GridFR_region, VRT, NumEM)
-
-                                          # Saving the probabilistic contingency table
-                                          DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "/" + f"{StepF:03d}" + "/" + SystemFC + "/" + RegionName
-                                          FileNameOUT_temp = "CT_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName + "_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".csv"
-                                          if not os.path.exists(DirOUT_temp):
-                                                os.makedirs(DirOUT_temp)
-                                          ct_df = pd.DataFrame(ct, columns = ["N. OF MEMBERS (AT LEAST) EXCEEDING VRT", "HITS", "FALSE ALARMS", "MISSES", "CORRECT NEGATIVES"])
-                                          ct_df.to_csv(DirOUT_temp + "/" + FileNameOUT_temp, index=False)
-
-                  else:
-
-                        print("   - NOTE: the requested forecast is not present in the database.")
-
-                  TheDate += timedelta(days=1)         
+# Defining the work-unit manifest (one per set of daily scores)
+FileManifest = Git_repo + "/" + DirOUT_Score_list[0] + "/" + f"{Acc:02d}" + "h/Manifest_" + "_".join(Score_list) + ".txt"
+if not Resume:
+      reset_manifest(FileManifest)
+      for DirOUT_Score in DirOUT_Score_list:
+            remove_online_bootstrap(Git_repo + "/" + DirOUT_Score, Acc)
+
+# Creating the daily probabilistic contingency tables for a specific forecasting system, in serial or in parallel
+StepF_list = list(range(StepF_Start, (StepF_Final+1), Disc_Step))
+OnlineBS_par = (RepetitionsOnlineBS, SeedBS) if OnlineBS else None
+if NumProcesses > 1:
+      verif_pass_parallel(NumProcesses, Shard_NumDays, Shard_NumStepF, Git_repo, SystemFC_list, DateS, DateF, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, FileManifest, OnlineBS_par)
+else:
+      for SystemFC in SystemFC_list:
+            verif_pass(Git_repo, SystemFC, DateS, DateF, StepF_list, Acc, EFFCI_list, MagnitudeInPerc_Rain_Event_FR_list, RegionCode_list, RegionName_list, mask_geo, VRT_array, Score_list, DirIN_FC_Cube, DirIN_GridFR, DirOUT_Score_list, FileManifest=FileManifest, OnlineBS=OnlineBS_par)
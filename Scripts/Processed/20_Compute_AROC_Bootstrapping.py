@@ -1,15 +1,47 @@
 import os
-from datetime import datetime, timedelta
-from  random import choices
+import sys
+from datetime import datetime
 import numpy as np
-import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Bootstrap import open_bootstrap_plan, bootstrap_store, bootstrap_CI_percentiles, bootstrap_CI_replicates, save_CI_summary, run_bootstrap_tasks
+from Online_Bootstrap import online_bootstrap_repetitions, online_bootstrap_store
+from ROC import AROC_trapezoidal
 
 
 ##########################################################################################################
 # CODE DESCRIPTION
 # 20_Compute_AROC_Bootstrapping.py computes the area under the ROC curves (AROC), including the bootstrapped 
 # values to estimate the statistical significance of the estimates.
-# Note: the code can take up to 2 hours to run to run in series.
+# Note: the code takes a few seconds to run in series. All the bootstrapped replicates are drawn at once as a multinomial 
+# count matrix over the days, the bootstrapped contingency tables are computed with one matrix product with the daily 
+# contingency tables, and AROC is computed for all replicates in one array operation (see "Scripts/Functions/Bootstrap.py"). 
+# The replicates are processed in chunks that fit in MemoryBS_MB megabytes.
+# Note: the bootstrapped replicates are read from the resampling plan for the verification period (see "Scripts/Functions/Bootstrap.py"),
+# which is generated once from the seed SeedBS and shared with "24_Compute_FB_Bootstrapping.py". The bootstrapped values are 
+# therefore reproducible, and paired across forecasting systems, EFFCI indexes, VRTs, regions and lead times (e.g. the confidence 
+# intervals of the AROC difference between ecPoint and ENS come from the difference of their bootstrapped values).
+# Note: as in the original computation, each lead time resamples only the days with a contingency table (i.e. for which the 
+# forecasts existed), as many times as those days. The lead times with missing days use a plan over their valid days drawn from
+# the same seed (see bootstrap_plan_valid in "Scripts/Functions/Bootstrap.py"), so they stay paired with the lead times, forecasting
+# systems and partitions with the same valid days.
+# Note: set NumProcesses > 1 to run the partitions (forecasting system, EFFCI index, VRT and region) across NumProcesses local 
+# processes (see run_bootstrap_tasks in "Scripts/Functions/Bootstrap.py").
+# Note: by default, the bootstrapped AROC values are not kept. They are summarised, while they are computed, into the bounds of the 
+# confidence intervals for the confidence levels in CL_list (see "Scripts/Functions/Bootstrap.py"), which are identical to the ones
+# computed with np.nanpercentile over all the replicates. Only the compact CI summaries are saved, and read directly by 
+# "21_Plot_AROC_CI.py". Set SaveReplicatesBS = True to save also the full arrays with all the bootstrapped AROC values.
+# Note: set ToleranceBS to a number to stop the bootstrap of a partition once the bounds of its confidence intervals change by no 
+# more than ToleranceBS between two batches of 1000 replicates, instead of always drawing RepetitionsBS replicates. The number of 
+# replicates drawn and the Monte-Carlo errors of the bounds are saved with the CI summaries. ToleranceBS is ignored if 
+# SaveReplicatesBS = True.
+# Note: set OnlineBS = True to compute AROC from the accumulators of the online bootstrap filled by the fused verification pass 
+# of "19_Compute_Daily_Prob_Contingency_Tables.py" (run with OnlineBS = True, and the same DateS, DateF and SeedBS), instead of 
+# re-reading the daily contingency tables (see "Scripts/Functions/Online_Bootstrap.py"). RepetitionsBS is then read from the 
+# metadata of the accumulators (i.e. it is RepetitionsOnlineBS in 19). The replicates use Poisson(1) weights for each day, instead of the resampling plan, so they are not 
+# paired with those of "24_Compute_FB_Bootstrapping.py", and ToleranceBS is not used.
+# Note: AROC is computed with the trapezoidal approximation (see "Scripts/Functions/ROC.py"), and it is not rounded, so that 
+# the resolution of the bootstrapped distributions is kept.
 
 # INPUT PARAMETERS DESCRIPTION
 # DateS (date, in format YYYYMMDD): start date of the considered verification period.
@@ -20,13 +52,21 @@ import pandas as pd
 # Acc (number, in hours): rainfall accumulation to consider.
 # EFFCI_list (list of integers, from 1 to 10): list of EFFCI indexes to consider.
 # MagnitudeInPerc_Rain_Event_FR_list (list of integers, from 0 to 100): magnitude of potentially flash-flood-leading rainfall events.
-# RepetitionsBS (integer, from 0 to infinite): number of repetitions to consider in the bootstrapping.
+# RepetitionsBS (integer, from 0 to infinite): number of repetitions to consider in the bootstrapping (not used if OnlineBS = True).
+# MemoryBS_MB (integer, in megabytes): memory budget for the bootstrapped replicates processed at once.
+# SeedBS (integer): seed of the resampling plan.
+# NumProcesses (integer): number of local processes to use (1 to run in serial).
+# CL_list (list of integers from 0 to 100, in percent): confidence levels for the definition of the confidence intervals.
+# SaveReplicatesBS (boolean): if True, the full arrays with all the bootstrapped AROC values are also saved.
+# ToleranceBS (float, or None): largest change of the bounds of the confidence intervals for stopping the bootstrap early (None to always draw RepetitionsBS replicates).
+# OnlineBS (boolean): True to read the bootstrapped contingency tables from the accumulators of the online bootstrap.
 # RegionName_list (list of strings): list of names for the domain's regions.
 # SystemFC_list (list of strings): list of names of forecasting systems to consider.
 # NumEM_list (list of integers): numer of ensemble members in the considered forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the daily probabilistic contingency tables.
-# DirOUT (string): relative path of the directory containing the AROC values, including the bootstrapped ones.
+# DirIN (string): relative path containing the stores of daily probabilistic contingency tables (see "Scripts/Functions/CT_Store.py").
+# DirPlanBS (string): relative path of the directory containing the resampling plans.
+# DirOUT (string): relative path of the directory containing the AROC values, with their CI summaries (and the bootstrapped values, if requested).
 
 # INPUT PARAMETERS
 DateS = datetime(2020,1,1,0)
@@ -38,132 +78,81 @@ Acc = 12
 EFFCI_list = [1,6,10]
 MagnitudeInPerc_Rain_Event_FR_list = [85,99]
 RepetitionsBS = 10000
+MemoryBS_MB = 256
+SeedBS = 20200101
+NumProcesses = 1
+CL_list = [90,95,99]
+SaveReplicatesBS = False
+ToleranceBS = None
+OnlineBS = False
 RegionName_list = ["Costa","Sierra"]
 SystemFC_list = ["ENS", "ecPoint"]
 NumEM_list = [51,99]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
 DirIN = "Data/Compute/19_Daily_Prob_Contingency_Tables"
+DirPlanBS = "Data/Compute/Bootstrap_Plan"
 DirOUT = "Data/Compute/20_AROC_Bootstrapping"
 ##########################################################################################################
 
 
-# COSTUME FUNCTIONS
-
-# Computation of the area under the ROC curve, using the trapezoidal approximation
-def AROC_trapezoidal(ct):
-      
-      # Computing hit rates (hr) and false alarm rates (far).
-      hr = ct[:,0] / (ct[:,0] + ct[:,2]) # hit rates
-      far = ct[:,1] / (ct[:,1] + ct[:,3]) # false alarms
-      
-      # Adding the points (0,0) and (1,1) to the arrays to ensure the ROC curve is closed.
-      hr = np.insert(hr, 0, 0) 
-      hr = np.insert(hr, -1, 1)
-      far = np.insert(far, 0, 0) 
-      far = np.insert(far, -1, 1) 
-      
-      # Computing the AROC with the trapezoidal approximation, and approximating its value to the second decimal digit.
-      aroc = 0
-      for i in range(len(hr)-1):
-            j = i+1
-            a = hr[i]
-            b = hr[i+1]
-            h = far[i+1] - far[i]
-            aroc = aroc + ( ( (a+b)*h ) / 2 )
-      aroc = round(aroc,2)
-
-      return aroc
-####################################################################################################
-
+# Reading the number of repetitions of the online bootstrap from the metadata of its accumulators (if the online bootstrap is used)
+if OnlineBS:
+      RepetitionsBS = online_bootstrap_repetitions(Git_repo + "/" + DirIN, "CT", Acc, EFFCI_list[0], MagnitudeInPerc_Rain_Event_FR_list[0], SystemFC_list[0], RegionName_list[0], DateS.year, SeedBS)
 
 print(" ")
 print("Computing AROC, including " + str(RepetitionsBS) + " bootstrapped values")
 
-# Computing the totals number of days contained in the considered verification period
-NumTotDays = (DateF-DateS).days + 1
+# Creating the resampling plan for the considered verification period (if it does not exist and the online bootstrap is not used)
+if not OnlineBS:
+      plan_BS, meta_plan_BS = open_bootstrap_plan(Git_repo + "/" + DirPlanBS, DateS, DateF, RepetitionsBS, SeedBS)
 
 # Creating the list containing the steps to considered in the computations
 StepF_list = range(StepF_Start, (StepF_Final+1), Disc_Step)
 
-# Computing the variables containing the sizes of the AROC variables
-m = len(StepF_list)
-n = len(range(RepetitionsBS + 1))
+# Defining the percentiles of the bootstrapped AROC values that define the confidence intervals
+Perc_CI = bootstrap_CI_percentiles(CL_list)
 
-# Computing AROC for a specific forecasting system
+# Defining the partitions (forecasting system, EFFCI index, VRT and region) for which AROC is computed
+Partition_list = []
+args_list = []
 for indSystemFC in range(len(SystemFC_list)):
-      
-      # Selecting the forecasting system to consider and its number of ensemble members 
       SystemFC = SystemFC_list[indSystemFC]
       NumEM = NumEM_list[indSystemFC]
-
-      # Computing AROC for a specific EFFCI index
       for EFFCI in EFFCI_list:
-            
-            # Computing AROC for a specific VRT
             for MagnitudeInPerc_Rain_Event_FR in MagnitudeInPerc_Rain_Event_FR_list:
-
-                  # Computing AROC for a specific region
-                  for indRegion in range(len(RegionName_list)): 
-                  
-                        # Selecting the region to consider
-                        RegionName = RegionName_list[indRegion]
-
-                        print(" - For " + SystemFC + ", " + RegionName + ", EFFCI>=" + str(EFFCI) + ", VRT>=tp(" + str(MagnitudeInPerc_Rain_Event_FR) + "th percentile)")
-
-                        # Initializing the variables containing the AROC values, and the bootstrapped ones
-                        AROC_array = np.zeros([m,n+1])
-            
-                        # Computing AROC for a specific lead time
-                        for indStepF in range(len(StepF_list)):
-                              
-                              # Selecting the StepF to consider
-                              StepF = StepF_list[indStepF]
-                              print("     - Considering StepF=" + str(StepF) + " ...")
-
-                              # Storing information about the step computed
-                              AROC_array[indStepF, 0] = StepF
-
-                              # Reading the daily probabilistic contingency tables for the original list of dates
-                              original_datesSTR_array = [] # list of dates for which a contingency table was created (not all steps have one if the forecasts did not exist)
-                              ct_AllDays_original = np.full((NumEM+1,4), np.nan) # initialize the 3d-array containing the daily contingency tables for those days in which one was computed. The variable is initialized with a 2d-array filled of NaNs, and contains the same dimensions of the daily probabilistic contingency tables 
-                              TheDate = DateS
-                              while TheDate <= DateF:
-                                    DirIN_temp= Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "/" + f"{StepF:03d}" + "/" + SystemFC + "/" + RegionName
-                                    FileNameIN_temp = "CT_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName + "_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".csv"
-                                    if os.path.isfile(DirIN_temp + "/" + FileNameIN_temp): # if the files exists, add the correspondent daily probabilistic contingency table to the 3d-array
-                                          original_datesSTR_array.append(TheDate.strftime("%Y%m%d"))
-                                          ProbThr = pd.read_csv(DirIN_temp + "/" + FileNameIN_temp).to_numpy()[:,0]
-                                          ct_daily = pd.read_csv(DirIN_temp + "/" + FileNameIN_temp).to_numpy()[:,1:]
-                                          ct_AllDays_original = np.concatenate((ct_AllDays_original, ct_daily), axis=0)
-                                    else: # if the file does not exist, add a 2d-array filled with NaNs to the 3d-array
-                                          ct_AllDays_original = np.concatenate((ct_AllDays_original, np.full((NumEM+1,4), np.nan)), axis=0)
-                                    TheDate += timedelta(days=1)
-                              ct_AllDays_original = ct_AllDays_original.reshape((NumTotDays+1,(NumEM+1),4)) # reshape the long 2d-array into a 3d-array 
-                              NumDays = len(original_datesSTR_array)
-                              ind_nan2del = np.any(~np.isnan(ct_AllDays_original), axis=(1,2))
-                              ct_AllDays_original = ct_AllDays_original[ind_nan2del] # eliminate the 2d-arrays containing only NaNs
-                              
-                              # Computing AROC for the original and the bootstrapped probabilistic contingency tables
-                              for ind_repBS in range(RepetitionsBS+1):
-                                    
-                                    # Selecting the original or the bootstrapped contingency tables
-                                    if ind_repBS == 0: # original
-                                          ct = ct_AllDays_original
-                                    else: # bootstrapped
-                                          datesBS_array = np.array(choices(population=original_datesSTR_array, k=NumDays)) # list of bootstrapped dates
-                                          indBS = np.searchsorted(original_datesSTR_array, datesBS_array) # indexes of the bootstrapped dates
-                                          ct = ct_AllDays_original[indBS,:,:] # indexing the bootstrapped daily probabilistic contingency tables
-                                    
-                                    # Adding the correspondent elements of the daily probabilistic contingency tables over the condisered verification period
-                                    ct_tot = np.sum(ct, axis=0) #2d-array, of the same dimensions of the daily probabilistic contingency tables
-                                    
-                                    # Computing AROC
-                                    AROC = AROC_trapezoidal(ct_tot)
-                                    AROC_array[indStepF, ind_repBS+1] = AROC
-
-                        # Saving the AROC array
-                        DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h"
-                        FileNameOUT_temp = "AROC_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName
-                        if not os.path.exists(DirOUT_temp):
-                              os.makedirs(DirOUT_temp)
-                        np.save(DirOUT_temp + "/" + FileNameOUT_temp, AROC_array)
\ No newline at end of file
+                  for RegionName in RegionName_list:
+                        Partition_list.append((SystemFC, EFFCI, MagnitudeInPerc_Rain_Event_FR, RegionName))
+                        args_list.append((Git_repo + "/" + DirIN, "CT", Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF, StepF_list, NumEM, AROC_trapezoidal, Git_repo + "/" + DirPlanBS, RepetitionsBS, SeedBS, MemoryBS_MB, (None if SaveReplicatesBS else Perc_CI), ToleranceBS))
+
+# Computing AROC for the original and the bootstrapped probabilistic contingency tables, for all the partitions and lead times
+# Note: the daily contingency tables of each partition are read from its memory-mapped store. Each lead time resamples only the 
+# days for which it has a contingency table. The daily contingency tables are added over the verification period for all the 
+# replicates at once.
+# With the online bootstrap, the totals over the verification period are read directly from the accumulators.
+print(" - Computing " + str(len(Partition_list)) + " partitions over " + str(NumProcesses) + " processes")
+AROC_BS_list = run_bootstrap_tasks((online_bootstrap_store if OnlineBS else bootstrap_store), args_list, NumProcesses)
+
+# Saving the AROC arrays for a specific partition
+for indPartition in range(len(Partition_list)):
+
+      SystemFC, EFFCI, MagnitudeInPerc_Rain_Event_FR, RegionName = Partition_list[indPartition]
+      DirOUT_temp= Git_repo + "/" + DirOUT + "/" + f"{Acc:02d}" + "h"
+      FileNameOUT_temp = "AROC_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName
+      if not os.path.exists(DirOUT_temp):
+            os.makedirs(DirOUT_temp)
+      
+      # Creating and saving the AROC array, containing the steps and the AROC values, including the bootstrapped ones (if requested)
+      if SaveReplicatesBS:
+            AROC_array = np.zeros([len(StepF_list), RepetitionsBS + 2])
+            AROC_array[:, 0] = StepF_list
+            AROC_array[:, 1:] = AROC_BS_list[indPartition]
+            np.save(DirOUT_temp + "/" + FileNameOUT_temp, AROC_array)
+            AROC_original = AROC_array[:, 1]
+            AROC_CI, MC_error = bootstrap_CI_replicates(AROC_array[:, 2:].T, Perc_CI)
+            AROC_CI, MC_error, NumRep_BS = AROC_CI.T, MC_error.T, RepetitionsBS
+      else:
+            AROC_CI, NumRep_BS, MC_error = AROC_BS_list[indPartition]
+            AROC_original, AROC_CI = AROC_CI[:, 0], AROC_CI[:, 1:]
+
+      # Saving the CI summaries, containing the steps, the original AROC values, the lower and upper bounds of the confidence intervals, and their Monte-Carlo errors
+      save_CI_summary(DirOUT_temp + "/" + FileNameOUT_temp, StepF_list, AROC_original, AROC_CI, MC_error, CL_list, NumRep_BS, RepetitionsBS, ToleranceBS)
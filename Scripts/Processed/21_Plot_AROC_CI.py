@@ -17,7 +17,7 @@ import matplotlib.pyplot as plt
 # SystemFC_list (list of strings): list of names of forecasting systems to consider.
 # Colour_SystemFC_list (list of strings): colours used to plot the AROC values for different forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the real and boostrapped AROC values.
+# DirIN (string): relative path containing the real AROC values, with their CI summaries or boostrapped values.
 # DirOUT (string):  relative path of the directory containing the plots of the real and boostrapped AROC values.
 
 # INPUT PARAMETERS
@@ -55,17 +55,27 @@ for EFFCI in EFFCI_list:
                         SystemFC = SystemFC_list[indSystemFC]
                         Colour_SystemFC = Colour_SystemFC_list[indSystemFC]
 
-                        # Reading the steps computed, and the original and bootstrapped AROC values
+                        # Reading the steps computed, the original AROC values, and the confidence intervals
+                        # Note: the CI summary saved by "20_Compute_AROC_Bootstrapping.py" for the confidence level CL is read if it exists. Otherwise, 
+                        # the confidence intervals are computed from the bootstrapped AROC values.
                         DirIN_temp= Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h"
                         FileNameIN_temp = "AROC_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName + ".npy"
-                        StepF = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,0].astype(int)
-                        aroc_real = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,1]
-                        aroc_BS = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,2:]
+                        FileNameIN_CI_temp = FileNameIN_temp[:-4] + "_CI" + f"{CL:02d}" + ".npy"
+                        if os.path.exists(DirIN_temp + "/" + FileNameIN_CI_temp):
+                              aroc_CI = np.load(DirIN_temp + "/" + FileNameIN_CI_temp)
+                              StepF = aroc_CI[:,0].astype(int)
+                              aroc_real = aroc_CI[:,1]
+                              CI_lower = aroc_CI[:,2]
+                              CI_upper = aroc_CI[:,3]
+                        else:
+                              StepF = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,0].astype(int)
+                              aroc_real = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,1]
+                              aroc_BS = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,2:]
 
-                        # Computing the confidence intervals from the bootstrapped AROC values
-                        alpha = 100 - CL # significance level (in %)
-                        CI_lower = np.nanpercentile(aroc_BS, alpha/2, axis=1)
-                        CI_upper = np.nanpercentile(aroc_BS, 100 - (alpha/2), axis=1)
+                              # Computing the confidence intervals from the bootstrapped AROC values
+                              alpha = 100 - CL # significance level (in %)
+                              CI_lower = np.nanpercentile(aroc_BS, alpha/2, axis=1)
+                              CI_upper = np.nanpercentile(aroc_BS, 100 - (alpha/2), axis=1)
 
                         # Plotting the AROC values
                         ax.plot(StepF, aroc_real, "o-", color=Colour_SystemFC, label=SystemFC, linewidth=3)
@@ -1,13 +1,19 @@
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from CT_Store import read_CT_store
+from ROC import roc_curve
+
 #####################################################################################
 # CODE DESCRIPTION
 # 22_Plot_ROC.py plots ROC curves.
 # Note: the code can take up 20 minutes to run in serial.
+# Note: the ROC curves for all the lead times are computed in one call for each forecasting system and region (see 
+# "Scripts/Functions/ROC.py"), and are closed with the points (0,0) and (1,1).
 
 # INPUT PARAMETERS DESCRIPTION
 # DateS (date, in format YYYYMMDD): start date of the considered verification period.
@@ -26,7 +32,7 @@ import matplotlib.pyplot as plt
 # NumEM_list (list of integers): numer of ensemble members in the considered forecasting systems.
 # Colour_SystemFC_list (list of strings): colours used to plot ROC curves for different forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the daily probabilistic contingency tables.
+# DirIN (string): relative path containing the stores of daily probabilistic contingency tables (see "Scripts/Functions/CT_Store.py").
 # DirOUT (string): relative path of the directory containing the ROC curve plots.
 
 # INPUT PARAMETERS
@@ -54,6 +60,17 @@ for EFFCI in EFFCI_list:
        # Plotting ROC curves for a specific VRT
       for MagnitudeInPerc_Rain_Event_FR in MagnitudeInPerc_Rain_Event_FR_list:
 
+            # Computing the ROC curves for all the lead times, forecasting systems and regions
+            # Note: the daily probabilistic contingency tables are added over the verification period, for the days in which one was 
+            # computed, and each contingency-table store is read only once for all the lead times.
+            ROC_curves = {}
+            for SystemFC in SystemFC_list:
+                  for RegionName in RegionName_list:
+                        ct_store, Valid_store, meta_store = read_CT_store(Git_repo + "/" + DirIN, "CT", Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF)
+                        ct_tot = np.einsum("ds,dspe->spe", Valid_store.astype(np.int64), np.asarray(ct_store, dtype=np.int64))
+                        hr, far = roc_curve(ct_tot)
+                        ROC_curves[(SystemFC, RegionName)] = (hr, far, meta_store["ind_StepF"])
+
             # Plotting ROC curves for a specific lead time
             for StepF in range(StepF_Start, (StepF_Final+1), Disc_Step):
                   
@@ -77,20 +94,10 @@ for EFFCI in EFFCI_list:
                               RegionName = RegionName_list[indRegion]
                               Lines_Region = Lines_Region_list[indRegion]
 
-                              # Reading the daily probabilistic contingency tables, and adding them over the verification period
-                              ct_tot = np.zeros((NumEM+1,4), dtype=int)
-                              TheDate = DateS
-                              while TheDate <= DateF:
-                                    DirIN_temp= Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/EFFCI" + f"{EFFCI:02d}" + "/VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "/" + f"{StepF:03d}" + "/" + SystemFC + "/" + RegionName
-                                    FileNameIN_temp = "CT_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName +"_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".csv"
-                                    if os.path.isfile(DirIN_temp + "/" + FileNameIN_temp):
-                                          ct_daily = pd.read_csv(DirIN_temp + "/" + FileNameIN_temp).to_numpy()[:,1:]
-                                          ct_tot = ct_tot + ct_daily
-                                    TheDate += timedelta(days=1) 
-
-                              # Computing hit rates and false alarm rates 
-                              hr = ct_tot[:,0] / (ct_tot[:,0] + ct_tot[:,2])
-                              far = ct_tot[:,1] / (ct_tot[:,1] + ct_tot[:,3])
+                              # Selecting the hit rates and false alarm rates for the considered lead time
+                              hr_all, far_all, ind_StepF_store = ROC_curves[(SystemFC, RegionName)]
+                              hr = hr_all[ind_StepF_store[StepF]]
+                              far = far_all[ind_StepF_store[StepF]]
 
                               # Plotting the ROC curves
                               ax.plot(far, hr, Lines_Region, color=Colour_SystemFC, label=SystemFC + " - " + RegionName, linewidth=2)
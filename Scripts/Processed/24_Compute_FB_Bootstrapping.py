@@ -1,13 +1,34 @@
 import os
-from datetime import datetime, timedelta
-from  random import choices
+import sys
+from datetime import datetime
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Prob_CT import frequency_bias
+from Bootstrap import open_bootstrap_plan, bootstrap_store_block, bootstrap_CI_percentiles, bootstrap_CI_replicates, save_CI_summary, run_bootstrap_tasks
+
 ######################################################################################
 # CODE DESCRIPTION
 # 24_Compute_FB_Bootstrapping.py computes the Frequency Bias (FB), including the bootstrapped 
 # values to estimate the statistical significance of the estimates.
-# Note: the code can take up to 2 hours to run.
+# Note: the code takes a few seconds to run in series. The daily counts of each store are read only once into one array with 
+# dimensions (NumDays, VRT, region, NumStepF, 2), and the bootstrapped counts are computed for all the replicates, VRTs, regions 
+# and lead times with one matrix product between the resampling plan and the daily counts (see "Scripts/Functions/Bootstrap.py"), 
+# in chunks that fit in MemoryBS_MB megabytes.
+# Note: set NumProcesses > 1 to run the tasks (forecasting system and EFFCI index) across NumProcesses local 
+# processes (see run_bootstrap_tasks in "Scripts/Functions/Bootstrap.py").
+# Note: the bootstrapped replicates are read from the resampling plan for the verification period (see "Scripts/Functions/Bootstrap.py"),
+# which is generated once from the seed SeedBS and shared with "20_Compute_AROC_Bootstrapping.py". Each replicate contains how 
+# many times each day is drawn. The bootstrapped values are therefore reproducible, and paired across forecasting systems, EFFCI 
+# indexes, VRTs, regions and lead times.
+# Note: by default, the bootstrapped FB values are not kept. They are summarised, while they are computed, into the bounds of the 
+# confidence intervals for the confidence levels in CL_list (see "Scripts/Functions/Bootstrap.py"), which are identical to the ones
+# computed with np.nanpercentile over all the replicates. Only the compact CI summaries are saved, and read directly by 
+# "25_Plot_FB_CI.py". Set SaveReplicatesBS = True to save also the full arrays with all the bootstrapped FB values.
+# Note: set ToleranceBS to a number to stop the bootstrap of a task (forecasting system and EFFCI index) once the bounds of the 
+# confidence intervals of all its VRTs, regions and lead times change by no more than ToleranceBS between two batches of 1000 
+# replicates, instead of always drawing RepetitionsBS replicates. The number of replicates drawn and the Monte-Carlo errors of the 
+# bounds are saved with the CI summaries. ToleranceBS is ignored if SaveReplicatesBS = True.
 
 # INPUT PARAMETERS DESCRIPTION
 # DateS (date, in format YYYYMMDD): start date of the considered verification period.
@@ -20,12 +41,19 @@ import numpy as np
 # MagnitudeInPerc_Rain_Event_FR_list (list of integers, from 0 to 100): list of magnitudes, in 
 #     percentiles, of rainfall events that can potentially conduct to flash floods.
 # RepetitionsBS (integer, from 0 to infinite): number of repetitions to consider in the bootstrapping.
+# MemoryBS_MB (integer, in megabytes): memory budget for the bootstrapped replicates processed at once.
+# SeedBS (integer): seed of the resampling plan.
+# NumProcesses (integer): number of local processes to use (1 to run in serial).
+# CL_list (list of integers from 0 to 100, in percent): confidence levels for the definition of the confidence intervals.
+# SaveReplicatesBS (boolean): if True, the full arrays with all the bootstrapped FB values are also saved.
+# ToleranceBS (float, or None): largest change of the bounds of the confidence intervals for stopping the bootstrap early (None to always draw RepetitionsBS replicates).
 # RegionName_list (list of strings): list of names for the domain's regions.
 # SystemFC_list (list of strings): list of names of forecasting systems to consider.
 # NumEM_list (list of integers): numer of ensemble members in the considered forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the daily probabilistic contingency tables.
-# DirOUT (string): relative path of the directory containing the FB values, including the bootstrapped ones.
+# DirIN (string): relative path containing the stores of daily counts of forecasts and observations exceeding the VRTs (see "Scripts/Functions/CT_Store.py").
+# DirPlanBS (string): relative path of the directory containing the resampling plans.
+# DirOUT (string): relative path of the directory containing the FB values, with their CI summaries (and the bootstrapped values, if requested).
 
 # INPUT PARAMETERS
 DateS = datetime(2020,1,1,0)
@@ -37,11 +65,18 @@ Acc = 12
 EFFCI_list = [1,6,10]
 MagnitudeInPerc_Rain_Event_FR_list = [85,99]
 RepetitionsBS = 10000
+MemoryBS_MB = 256
+SeedBS = 20200101
+NumProcesses = 1
+CL_list = [90,95,99]
+SaveReplicatesBS = False
+ToleranceBS = None
 RegionName_list = ["Costa","Sierra"]
 SystemFC_list = ["ENS", "ecPoint"]
 NumEM_list = [51,99]
 Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
 DirIN = "Data/Compute/23_Counts_FC_OBS_Exceeding_VRT"
+DirPlanBS = "Data/Compute/Bootstrap_Plan"
 DirOUT_FB = "Data/Compute/24_FB_Bootstrapping"
 ######################################################################################
 
@@ -49,70 +84,62 @@ DirOUT_FB = "Data/Compute/24_FB_Bootstrapping"
 print(" ")
 print("Computing FB, including " + str(RepetitionsBS) + " bootstrapped values")
 
-# Sorting the dates to consider in the bootstrapping
+# Creating the resampling plan for the considered verification period (if it does not exist)
 NumDays = (DateF-DateS).days + 1
-Dates_Orig = np.array([DateS + timedelta(days=i) for i in range(NumDays)])
-Dates_BS = (np.array([choices(population=Dates_Orig, k=NumDays) for i in range(RepetitionsBS)])).flatten()
-temp = {value: index for index, value in enumerate(Dates_Orig)}
-ind_Dates_BS = (np.array([temp[elem] for elem in Dates_BS])).reshape(RepetitionsBS,NumDays)
+plan_BS, meta_plan_BS = open_bootstrap_plan(Git_repo + "/" + DirPlanBS, DateS, DateF, RepetitionsBS, SeedBS)
 
 # Creating the list containing the steps to considered in the computations
 StepF_list = range(StepF_Start, (StepF_Final+1), Disc_Step)
 NumStepF = len(StepF_list)
 
-# Computing FB for a specific forecasting system
+# Defining the percentiles of the bootstrapped FB values that define the confidence intervals
+Perc_CI = bootstrap_CI_percentiles(CL_list)
+
+# Defining the tasks (one per forecasting system and EFFCI index) for which FB is computed
+# Note: each task reads once the stores of all the VRTs and regions for its forecasting system and EFFCI index, and bootstraps 
+# them together, so that each chunk of the resampling plan is read and converted only once per task.
+Task_list = []
+args_list = []
 for indSystemFC in range(len(SystemFC_list)):
-      
-      # Selecting the forecasting system to consider and its number of ensemble members 
       SystemFC = SystemFC_list[indSystemFC]
       NumEM = NumEM_list[indSystemFC]
-
-      # Computing FB for a specific EFFCI index
       for EFFCI in EFFCI_list:
-            
-            # Computing FB for a specific VRT
-            for MagnitudeInPerc_Rain_Event_FR in MagnitudeInPerc_Rain_Event_FR_list:
-
-                  # Computing FB for a specific region
-                  for indRegion in range(len(RegionName_list)): 
-                  
-                        # Selecting the region to consider
-                        RegionName = RegionName_list[indRegion]
-
-                        print(" - For " + SystemFC + ", " + RegionName + ", EFFCI>=" + str(EFFCI) + ", VRT>=tp(" + str(MagnitudeInPerc_Rain_Event_FR) + "th percentile)")
-
-                        # Initializing the variable that will contained the FB values
+            Task_list.append((SystemFC, EFFCI))
+            args_list.append((Git_repo + "/" + DirIN, "Count_FC_OBS", Acc, [EFFCI], MagnitudeInPerc_Rain_Event_FR_list, SystemFC, RegionName_list, DateS, DateF, StepF_list, NumEM, frequency_bias, Git_repo + "/" + DirPlanBS, RepetitionsBS, SeedBS, MemoryBS_MB, (None if SaveReplicatesBS else Perc_CI), ToleranceBS))
+
+# Computing FB for the original and the bootstrapped counts, for all the partitions and lead times
+# Note: the counts of yes-events in the forecasts are converted into counts of grid-points (i.e. divided by the number of ensemble 
+# members and rounded), and the missing counts (i.e. if the forecasts did not exist) are set to zero. The counts of each day are 
+# weighted by the number of times the day is drawn in each replicate of the resampling plan.
+print(" - Computing " + str(len(Task_list)) + " tasks over " + str(NumProcesses) + " processes")
+FB_list = run_bootstrap_tasks(bootstrap_store_block, args_list, NumProcesses)
+
+# Saving the FB arrays for a specific partition (forecasting system, EFFCI index, VRT and region)
+for indTask in range(len(Task_list)):
+      
+      SystemFC, EFFCI = Task_list[indTask]
+      for indVRT in range(len(MagnitudeInPerc_Rain_Event_FR_list)):
+            MagnitudeInPerc_Rain_Event_FR = MagnitudeInPerc_Rain_Event_FR_list[indVRT]
+            for indReg in range(len(RegionName_list)):
+                  RegionName = RegionName_list[indReg]
+
+                  DirOUT_temp= Git_repo + "/" + DirOUT_FB + "/" + f"{Acc:02d}" + "h"
+                  FileNameOUT_temp = "FB_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName
+                  if not os.path.exists(DirOUT_temp):
+                        os.makedirs(DirOUT_temp)
+
+                  # Creating and saving the FB array, containing the steps and the FB values, including the bootstrapped ones (if requested)
+                  if SaveReplicatesBS:
                         FB_BS = np.empty((NumStepF, RepetitionsBS + 2))
-
-                        # Computing FB for a specific lead time
-                        for indStepF in range(NumStepF):
-                              
-                              # Selecting the StepF to consider
-                              StepF = StepF_list[indStepF]
-                              FB_BS[indStepF,0] = StepF
-
-                              print("     - Considering StepF=" + str(StepF) + " ...")
-
-                              # Reading the counts of yes-events in the forecasts and observations for the original dates
-                              count_yes_fc = np.empty(NumDays) * np.nan
-                              count_yes_obs = np.empty(NumDays) * np.nan
-                              for ind_Date in range(len(Dates_Orig)):
-                                    TheDate = Dates_Orig[ind_Date]
-                                    FileIN = Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/EFFCI" +  f"{EFFCI:02d}" + "/VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "/" + f"{StepF:03d}" + "/" + SystemFC + "/" + RegionName + "/Count_FC_OBS_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName + "_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF:03d}" + ".npy"
-                                    if os.path.isfile(FileIN):
-                                          count_yes_fc[ind_Date] = np.round(np.load(FileIN)[0]/NumEM).astype(int)
-                                          count_yes_obs[ind_Date] = np.load(FileIN)[1]
-                              FB_BS[indStepF,1] = np.nansum(count_yes_fc) / np.nansum(count_yes_obs)
-
-                              # Extracting the bootstrapped values for the counts
-                              for ind_BS in range(RepetitionsBS):
-                                    count_yes_fc_BS = count_yes_fc[ind_Dates_BS[ind_BS,:]]
-                                    count_yes_obs_BS = count_yes_obs[ind_Dates_BS[ind_BS,:]]
-                                    FB_BS[indStepF,ind_BS+2] = np.nansum(count_yes_fc_BS) / np.nansum(count_yes_obs_BS)
-
-                        # Saving the FB array
-                        DirOUT_temp= Git_repo + "/" + DirOUT_FB + "/" + f"{Acc:02d}" + "h"
-                        FileNameOUT_temp = "FB_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName
-                        if not os.path.exists(DirOUT_temp):
-                              os.makedirs(DirOUT_temp)
-                        np.save(DirOUT_temp + "/" + FileNameOUT_temp, FB_BS)
\ No newline at end of file
+                        FB_BS[:,0] = StepF_list
+                        FB_BS[:,1:] = FB_list[indTask][0, indVRT, indReg]
+                        np.save(DirOUT_temp + "/" + FileNameOUT_temp, FB_BS)
+                        FB_original = FB_BS[:,1]
+                        FB_CI, MC_error = bootstrap_CI_replicates(FB_BS[:,2:].T, Perc_CI)
+                        FB_CI, MC_error, NumRep_BS = FB_CI.T, MC_error.T, RepetitionsBS
+                  else:
+                        FB_CI, NumRep_BS, MC_error = FB_list[indTask]
+                        FB_original, FB_CI, MC_error = FB_CI[0, indVRT, indReg, :, 0], FB_CI[0, indVRT, indReg, :, 1:], MC_error[0, indVRT, indReg]
+
+                  # Saving the CI summaries, containing the steps, the original FB values, the lower and upper bounds of the confidence intervals, and their Monte-Carlo errors
+                  save_CI_summary(DirOUT_temp + "/" + FileNameOUT_temp, StepF_list, FB_original, FB_CI, MC_error, CL_list, NumRep_BS, RepetitionsBS, ToleranceBS)
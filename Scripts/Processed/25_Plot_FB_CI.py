@@ -19,7 +19,7 @@ import matplotlib.pyplot as plt
 # SystemFC_list (list of strings): list of names of forecasting systems to consider.
 # Colour_SystemFC_list (list of strings): colours used to plot the FB for different forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the real and boostrapped FB values.
+# DirIN (string): relative path containing the real FB values, with their CI summaries or boostrapped values.
 # DirOUT (string): relative path of the directory containing the plots of the real and boostrapped FB values.
 
 # INPUT PARAMETERS
@@ -57,17 +57,27 @@ for EFFCI in EFFCI_list:
                         SystemFC = SystemFC_list[indSystemFC]
                         Colour_SystemFC = Colour_SystemFC_list[indSystemFC]
 
-                        # Reading the steps computed, and the original and bootstrapped FB values
+                        # Reading the steps computed, the original FB values, and the confidence intervals
+                        # Note: the CI summary saved by "24_Compute_FB_Bootstrapping.py" for the confidence level CL is read if it exists. Otherwise, 
+                        # the confidence intervals are computed from the bootstrapped FB values.
                         DirIN_temp= Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h"
                         FileNameIN_temp = "FB_" + f"{Acc:02d}" + "h_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_EFFCI" + f"{EFFCI:02d}" + "_" + RegionName + ".npy"
-                        StepF = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,0].astype(int)
-                        fb_real = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,1]
-                        fb_BS = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,2:]
-                        
-                        # Computing the confidence intervals from the bootstrapped FB values
-                        alpha = 100 - CL # significance level (in %)
-                        CI_lower = np.nanpercentile(fb_BS, alpha/2, axis=1)
-                        CI_upper = np.nanpercentile(fb_BS, 100 - (alpha/2), axis=1)
+                        FileNameIN_CI_temp = FileNameIN_temp[:-4] + "_CI" + f"{CL:02d}" + ".npy"
+                        if os.path.exists(DirIN_temp + "/" + FileNameIN_CI_temp):
+                              fb_CI = np.load(DirIN_temp + "/" + FileNameIN_CI_temp)
+                              StepF = fb_CI[:,0].astype(int)
+                              fb_real = fb_CI[:,1]
+                              CI_lower = fb_CI[:,2]
+                              CI_upper = fb_CI[:,3]
+                        else:
+                              StepF = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,0].astype(int)
+                              fb_real = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,1]
+                              fb_BS = np.load(DirIN_temp + "/" + FileNameIN_temp)[:,2:]
+
+                              # Computing the confidence intervals from the bootstrapped FB values
+                              alpha = 100 - CL # significance level (in %)
+                              CI_lower = np.nanpercentile(fb_BS, alpha/2, axis=1)
+                              CI_upper = np.nanpercentile(fb_BS, 100 - (alpha/2), axis=1)
                         
                         # Plotting the FB values
                         ax.plot(StepF, fb_real, "o-", color=Colour_SystemFC, label=SystemFC, linewidth=3)
@@ -1,11 +1,15 @@
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.dates import DateFormatter
 from matplotlib.ticker import MaxNLocator
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from CT_Store import read_CT_store
+
 #####################################################################################################################
 # CODE DESCRIPTION
 # 26_Plot_Count_YesFC_YesOBS.py plots the counts of yes forecast and observation events.
@@ -27,7 +31,7 @@ from matplotlib.ticker import MaxNLocator
 # Colour_SystemFC_list (list of strings): colours used to plot the counts of yes forecasts and observation events for different forecasting systems.
 # NumEM_list (list of integers): numer of ensemble members in the considered forecasting systems.
 # Git_repo (string): repository's local path.
-# DirIN (string): relative path containing the daily probabilistic contingency tables.
+# DirIN (string): relative path containing the stores of daily counts of forecasts and observations exceeding the VRTs (see "Scripts/Functions/CT_Store.py").
 # DirOUT (string): relative path of the directory containing the FB values, including the bootstrapped ones.
 
 # INPUT PARAMETERS
@@ -70,22 +74,17 @@ for MagnitudeInPerc_Rain_Event_FR in MagnitudeInPerc_Rain_Event_FR_list:
                   Colour_SystemFC = Colour_SystemFC_list[indSystemFC]
                   NumEM = NumEM_list[indSystemFC]
 
-                  # Initializing the variables containing the considered dates, and the correspondent forecasts and observations counts
-                  count_yes_fc = []
-                  count_yes_obs = []
-                  TheDates_list = []
-
                   # Reading the counts for the selected dates
-                  TheDate = DateS
-                  while TheDate <= DateF:
-                        TheDates_list.append(TheDate)
-                        FileIN = Git_repo + "/" + DirIN + "/" + f"{Acc:02d}" + "h/EFFCI" +  f"{EFFCI:02d}" + "/VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "/" + f"{StepF_2_Plot:03d}" + "/" + SystemFC + "/" + RegionName + "/Count_FC_OBS_" + f"{Acc:02d}" + "h_EFFCI" + f"{EFFCI:02d}" + "_VRT" + f"{MagnitudeInPerc_Rain_Event_FR:02d}" + "_" + SystemFC + "_" + RegionName + "_" + TheDate.strftime("%Y%m%d") + "_" + TheDate.strftime("%H") + "_" + f"{StepF_2_Plot:03d}" + ".npy"
-                        count_yes_fc.append(np.load(FileIN)[0] / NumEM)
-                        count_yes_obs.append(np.load(FileIN)[1])
-                        TheDate += timedelta(days=1)
+                  # Note: the counts for the dates without forecasts are set to NaN.
+                  count_store, Valid_store, meta_store = read_CT_store(Git_repo + "/" + DirIN, "Count_FC_OBS", Acc, EFFCI, MagnitudeInPerc_Rain_Event_FR, SystemFC, RegionName, DateS, DateF)
+                  ind_StepF_store = meta_store["ind_StepF"][StepF_2_Plot]
+                  Valid_StepF = Valid_store[:, ind_StepF_store]
+                  count_yes_fc = np.where(Valid_StepF, count_store[:, ind_StepF_store, 0] / NumEM, np.nan)
+                  count_yes_obs = np.where(Valid_StepF, count_store[:, ind_StepF_store, 1], np.nan)
+                  TheDates_list = [datetime.strptime(BaseDateTimeSTR, "%Y%m%d%H") for BaseDateTimeSTR in meta_store["BaseDateTime"]]
 
                   # Computing the max count in the forecasts
-                  max_count_yes_fc_list.append(np.max(np.array(count_yes_fc)))
+                  max_count_yes_fc_list.append(np.nanmax(count_yes_fc))
 
                   # Plotting the counts
                   ax1.plot(TheDates_list, count_yes_fc, ".-", color=Colour_SystemFC, label=SystemFC, linewidth=1)
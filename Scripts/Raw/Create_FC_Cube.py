@@ -0,0 +1,117 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import metview as mv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from FC_Cube import create_FC_cube, save_FC_cube_meta
+from Mask_Geometry import read_mask_geometry, mask_geometry_index
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Create_FC_Cube.py converts the raw rainfall forecasts stored in "Data/Raw/FC" (one .grib file per run
+# and step) into forecast cubes, i.e. single memory-mapped float32 arrays with dimensions (NumRuns,
+# NumSteps, NumEM, NumGP) and a small .json metadata sidecar (see "Scripts/Functions/FC_Cube.py").
+# Each raw .grib file is decoded only once. The compute stages then slice the cubes instead of decoding
+# the same .grib files every time they run.
+# NOTE: the raw ENS forecasts are stored as cumulative rainfall (in m) from the beginning of the run,
+# while the raw ecPoint forecasts are stored as rainfall accumulated over Acc hours (in mm).
+# NOTE: if RegionCode_list is not empty, the code runs in "extraction mode", i.e. it stores only the grid-points
+# that belong to the considered regions of the domain's mask (together with their global indexes). The stored 
+# fields then take kilobytes instead of a full global field, and multi-year archives can be kept on local disk.
+# The extraction mode is opt-in: the global maps in 09 and 13 need the full fields, as the grid-points outside
+# the regions would be missing values.
+
+# INPUT PARAMETERS DESCRIPTION
+# BaseDateS (date, in format YYYYMMDD): first forecast's base date to convert.
+# BaseDateF (date, in format YYYYMMDD): last forecast's base date to convert.
+# BaseTime (integer, in UTC hours): forecast's base time to convert.
+# SystemFC_list (list of strings): list of names of forecasting systems to convert.
+# Acc_list (list of integers, in hours): accumulation period of the raw forecasts (0 for cumulative forecasts).
+# StepS_list (list of integers, in hours): first step to convert for each forecasting system.
+# StepF_list (list of integers, in hours): last step to convert for each forecasting system.
+# Disc_Step (integer, in hours): discretization for the steps to convert.
+# NumEM_list (list of integers): number of ensemble members in the considered forecasting systems.
+# Units_list (list of strings): units of the raw forecasts.
+# RegionCode_list (list of integers): codes for the domain's regions to store (empty list to store the global fields).
+# Git_repo (string): repository's local path.
+# DirIN_Mask_Geo (string): relative path of the directory containing the geometry of the domain's mask (see "Scripts/Raw/Create_Mask_Geometry.py").
+# DirIN (string): relative path of the directory containing the raw rainfall forecasts.
+# DirOUT (string): relative path of the directory containing the forecast cubes.
+
+# INPUT PARAMETERS
+BaseDateS = datetime(2020,1,1)
+BaseDateF = datetime(2020,12,31)
+BaseTime = 0
+SystemFC_list = ["ENS", "ecPoint"]
+Acc_list = [0, 12]
+StepS_list = [0, 12]
+StepF_list = [246, 246]
+Disc_Step = 6
+NumEM_list = [51, 99]
+Units_list = ["m", "mm"]
+RegionCode_list = []
+Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
+DirIN_Mask_Geo = "Data/Raw/Mask_Geometry"
+DirIN = "Data/Raw/FC"
+DirOUT = "Data/Raw/FC_Cube"
+##########################################################################################################
+
+
+# Reading the geometry of the domain's mask to define the number of grid-points in the raw forecasts, and the grid-points to store
+mask_geo = read_mask_geometry(Git_repo + "/" + DirIN_Mask_Geo)
+NumGP_Global = mask_geo["NumGP"]
+if len(RegionCode_list) != 0:
+      Ind_GP = mask_geometry_index(mask_geo, RegionCode_list)
+else:
+      Ind_GP = None
+
+# Creating the list of runs to convert
+BaseDateTime_list = []
+BaseDate = BaseDateS
+while BaseDate <= BaseDateF:
+      BaseDateTime_list.append(BaseDate + timedelta(hours=BaseTime))
+      BaseDate += timedelta(days=1)
+
+# Creating the forecast cube for a specific forecasting system
+for indSystemFC in range(len(SystemFC_list)):
+
+      SystemFC = SystemFC_list[indSystemFC]
+      Acc = Acc_list[indSystemFC]
+      Step_list = list(range(StepS_list[indSystemFC], StepF_list[indSystemFC]+1, Disc_Step))
+      NumEM = NumEM_list[indSystemFC]
+
+      # Initializing the forecast cube
+      cube, meta = create_FC_cube(Git_repo + "/" + DirOUT, SystemFC, Acc, BaseDateTime_list, Step_list, NumEM, NumGP_Global, Units_list[indSystemFC], Ind_GP)
+      print(" ")
+      print("Creating the forecast cube for " + SystemFC + " (" + str(len(BaseDateTime_list)) + " runs, " + str(len(Step_list)) + " steps, " + str(NumEM) + " members, " + str(meta["NumGP"]) + " grid-points)")
+
+      # Converting the raw forecasts for a specific run
+      for ind_BaseDateTime in range(len(BaseDateTime_list)):
+
+            BaseDateTime = BaseDateTime_list[ind_BaseDateTime]
+            print(" - Converting the run on " + BaseDateTime.strftime("%Y%m%d") + " at " + BaseDateTime.strftime("%H") + " UTC")
+
+            # Converting the raw forecasts for a specific step
+            for ind_Step in range(len(Step_list)):
+
+                  Step = Step_list[ind_Step]
+                  DirIN_temp = Git_repo + "/" + DirIN + "/" + SystemFC + "/" + BaseDateTime.strftime("%Y%m%d%H")
+                  if SystemFC == "ecPoint":
+                        FileIN = DirIN_temp + "/Pt_BC_PERC_" + f"{Acc:03d}" + "_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{Step:03d}" + ".grib"
+                  else:
+                        FileIN = DirIN_temp + "/tp_" + BaseDateTime.strftime("%Y%m%d") + "_" + BaseDateTime.strftime("%H") + "_" + f"{Step:03d}" + ".grib"
+
+                  if os.path.isfile(FileIN):
+                        tp = mv.values(mv.read(FileIN))
+                        if Ind_GP is not None:
+                              tp = tp[..., Ind_GP]
+                        cube[ind_BaseDateTime, ind_Step] = tp
+                        meta["Available"][ind_BaseDateTime][ind_Step] = True
+                  else:
+                        print("   - NOTE: the forecast for step " + str(Step) + " is not present in the database.")
+
+      # Saving the forecast cube and its metadata
+      cube.flush()
+      del cube
+      save_FC_cube_meta(Git_repo + "/" + DirOUT, meta)
@@ -0,0 +1,75 @@
+import os
+import sys
+from datetime import datetime
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from FC_Cube import read_FC_cube, create_FC_cube, save_FC_cube_meta, deaccumulate_FC_run
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Create_FC_Cube_Acc.py de-accumulates the cumulative rainfall forecasts (e.g. raw ENS) stored in a forecast
+# cube, and saves the rainfall accumulated over different accumulation periods (in mm) in new forecast cubes.
+# The new cubes have the same layout as the ecPoint ones (i.e. the steps indicate the end of the accumulation
+# periods), so that all forecasting systems are read by the compute stages through the same code path.
+# Each run of the cumulative cube is read only once, and all the accumulation periods are derived from it.
+# NOTE: the cumulative forecast cube needs to be created first with "Scripts/Raw/Create_FC_Cube.py".
+
+# INPUT PARAMETERS DESCRIPTION
+# SystemFC (string): name of the forecasting system to de-accumulate.
+# Acc_list (list of integers, in hours): rainfall accumulation periods to compute.
+# Disc_StepF (integer, in hours): discretization for the final steps of the accumulation periods.
+# Git_repo (string): repository's local path.
+# DirIN (string): relative path of the directory containing the cumulative forecast cube.
+# DirOUT (string): relative path of the directory containing the accumulated forecast cubes.
+
+# INPUT PARAMETERS
+SystemFC = "ENS"
+Acc_list = [6, 12, 24]
+Disc_StepF = 6
+Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
+DirIN = "Data/Raw/FC_Cube"
+DirOUT = "Data/Raw/FC_Cube"
+##########################################################################################################
+
+
+# Reading the cumulative forecast cube
+cube_cum, meta_cum = read_FC_cube(Git_repo + "/" + DirIN, SystemFC, 0)
+Step_list = meta_cum["Step"]
+BaseDateTime_list = [datetime.strptime(BaseDateTimeSTR, "%Y%m%d%H") for BaseDateTimeSTR in meta_cum["BaseDateTime"]]
+
+# Initializing the forecast cubes for all the accumulation periods
+cube_acc_list = []
+meta_acc_list = []
+StepF_list_all = []
+for Acc in Acc_list:
+      StepF_list = list(range(Step_list[0] + Acc, Step_list[-1] + 1, Disc_StepF))
+      cube_acc, meta_acc = create_FC_cube(Git_repo + "/" + DirOUT, SystemFC, Acc, BaseDateTime_list, StepF_list, meta_cum["NumEM"], meta_cum["NumGP_Global"], "mm", meta_cum["Ind_GP"]) # same grid-points as the cumulative cube
+      cube_acc_list.append(cube_acc)
+      meta_acc_list.append(meta_acc)
+      StepF_list_all.append(StepF_list)
+
+# De-accumulating the forecasts for a specific run
+print(" ")
+print("De-accumulating the " + SystemFC + " forecasts over " + ", ".join([str(Acc) for Acc in Acc_list]) + "-hourly periods")
+for ind_BaseDateTime in range(len(BaseDateTime_list)):
+
+      BaseDateTime = BaseDateTime_list[ind_BaseDateTime]
+      print(" - Considering the run on " + BaseDateTime.strftime("%Y%m%d") + " at " + BaseDateTime.strftime("%H") + " UTC")
+
+      # Reading all the cumulative forecasts for the considered run (only the available steps)
+      Avail_cum = meta_cum["Available"][ind_BaseDateTime]
+      Step_Avail_list = [Step_list[ind] for ind in np.where(Avail_cum)[0]]
+      tp_cum_run = np.asarray(cube_cum[ind_BaseDateTime][Avail_cum])
+
+      # Computing the forecasts for a specific accumulation period
+      for ind_Acc in range(len(Acc_list)):
+            cube_acc_list[ind_Acc][ind_BaseDateTime] = deaccumulate_FC_run(tp_cum_run, Step_Avail_list, StepF_list_all[ind_Acc], Acc_list[ind_Acc], meta_cum["Units"])
+            for ind_StepF in range(len(StepF_list_all[ind_Acc])):
+                  StepF = StepF_list_all[ind_Acc][ind_StepF]
+                  meta_acc_list[ind_Acc]["Available"][ind_BaseDateTime][ind_StepF] = bool((StepF in Step_Avail_list) and ((StepF - Acc_list[ind_Acc]) in Step_Avail_list))
+
+# Saving the forecast cubes and their metadata
+for ind_Acc in range(len(Acc_list)):
+      cube_acc_list[ind_Acc].flush()
+      save_FC_cube_meta(Git_repo + "/" + DirOUT, meta_acc_list[ind_Acc])
@@ -0,0 +1,41 @@
+import os
+import sys
+import metview as mv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Functions"))
+from Mask_Geometry import create_mask_geometry, read_mask_geometry
+
+##########################################################################################################
+# CODE DESCRIPTION
+# Create_Mask_Geometry.py converts the domain's mask stored as .grib file into the mask's geometry, i.e. the
+# values of the mask, the lat/lon coordinates of the grid-points, and, for each region, the indexes, the
+# boolean mask, the lat/lon coordinates and the bounding box of its grid-points, stored as memory-mapped
+# arrays with a small .json metadata sidecar (see "Scripts/Functions/Mask_Geometry.py").
+# The mask's .grib file is decoded only once. The compute stages then read the precomputed geometry instead
+# of decoding the mask and scanning the global fields to find the grid-points of each region.
+# NOTE: the mask needs to be created first with "Scripts/Raw/Create_Ecuador_Mask_ENS.mv". The code needs to be
+# run again only if the mask changes.
+
+# INPUT PARAMETERS DESCRIPTION
+# Git_repo (string): repository's local path.
+# FileIN_Mask (string): relative path of the file containing the domain's mask.
+# DirOUT (string): relative path of the directory containing the mask's geometry.
+
+# INPUT PARAMETERS
+Git_repo="/ec/vol/ecpoint_dev/mofp/Papers_2_Write/Verif_Flash_Floods_Ecuador"
+FileIN_Mask = "Data/Raw/Ecuador_Mask_ENS/Mask.grib"
+DirOUT = "Data/Raw/Mask_Geometry"
+##########################################################################################################
+
+
+# Reading the domain's mask
+mask = mv.read(Git_repo + "/" + FileIN_Mask)
+
+# Creating the mask's geometry
+create_mask_geometry(Git_repo + "/" + DirOUT, mv.values(mask), mv.latitudes(mask), mv.longitudes(mask))
+
+# Printing a summary of the regions in the mask's geometry
+mask_geo = read_mask_geometry(Git_repo + "/" + DirOUT)
+print("Mask's geometry created with " + str(mask_geo["NumGP"]) + " grid-points in the global fields")
+for RegionCode in mask_geo["RegionCode"]:
+      print(" - Region " + str(RegionCode) + ": " + str(len(mask_geo["Ind_GP"][RegionCode])) + " grid-points, bounding box [N, W, S, E] = " + str(mask_geo["BBox"][RegionCode]))